@@ -151,8 +151,16 @@ class Api(Iface):
         if section == "core":
             self.core.config[category][option] = value
 
-            if option in ("limit_speed", "max_speed"): #not so nice to update the limit
+            if option in ("limit_speed", "max_speed", "plugin_speed", "package_speed"): #not so nice to update the limit
                 self.core.requestFactory.updateBucket()
+            elif option in ("max_connections", "host_connections", "account_connections"):
+                self.core.requestFactory.updateSlots()
+            elif option in ("retry_wait", "retry_max_wait"):
+                self.core.threadManager.updateBreaker()
+            elif option == "queue_policy":
+                self.core.threadManager.updatePolicy()
+            elif option == "process_workers":
+                self.core.requestFactory.processes.setSize(self.core.config["download"]["process_workers"])
 
         elif section == "plugin":
             self.core.config.setPlugin(category, option, value)
@@ -197,6 +205,7 @@ class Api(Iface):
     def unpauseServer(self):
         """Unpause server: New Downloads will be started."""
         self.core.threadManager.pause = False
+        self.core.threadManager.wake("unpause")
 
     @permission(PERMS.STATUS)
     def togglePause(self):
@@ -205,6 +214,8 @@ class Api(Iface):
         :return: new pause state
         """
         self.core.threadManager.pause ^= True
+        if not self.core.threadManager.pause:
+            self.core.threadManager.wake("unpause")
         return self.core.threadManager.pause
 
     @permission(PERMS.STATUS)
@@ -230,6 +241,9 @@ class Api(Iface):
         for pyfile in [x.active for x in self.core.threadManager.threads if x.active and isinstance(x.active, PyFile)]:
             serverStatus.speed += pyfile.getSpeed() #bytes/s
 
+        serverStatus.pools = [WorkerPoolStatus(p["name"], p["size"], p["queued"], p["running"], p["done"],
+                                               p["avgWait"], p["avgRun"]) for p in self.core.threadManager.getPoolStats()]
+
         return serverStatus
 
     @permission(PERMS.STATUS)
@@ -245,10 +259,12 @@ class Api(Iface):
     def kill(self):
         """Clean way to quit pyLoad"""
         self.core.do_kill = True
+        self.core.threadManager.wake("core")
 
     def restart(self):
         """Restart pyload core"""
         self.core.do_restart = True
+        self.core.threadManager.wake("core")
 
     @permission(PERMS.LOGS)
     def getLog(self, offset=0):
@@ -303,7 +319,8 @@ class Api(Iface):
                 pyfile.id, pyfile.name, pyfile.getSpeed(), pyfile.getETA(), pyfile.formatETA(),
                 pyfile.getBytesLeft(), pyfile.getSize(), pyfile.formatSize(), pyfile.getPercent(),
                 pyfile.status, pyfile.getStatusName(), pyfile.formatWait(),
-                pyfile.waitUntil, pyfile.packageid, pyfile.package().name, pyfile.pluginname))
+                pyfile.waitUntil, pyfile.packageid, pyfile.package().name, pyfile.pluginname,
+                pyfile.getShare()))
 
         return data
 
@@ -709,6 +726,7 @@ class Api(Iface):
         :param position: 
         """
         self.core.files.reorderPackage(pid, position)
+        self.core.requestFactory.updateBucket() #bandwidth shares follow the queue order
 
     @permission(PERMS.MODIFY)
     def orderFile(self, fid, position):
@@ -724,13 +742,18 @@ class Api(Iface):
         """Allows to modify several package attributes.
 
         :param pid: package id
-        :param data: dict that maps attribute to desired value
+        :param data: dict that maps attribute to desired value,
+            `priority` and `deadline` (unix time) are used by the deadline queue policy
         """
         p = self.core.files.getPackage(pid)
         if not p: raise PackageDoesNotExists(pid)
 
+        if "priority" in data or "deadline" in data:
+            self.core.files.setPackageSchedule(pid, data.get("priority"), data.get("deadline"))
+            self.core.threadManager.wake("policy")
+
         for key, value in data.iteritems():
-            if key == "id": continue
+            if key in ("id", "priority", "deadline"): continue
             setattr(p, key, value)
 
         p.sync()
@@ -760,10 +783,7 @@ class Api(Iface):
         packs = self.core.files.getInfoData(destination)
         order = {}
 
-        for pid in packs:
-            pack = self.core.files.getPackageData(int(pid))
-            while pack["order"] in order.keys(): #just in case
-                pack["order"] += 1
+        for pack in packs.itervalues():
             order[pack["order"]] = pack["id"]
         return order
 
@@ -892,6 +912,7 @@ class Api(Iface):
     def updateAccount(self, plugin, account, password=None, options={}):
         """Changes pw/options for specific account."""
         self.core.accountManager.updateAccount(plugin, account, password, options)
+        self.core.requestFactory.updateBucket() #account speed limit may have changed
 
     @permission(PERMS.ACCOUNTS)
     def removeAccount(self, plugin, account):
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 3 of the License,
+    or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+    See the GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""
+
+from threading import Lock
+from time import time
+
+class CircuitBreaker():
+    """ stops downloads from hosts with connection errors, the wait doubles with every further error.
+
+    hosts are the ones downloads failed on, links whose own host led to such a host are blocked while it is """
+
+    def __init__(self, wait=60, maxWait=1800):
+        self.wait = wait #seconds to wait after the first error
+        self.maxWait = maxWait
+
+        self.errors = {} #host -> connection errors in a row
+        self.openUntil = {} #host -> time until no download of it may start
+        self.origins = {} #host -> hosts of the links whose downloads failed on it
+        self.probing = {} #host -> (pyfile id, link host) of a test download running after the wait of the host ended
+        self.lock = Lock()
+
+    def setWait(self, wait, maxWait):
+        self.wait, self.maxWait = max(1, wait), max(1, maxWait)
+
+    def failed(self, host, origin):
+        """ a download of a link from origin got a connection error on host, returns seconds until it may be tried again """
+        self.lock.acquire()
+        try:
+            now = time()
+            self.origins.setdefault(host, set()).add(origin)
+            if self.openUntil.get(host, 0) > now:
+                #download that started before the host failed, wait with the others
+                return self.openUntil[host] - now
+
+            self.errors[host] = self.errors.get(host, 0) + 1
+            wait = min(self.maxWait, self.wait * 2 ** (self.errors[host] - 1))
+            self.openUntil[host] = now + wait
+            self.probing.pop(host, None)
+            return wait
+        finally:
+            self.lock.release()
+
+    def succeeded(self, host, id):
+        """ download id finished on host, the host works again and so do the links that led to it """
+        self.lock.acquire()
+        self.forget(host)
+        for other, (probe, origin) in self.probing.items():
+            if probe == id: #the test download went to another host
+                del self.probing[other]
+                self.origins[other].discard(origin)
+                if not self.origins[other]:
+                    self.forget(other)
+        self.lock.release()
+
+    def forget(self, host):
+        self.errors.pop(host, None)
+        self.openUntil.pop(host, None)
+        self.origins.pop(host, None)
+        self.probing.pop(host, None)
+
+    def started(self, id, origin):
+        """ after a wait only one download of a link from origin runs, until it shows if the host works """
+        self.lock.acquire()
+        for host in self.errors:
+            if origin in self.origins.get(host, ()) and host not in self.probing:
+                self.probing[host] = (id, origin)
+        self.lock.release()
+
+    def finished(self, id):
+        """ download id ended without telling anything about the connection """
+        self.lock.acquire()
+        for host, (probe, origin) in self.probing.items():
+            if probe == id:
+                del self.probing[host]
+        self.lock.release()
+
+    def getBlocked(self):
+        """ hosts of links no download should be started for, because a host they led to failed """
+        self.lock.acquire()
+        now = time()
+        hosts = set([host for host, until in self.openUntil.iteritems() if until > now])
+        hosts.update(self.probing)
+        blocked = set()
+        for host in hosts:
+            blocked.update(self.origins.get(host, ()))
+        self.lock.release()
+        return blocked
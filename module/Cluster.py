@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 3 of the License,
+    or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+    See the GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""
+
+from socket import gethostname
+
+from module.database.LeaseStore import LeaseStore
+
+
+class Cluster():
+    """ several cores share one database file, a core only processes links it holds a lease for """
+
+    def __init__(self, core):
+        self.core = core
+        self.log = core.log
+
+        config = core.config["cluster"]
+        self.node = config["node"] or gethostname()
+        self.leaseTime = max(10, config["lease_time"])
+        self.store = LeaseStore(config["store"], self.node, self.leaseTime)
+
+    def start(self):
+        """ links of a crashed run of this node can be processed again """
+        ids = self.store.releaseAll()
+        if ids:
+            self.log.info(_("Cluster: %d links of the last run are queued again") % len(ids))
+            self.core.files.requeueLinks(ids)
+
+        self.log.info(_("Cluster node %(node)s uses %(store)s") % {"node": self.node, "store": self.core.config["cluster"]["store"]})
+        self.core.scheduler.addJob(0, self.renew, threaded=False)
+
+    def claim(self, id):
+        """ True if this node may process the link """
+        return self.store.claim(id)
+
+    def release(self, id):
+        self.store.release(id)
+
+    def renew(self):
+        """ renews the leases of running links and gives the links of failed nodes back to the queue """
+        try:
+            lost = self.store.renew(self.core.threadManager.processingIds())
+            if lost:
+                self.log.warning(_("Cluster: leases of links %s were lost") % ", ".join([str(x) for x in lost]))
+
+            expired = self.store.expire()
+            if expired:
+                self.log.info(_("Cluster: %d links of other nodes are queued again") % len(expired))
+                self.core.files.requeueLinks(expired)
+
+            #other nodes may have added or finished links
+            self.core.files.jobs.invalidate()
+            self.core.threadManager.wake("cluster")
+        finally:
+            self.core.scheduler.addJob(self.leaseTime / 3, self.renew, threaded=False)
+
+    def getLeases(self):
+        return self.store.getLeases()
+
+    def shutdown(self):
+        self.store.releaseAll()
+        self.store.close()
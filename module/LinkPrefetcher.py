@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 3 of the License,
+    or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+    See the GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""
+
+from threading import Lock
+from time import time
+from traceback import print_exc
+
+from module.PyFile import DetachedFile
+
+
+class LinkPrefetcher():
+    """ resolves the download links of the next queued downloads while other downloads run """
+
+    def __init__(self, manager, pool):
+        self.m = manager
+        self.core = manager.core
+        self.log = manager.log
+        self.pool = pool
+
+        self.links = {} #pyfile id -> (url, link, expires)
+        self.pending = set() #ids submitted to the pool
+        self.lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def fill(self, count, occ=(), blocked=()):
+        """ submits the next count queued downloads that are not resolved yet, except the ones of blocked hosts """
+        now = time()
+        self.lock.acquire()
+        try:
+            for id, (url, link, expires) in self.links.items():
+                if expires < now:
+                    del self.links[id]
+
+            ids = [id for id in self.core.files.peekJobs(occ, count, blocked=blocked)
+                   if id not in self.links and id not in self.pending]
+            self.pending.update(ids)
+        finally:
+            self.lock.release()
+
+        for i, id in enumerate(ids):
+            if self.pool.full(): #try the rest next time
+                self.lock.acquire()
+                self.pending.difference_update(ids[i:])
+                self.lock.release()
+                return
+            self.pool.submit(lambda id=id: self.resolve(id))
+
+    def resolve(self, id):
+        try:
+            pyfile = self.core.files.getFile(id)
+            if not pyfile or id in self.m.processingIds(): return
+
+            module = self.core.pluginManager.getPlugin(pyfile.pluginname)
+            klass = getattr(module, self.core.pluginManager.getPluginName(pyfile.pluginname))
+            if not hasattr(klass, "prefetch"): return #plugin can not resolve links ahead
+
+            pyfile = DetachedFile(pyfile) #the download may start meanwhile and uses the cached pyfile
+            plugin = klass(pyfile) #own instance, the one of the download is created when it starts
+            try:
+                link = plugin.prefetch(pyfile)
+            except Exception, e:
+                link = None
+                self.log.debug("Prefetch %s failed: %s" % (pyfile.name, e))
+                if self.core.debug:
+                    print_exc()
+            finally:
+                try:
+                    plugin.req.close()
+                except Exception:
+                    pass
+
+            if link:
+                self.lock.acquire()
+                self.links[id] = (pyfile.url, link, time() + klass.LINK_LIFETIME)
+                self.lock.release()
+                self.log.debug("Prefetched link of %s" % pyfile.name)
+        finally:
+            self.lock.acquire()
+            self.pending.discard(id)
+            self.lock.release()
+
+    def take(self, pyfile):
+        """ prepared link of pyfile or None, it can be used only once """
+        self.lock.acquire()
+        try:
+            url, link, expires = self.links.pop(pyfile.id, (None, None, 0))
+            if link and url == pyfile.url and expires > time():
+                self.hits += 1
+                return link
+
+            self.misses += 1
+            return None
+        finally:
+            self.lock.release()
+
+    def getStats(self):
+        self.lock.acquire()
+        stats = {"cached": len(self.links), "pending": len(self.pending), "hits": self.hits, "misses": self.misses}
+        self.lock.release()
+        return stats
@@ -19,7 +19,7 @@
 """
 
 from Queue import Queue
-from threading import Thread
+from threading import Thread, Event
 from os import listdir, stat
 from os.path import join
 from time import sleep, time, strftime, gmtime
@@ -28,13 +28,14 @@ from pprint import pformat
 from sys import exc_info, exc_clear
 from copy import copy
 from types import MethodType
+from urlparse import urlparse
 
 from pycurl import error
 
 from PyFile import PyFile
 from plugins.Plugin import Abort, Fail, Reconnect, Retry, SkipDownload
 from common.packagetools import parseNames
-from utils import save_join
+from utils import save_join, urlHost
 from Api import OnlineStatus
 
 class PluginThread(Thread):
@@ -46,6 +47,29 @@ class PluginThread(Thread):
         Thread.__init__(self)
         self.setDaemon(True)
         self.m = manager #thread manager
+        self.pooled = None #set when the job runs in a worker pool, instead of an own thread
+
+    def startPooled(self, pool):
+        """ runs the job in a worker of pool """
+        self.pooled = Event()
+        pool.submit(self.runPooled)
+
+    def runPooled(self):
+        try:
+            self.run()
+        finally:
+            self.pooled.set()
+
+    def join(self, timeout=None):
+        if self.pooled:
+            self.pooled.wait(timeout)
+        else:
+            Thread.join(self, timeout)
+
+    def isAlive(self):
+        if self.pooled:
+            return not self.pooled.isSet()
+        return Thread.isAlive(self)
 
 
     def writeDebugReport(self, pyfile):
@@ -145,6 +169,7 @@ class PluginThread(Thread):
         """ set thread unactive and release pyfile """
         self.active = False
         pyfile.release()
+        self.m.core.files.unclaim(pyfile.id)
 
 
 class DownloadThread(PluginThread):
@@ -160,6 +185,11 @@ class DownloadThread(PluginThread):
 
         self.start()
 
+    def downloadHost(self, pyfile):
+        """host the plugin downloaded from, or of the last page it loaded, or of the link"""
+        req = getattr(pyfile.plugin, "req", None) if pyfile.hasPlugin() else None
+        return urlHost(getattr(req, "lastDownload", None) or getattr(req, "lastEffectiveURL", None) or pyfile.url)
+
     #----------------------------------------------------------------------
     def run(self):
         """run method"""
@@ -167,12 +197,15 @@ class DownloadThread(PluginThread):
 
         while True:
             del pyfile
+            if self.queue.empty():
+                self.m.wake("slot") #thread is free for the next job
             self.active = self.queue.get()
             pyfile = self.active
 
             if self.active == "quit":
                 self.active = False
-                self.m.threads.remove(self)
+                if self in self.m.threads:
+                    self.m.threads.remove(self)
                 return True
 
             try:
@@ -187,6 +220,7 @@ class DownloadThread(PluginThread):
                 pyfile.plugin.preprocessing(self)
 
                 self.m.log.info(_("Download finished: %s") % pyfile.name)
+                self.m.breaker.succeeded(self.downloadHost(pyfile), pyfile.id)
                 self.m.core.hookManager.downloadFinished(pyfile)
                 self.m.core.files.checkPackageFinished(pyfile)
 
@@ -251,24 +285,12 @@ class DownloadThread(PluginThread):
                 self.m.log.debug("pycurl exception %s: %s" % (code, msg))
 
                 if code in (7, 18, 28, 52, 56):
-                    self.m.log.warning(_("Couldn't connect to host or connection reset, waiting 1 minute and retry."))
-                    wait = time() + 60
-
-                    pyfile.waitUntil = wait
-                    pyfile.setStatus("waiting")
-                    while time() < wait:
-                        sleep(1)
-                        if pyfile.abort:
-                            break
-
-                    if pyfile.abort:
-                        self.m.log.info(_("Download aborted: %s") % pyfile.name)
-                        pyfile.setStatus("aborted")
-
-                        self.clean(pyfile)
-                    else:
-                        self.queue.put(pyfile)
+                    wait = self.m.breaker.failed(self.downloadHost(pyfile), urlHost(pyfile.url))
+                    self.m.log.warning(_("Couldn't connect to host or connection reset, waiting %(wait)d seconds and retry: %(name)s") % {"wait": wait, "name": pyfile.name})
 
+                    #the job waits in the scheduler, the thread is free for downloads from other hosts
+                    self.m.retryLater(pyfile, wait)
+                    self.clean(pyfile)
                     continue
 
                 else:
@@ -313,6 +335,7 @@ class DownloadThread(PluginThread):
                 continue
 
             finally:
+                self.m.breaker.finished(pyfile.id)
                 self.m.core.files.save()
                 pyfile.checkIfProcessed()
                 exc_clear()
@@ -323,6 +346,7 @@ class DownloadThread(PluginThread):
             self.active = False
             pyfile.finishIfDone()
             self.m.core.files.save()
+            self.m.core.files.unclaim(pyfile.id)
 
 
     def put(self, job):
@@ -347,7 +371,7 @@ class DecrypterThread(PluginThread):
 
         pyfile.setStatus("decrypting")
 
-        self.start()
+        self.startPooled(manager.pools["decrypter"])
 
     def getActiveFiles(self):
         return [self.active]
@@ -405,9 +429,11 @@ class DecrypterThread(PluginThread):
         finally:
             if not retry:
                 self.active.release()
+                self.m.core.files.unclaim(pyfile.id)
                 self.active = False
                 self.m.core.files.save()
                 self.m.localThreads.remove(self)
+                self.m.wake("decrypter") #queued decrypt jobs may fit into the pool now
                 exc_clear()
 
 
@@ -436,7 +462,7 @@ class HookThread(PluginThread):
 
         m.localThreads.append(self)
 
-        self.start()
+        self.startPooled(m.pools["hook"])
 
     def getActiveFiles(self):
         return self.active
@@ -486,7 +512,7 @@ class InfoThread(PluginThread):
 
         self.cache = [] #accumulated data
 
-        self.start()
+        self.startPooled(manager.pools["info"])
 
     def run(self):
         """run method"""
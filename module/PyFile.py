@@ -241,6 +241,13 @@ class PyFile(object):
         except:
             return 0
         
+    def getShare(self):
+        """ percent of the global speed limit assigned to this download """
+        try:
+            return self.plugin.req.share
+        except:
+            return 0
+
     def getETA(self):
         """ gets established time of arrival"""
         try:
@@ -283,3 +290,41 @@ class PyFile(object):
         if not value == self.progress:
             self.progress = value
             self.notifyChange()
+
+
+class DetachedFile(PyFile):
+    """
+    Copy of a pyfile for work done ahead of its download, it is not cached and its changes are neither saved nor shown
+    """
+    __slots__ = ()
+
+    def __init__(self, pyfile):
+        for name in ("m", "id", "url", "name", "_size", "status", "pluginname", "packageid", "error", "order",
+                     "waitUntil", "statusname"):
+            setattr(self, name, getattr(pyfile, name))
+
+        self.lock = RLock()
+        self.plugin = None
+        self.active = False
+        self.abort = False
+        self.reconnected = False
+        self.progress = 0
+        self.maxprogress = 100
+
+    def __repr__(self):
+        return "DetachedFile %s: %s@%s" % (self.id, self.name, self.pluginname)
+
+    def sync(self):
+        pass
+
+    @lock
+    def release(self):
+        if self.plugin:
+            self.plugin.clean()
+            self.plugin = None
+
+    def delete(self):
+        pass
+
+    def notifyChange(self):
+        pass
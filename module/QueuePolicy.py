@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 3 of the License,
+    or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+    See the GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""
+
+from time import time
+
+
+class QueuePolicy():
+    """ decides which runnable link is started next, strict queue order
+
+    key is fixed for a link and orders the links of one package,
+    rank compares the first links of all packages when a job is taken """
+
+    name = "fifo"
+    refresh = 0 #seconds after which all ranks are computed again, 0 if they only change when a link is taken
+
+    def __init__(self, core=None):
+        self.core = core
+
+    def key(self, id, package, porder, lorder, size):
+        return porder, lorder, id
+
+    def rank(self, key, package, running):
+        """ running maps package ids to their running downloads, None means the package must not start one """
+        return key
+
+    def started(self, package):
+        """ a link of package was taken from the queue """
+        pass
+
+
+class RoundRobinPolicy(QueuePolicy):
+    """ packages take turns, the one that started a download longest ago is next """
+
+    name = "roundrobin"
+
+    def __init__(self, core=None):
+        QueuePolicy.__init__(self, core)
+        self.turn = 0
+        self.last = {} #package -> turn of its last started download
+
+    def rank(self, key, package, running):
+        return self.last.get(package, -1), key
+
+    def started(self, package):
+        self.turn += 1
+        self.last[package] = self.turn
+
+
+class SmallestFirstPolicy(QueuePolicy):
+    """ smallest known file first, files of unknown size last in queue order """
+
+    name = "smallest"
+
+    def key(self, id, package, porder, lorder, size):
+        return size <= 0, size, porder, lorder, id
+
+
+class PackageCapPolicy(QueuePolicy):
+    """ queue order, but only package_downloads downloads of one package at the same time """
+
+    name = "capped"
+
+    def rank(self, key, package, running):
+        cap = self.core.config["download"]["package_downloads"] if self.core else 1
+        if 0 < cap <= running.get(package, 0):
+            return None
+        return key
+
+
+class DeadlinePolicy(QueuePolicy):
+    """ earliest deadline first, the time left is divided by priority + 1
+
+    packages without deadline are due after horizon seconds """
+
+    name = "deadline"
+    horizon = 24 * 3600
+    refresh = 60 #the order changes while the deadlines come closer
+
+    def __init__(self, core=None, schedule=None):
+        QueuePolicy.__init__(self, core)
+        self.schedule = schedule #returns (priority, deadline) of a package
+
+    def rank(self, key, package, running):
+        priority, deadline = self.schedule(package) if self.schedule else (0, 0)
+        now = time()
+        left = max(0, (deadline or now + self.horizon) - now)
+        return left / (max(0, priority) + 1.0), key
+
+
+policies = dict([(p.name, p) for p in (QueuePolicy, RoundRobinPolicy, SmallestFirstPolicy, PackageCapPolicy, DeadlinePolicy)])
+
+
+def getPolicy(name, core=None):
+    """ policy instance by name, queue order for unknown names """
+    if name == DeadlinePolicy.name and core:
+        return DeadlinePolicy(core, core.files.getPackageSchedule)
+
+    return policies.get(name, QueuePolicy)(core)
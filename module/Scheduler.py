@@ -55,8 +55,17 @@ class Scheduler():
         t += time()
         j = Job(t, call, args, kwargs, d, threaded)
         self.queue.put((t, j))
+        if hasattr(self.core, "threadManager"): #core may wait longer than until this job
+            self.core.threadManager.wake("scheduler")
         return d
 
+    def timeout(self, maximum):
+        """ seconds until the next job is due, at most maximum """
+        t = self.queue.first()
+        if t is None:
+            return maximum
+        return max(0, min(maximum, t - time()))
+
 
     def removeJob(self, d):
         """
@@ -129,6 +138,14 @@ class PriorityQueue():
         heappush(self.queue, element)
         self.lock.release()
 
+    def first(self):
+        """ key of the smallest element or None """
+        self.lock.acquire()
+        try:
+            return self.queue[0][0] if self.queue else None
+        finally:
+            self.lock.release()
+
     def get(self):
         """ return element or None """
         self.lock.acquire()
@@ -21,7 +21,7 @@
 from os.path import exists, join
 import re
 from subprocess import Popen
-from threading import Event, Lock
+from threading import Event, Lock, Condition
 from time import sleep, time
 from traceback import print_exc
 from random import choice
@@ -29,9 +29,13 @@ from random import choice
 import pycurl
 
 import PluginThread
+from WorkerPool import WorkerPool
+from CircuitBreaker import CircuitBreaker
+from QueuePolicy import getPolicy
+from LinkPrefetcher import LinkPrefetcher
 from module.PyFile import PyFile
 from module.network.RequestFactory import getURL
-from module.utils import freeSpace, lock
+from module.utils import freeSpace, lock, urlHost
 
 
 class ThreadManager:
@@ -66,6 +70,44 @@ class ThreadManager:
         #timeout for cache purge
         self.timestamp = 0
 
+        #events that let the core assign jobs without waiting for the next tick
+        self.wakeup = Condition()
+        self.reasons = set()
+        self.wakeTime = 0 #time of the first event since the last dispatch
+
+        #dispatch latency, time between an event and the jobs assigned for it
+        self.dispatches = 0
+        self.latencySum = 0.0
+        self.latencyMax = 0.0
+        self.reasonCount = {}
+
+        #threads of downloads in a wait countdown, they do not hold a download slot
+        self.parked = set()
+        self.resuming = [] #(thread, event) of parked threads whose wait ended, waiting for a slot
+        self.parkLock = Lock()
+
+        #decrypter, hook and info jobs share a few threads instead of starting one per job
+        depth = self.core.config.get("general", "worker_queue")
+        self.pools = {"decrypter": WorkerPool("decrypter", self.core.config.get("general", "max_decrypters"), depth),
+                      "hook": WorkerPool("hook", self.core.config.get("general", "max_hook_threads"), depth),
+                      "info": WorkerPool("info", self.core.config.get("general", "max_info_threads"), depth),
+                      "prefetch": WorkerPool("prefetch", self.core.config.get("general", "max_prefetch_threads"), depth)}
+
+        #links of the next queued downloads are resolved while others download
+        self.prefetcher = LinkPrefetcher(self, self.pools["prefetch"])
+
+        #hosts with connection errors get no new downloads for a while
+        self.breaker = CircuitBreaker()
+        self.updateBreaker()
+        self.retrying = set() #ids of downloads waiting for their host
+
+        #decides which link of the queue is downloaded next
+        self.policy = None
+        self.updatePolicy()
+
+        #downloads waiting for a connection slot can start when one is closed
+        self.core.requestFactory.slots.listeners.append(lambda: self.wake("connection"))
+
         pycurl.global_init(pycurl.GLOBAL_DEFAULT)
 
         for i in range(0, self.core.config.get("download", "max_downloads")):
@@ -129,7 +171,85 @@ class ThreadManager:
         return [x.id for x in self.getActiveFiles()]
 
 
-    def work(self):
+    def wake(self, reason):
+        """ something happened that may allow new jobs: slot, links, unpause, account, ... """
+        self.wakeup.acquire()
+        if not self.reasons:
+            self.wakeTime = time()
+        self.reasons.add(reason)
+        self.wakeup.notify()
+        self.wakeup.release()
+
+    def waitForEvent(self, timeout):
+        """ blocks until wake was called or timeout passed, returns the reasons """
+        self.wakeup.acquire()
+        try:
+            if not self.reasons:
+                self.wakeup.wait(timeout)
+            reasons, self.reasons = self.reasons, set()
+            return reasons
+        finally:
+            self.wakeup.release()
+
+    def getDispatchStats(self):
+        """ number of event driven dispatches and their latency in seconds """
+        return {"dispatches": self.dispatches,
+                "avgLatency": self.latencySum / self.dispatches if self.dispatches else 0.0,
+                "maxLatency": self.latencyMax,
+                "reasons": self.reasonCount.copy()}
+
+    def getPoolStats(self):
+        """ queue and latency numbers of the worker pools """
+        return [self.pools[name].getStats() for name in sorted(self.pools)]
+
+    def parkThread(self, thread):
+        """ thread starts waiting, its slot can be used by another download meanwhile """
+        if thread not in self.threads: return False #only download threads hold slots
+
+        self.parkLock.acquire()
+        self.parked.add(thread)
+        self.parkLock.release()
+        self.wake("park")
+        return True
+
+    def resumeThread(self, thread, check):
+        """ blocks until the parked thread got a slot again, check is called periodically and may raise """
+        event = Event()
+        self.parkLock.acquire()
+        if thread not in self.parked:
+            self.parkLock.release()
+            return
+        self.resuming.append((thread, event))
+        self.parkLock.release()
+        self.wake("resume")
+
+        while not event.wait(1):
+            check()
+
+    def releaseThread(self, thread):
+        """ thread does not wait anymore, it holds its slot again """
+        self.parkLock.acquire()
+        self.parked.discard(thread)
+        self.resuming = [x for x in self.resuming if x[0] is not thread]
+        self.parkLock.release()
+
+    def runningCount(self):
+        """ number of downloads that hold a slot """
+        return len([x for x in self.threads if x.active and x not in self.parked])
+
+    def resumeParked(self):
+        """ gives free slots to parked threads whose wait ended, they are preferred to new jobs """
+        self.parkLock.acquire()
+        try:
+            while self.resuming and self.runningCount() < self.core.config.get("download", "max_downloads"):
+                thread, event = self.resuming.pop(0)
+                self.parked.discard(thread)
+                event.set()
+            return not self.resuming
+        finally:
+            self.parkLock.release()
+
+    def work(self, reasons=()):
         """run all task which have to be done (this is for repetivive call by core)"""
         try:
             self.tryReconnect()
@@ -141,7 +261,8 @@ class ThreadManager:
         self.checkThreadCount()
 
         try:
-            self.assignJob()
+            #fill all free slots at once, not one per tick
+            while self.resumeParked() and self.assignJob(): pass
         except Exception, e:
             self.log.warning("Assign job error", e)
             if self.core.debug:
@@ -151,6 +272,23 @@ class ThreadManager:
             self.assignJob()
             #it may be failed non critical so we try it again
 
+        count = self.core.config.get("download", "prefetch_links")
+        if count > 0 and not self.pause:
+            try:
+                self.prefetcher.fill(count, blocked=tuple(self.breaker.getBlocked()))
+            except Exception, e:
+                self.log.warning(_("Prefetch error: %s") % e)
+                if self.core.debug:
+                    print_exc()
+
+        if reasons:
+            latency = time() - self.wakeTime
+            self.dispatches += 1
+            self.latencySum += latency
+            self.latencyMax = max(self.latencyMax, latency)
+            for reason in reasons:
+                self.reasonCount[reason] = self.reasonCount.get(reason, 0) + 1
+
         if (self.infoCache or self.infoResults) and self.timestamp < time():
             self.infoCache.clear()
             self.infoResults.clear()
@@ -231,13 +369,22 @@ class ThreadManager:
     def checkThreadCount(self):
         """checks if there are need for increasing or reducing thread count"""
 
-        if len(self.threads) == self.core.config.get("download", "max_downloads"):
+        for name, option in (("decrypter", "max_decrypters"), ("hook", "max_hook_threads"), ("info", "max_info_threads"),
+                             ("prefetch", "max_prefetch_threads")):
+            self.pools[name].setSize(self.core.config.get("general", option))
+
+        #parked threads need a replacement for their slot
+        count = self.core.config.get("download", "max_downloads") + len(self.parked)
+
+        if len(self.threads) == count:
             return True
-        elif len(self.threads) < self.core.config.get("download", "max_downloads"):
+        elif len(self.threads) < count:
             self.createThread()
         else:
             free = [x for x in self.threads if not x.active]
             if free:
+                #not free anymore for jobs that are assigned before it quits
+                self.threads.remove(free[0])
                 free[0].put("quit")
 
 
@@ -253,24 +400,38 @@ class ThreadManager:
 
     #----------------------------------------------------------------------
     def assignJob(self):
-        """assing a job to a thread if possible"""
+        """assing a job to a thread if possible, returns True if a download was started"""
 
-        if self.pause or not self.core.api.isTimeDownload(): return
+        if self.pause or not self.core.api.isTimeDownload(): return False
 
         #if self.downloaded > 20:
         #    if not self.cleanPyCurl(): return
 
         free = [x for x in self.threads if not x.active]
+        if self.runningCount() >= self.core.config.get("download", "max_downloads"):
+            free = [] #threads of parked downloads were replaced, but slots are limited
+
+        slots = self.core.requestFactory.slots
+        if slots.isFull(("total",)):
+            free = [] #no connection left for another download
 
         inuse = set([(x.active.pluginname,self.getLimit(x)) for x in self.threads if x.active and x.active.hasPlugin() and x.active.plugin.account])
         inuse = map(lambda x : (x[0], x[1], len([y for y in self.threads if y.active and y.active.pluginname == x[0]])) ,inuse)
         onlimit = [x[0] for x in inuse if x[1] > 0 and x[2] >= x[1]]
 
         occ = [x.active.pluginname for x in self.threads if x.active and x.active.hasPlugin() and not x.active.plugin.multiDL] + onlimit
+        occ += list(slots.getBlocked()) #hosts or accounts without free connections
+        blocked = self.breaker.getBlocked() #hosts of links whose downloads got connection errors
         
         occ.sort()
         occ = tuple(set(occ))
-        job = self.core.files.getJob(occ)
+
+        running = {} #package -> downloads, for policies that limit downloads per package
+        for x in self.threads:
+            if x.active and isinstance(x.active, PyFile):
+                running[x.active.packageid] = running.get(x.active.packageid, 0) + 1
+
+        job = self.core.files.getJob(occ, running, blocked)
         if job:
             try:
                 job.initPlugin()
@@ -280,7 +441,7 @@ class ThreadManager:
                 job.setStatus("failed")
                 job.error = str(e)
                 job.release()
-                return
+                return False
 
             if job.plugin.__type__ == "hoster":
                 spaceLeft = freeSpace(self.core.config["general"]["download_folder"]) / 1024 / 1024
@@ -292,23 +453,81 @@ class ThreadManager:
                     thread = free[0]
                     #self.downloaded += 1
 
+                    thread.active = job #busy from now on, not when the thread picks the job up
+                    self.breaker.started(job.id, urlHost(job.url))
                     thread.put(job)
+                    return len(free) > 1
                 else:
                     #put job back
-                    if occ not in self.core.files.jobCache:
-                        self.core.files.jobCache[occ] = []
-                    self.core.files.jobCache[occ].append(job.id)
+                    self.core.files.putJob(job)
 
                     #check for decrypt jobs
+                    if self.pools["decrypter"].full(): return False
                     job = self.core.files.getDecryptJob()
                     if job:
                         job.initPlugin()
                         thread = PluginThread.DecrypterThread(self, job)
 
-
+            elif self.pools["decrypter"].full():
+                #decrypter queue is full, try again when a slot is free
+                self.core.files.putJob(job)
             else:
                 thread = PluginThread.DecrypterThread(self, job)
 
+        return False
+
+    def updatePolicy(self):
+        """ order the queue with the policy set in the settings """
+        name = self.core.config["download"]["queue_policy"]
+        if self.policy and self.policy.name == name: return
+
+        self.policy = getPolicy(name, self.core)
+        self.core.files.jobs.setPolicy(self.policy)
+        self.log.debug("Queue policy: %s" % self.policy.name)
+        self.wake("policy")
+
+    def updateBreaker(self):
+        """ set waits after connection errors according to settings """
+        self.breaker.setWait(self.core.config["download"]["retry_wait"], self.core.config["download"]["retry_max_wait"])
+
+    def retryLater(self, pyfile, wait):
+        """ download got a connection error, it waits in the scheduler without holding a thread """
+        pyfile.waitUntil = time() + wait
+        pyfile.setStatus("waiting")
+
+        self.parkLock.acquire()
+        self.retrying.add(pyfile.id)
+        self.parkLock.release()
+        self.core.scheduler.addJob(wait, self.retryJob, [pyfile.id], threaded=False)
+
+    def retryJob(self, id):
+        """ a download waited for its host after connection errors, it can be started again """
+        self.parkLock.acquire()
+        waiting = id in self.retrying
+        self.retrying.discard(id)
+        self.parkLock.release()
+        if not waiting: return
+
+        pyfile = self.core.files.getFile(id)
+        if not pyfile or pyfile.status != 5 or id in self.processingIds():
+            return #restarted or aborted meanwhile
+
+        pyfile.setStatus("queued")
+        pyfile.release()
+        self.wake("breaker")
+
+    def requeueRetries(self):
+        """ waits in the scheduler are lost on shutdown, the downloads must not stay waiting """
+        self.parkLock.acquire()
+        ids, self.retrying = self.retrying, set()
+        self.parkLock.release()
+
+        for id in ids:
+            pyfile = self.core.files.getFile(id)
+            if pyfile and pyfile.status == 5:
+                pyfile.setStatus("queued")
+                pyfile.release()
+
     def getLimit(self, thread):
         limit = thread.active.plugin.account.getAccountData(thread.active.plugin.user)["options"].get("limitDL",["0"])[0]
         return int(limit)
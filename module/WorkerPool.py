@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 3 of the License,
+    or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+    See the GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import deque
+from threading import Thread, Condition, currentThread
+from time import time
+from traceback import print_exc
+from logging import getLogger
+
+class WorkerPool():
+    """ runs jobs on a limited number of named threads, jobs wait in a bounded queue """
+
+    def __init__(self, name, size, depth):
+        self.name = name
+        self.size = max(1, size) #threads running jobs at most
+        self.depth = max(1, depth) #jobs that may wait, submit blocks when more are waiting
+        self.log = getLogger("log")
+
+        self.jobs = deque() #(func, submit time)
+        self.cond = Condition()
+        self.workers = set()
+        self.idle = 0
+        self.count = 0 #for thread names
+
+        self.running = 0
+        self.done = 0
+        self.waitSum = 0.0 #seconds jobs spent in the queue
+        self.runSum = 0.0 #seconds jobs spent running
+
+    def submit(self, func):
+        """ queues func, blocks while the queue is full """
+        self.cond.acquire()
+        try:
+            #a worker waiting for its own pool could wait forever
+            if currentThread() not in self.workers:
+                while len(self.jobs) >= self.depth:
+                    self.cond.wait()
+
+            self.jobs.append((func, time()))
+
+            if self.idle > len(self.jobs) - 1:
+                self.cond.notifyAll()
+            elif len(self.workers) < self.size:
+                self.count += 1
+                t = Thread(target=self.work, name="%s-%d" % (self.name, self.count))
+                t.setDaemon(True)
+                self.workers.add(t)
+                t.start()
+        finally:
+            self.cond.release()
+
+    def full(self):
+        """ True if submit would block """
+        return len(self.jobs) >= self.depth
+
+    def setSize(self, size):
+        size = max(1, size)
+        if size == self.size: return
+
+        self.cond.acquire()
+        self.size = size
+        self.cond.notifyAll() #surplus idle workers quit
+        self.cond.release()
+
+    def work(self):
+        me = currentThread()
+        self.cond.acquire()
+        try:
+            while True:
+                while not self.jobs and len(self.workers) <= self.size:
+                    self.idle += 1
+                    self.cond.wait()
+                    self.idle -= 1
+
+                if len(self.workers) > self.size or not self.jobs:
+                    self.workers.discard(me)
+                    return
+
+                func, queued = self.jobs.popleft()
+                self.running += 1
+                self.cond.notifyAll() #space in the queue again
+                self.cond.release()
+
+                start = time()
+                try:
+                    func()
+                except Exception:
+                    self.log.error(_("Error in %s worker") % self.name)
+                    print_exc()
+
+                self.cond.acquire()
+                self.running -= 1
+                self.done += 1
+                self.waitSum += start - queued
+                self.runSum += time() - start
+        finally:
+            self.cond.release()
+
+    def getStats(self):
+        self.cond.acquire()
+        stats = {"name": self.name,
+                 "size": self.size,
+                 "workers": len(self.workers),
+                 "queued": len(self.jobs),
+                 "running": self.running,
+                 "done": self.done,
+                 "avgWait": self.waitSum / self.done if self.done else 0.0,
+                 "avgRun": self.runSum / self.done if self.done else 0.0}
+        self.cond.release()
+        return stats
@@ -18,11 +18,15 @@
 """
 from threading import Thread
 from threading import Event
+from threading import Lock
+from threading import Timer
+from threading import currentThread
 from os import remove
 from os.path import exists
 from shutil import move
 
-from Queue import Queue
+from Queue import Queue, Empty
+from time import time
 from traceback import print_exc
 
 from module.utils import chmod
@@ -32,7 +36,7 @@ try:
 except:
     import sqlite3
 
-DB_VERSION = 4
+DB_VERSION = 7
 
 class style():
     db = None
@@ -65,6 +69,16 @@ class style():
                 return cls.db.async(f, *args, **kwargs)
         return x
 
+    @classmethod
+    def read(cls, f):
+        """ for methods that only select and may see data as of the last commit,
+        they run on a read connection in the calling thread """
+        @staticmethod
+        def x(*args, **kwargs):
+            if cls.db:
+                return cls.db.read(f, *args, **kwargs)
+        return x
+
 class DatabaseJob():
     def __init__(self, f, *args, **kwargs):
         self.done = Event()
@@ -75,6 +89,9 @@ class DatabaseJob():
         
         self.result = None
         self.exception = False
+        self.waiting = False #the caller waits for the result and may read its changes right after
+
+        self.created = time()
 
 #        import inspect
 #        self.frame = inspect.currentframe()
@@ -102,12 +119,65 @@ class DatabaseJob():
                 pass
 
             self.exception = e
-        finally:
-            self.done.set()
     
     def wait(self):
         self.done.wait()
 
+class ReadContext():
+    """ stands in for the backend in read methods, with the cursor of a read connection """
+    def __init__(self, db, conn):
+        self.db = db
+        self.conn = conn
+        self.c = conn.cursor()
+
+    def __getattr__(self, attr):
+        return getattr(self.db, attr)
+
+class LatencyHistogram():
+    """ counts durations in buckets of powers of two milliseconds """
+    BOUNDS = [2 ** i for i in range(12)] #1ms to 2s, the last bucket takes the rest
+
+    def __init__(self):
+        self.lock = Lock()
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        i = 0
+        while i < len(self.BOUNDS) and ms >= self.BOUNDS[i]:
+            i += 1
+
+        self.lock.acquire()
+        self.buckets[i] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.lock.release()
+
+    def percentile(self, p):
+        """ upper bound of the bucket the p-th percentile falls in, in ms """
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return self.BOUNDS[i] if i < len(self.BOUNDS) else self.max
+        return 0
+
+    def getStats(self):
+        self.lock.acquire()
+        try:
+            if not self.count:
+                return {"count": 0}
+            return {"count": self.count, "avg": round(self.total / self.count, 2), "max": round(self.max, 2),
+                    "p50": self.percentile(50), "p95": self.percentile(95), "p99": self.percentile(99),
+                    "buckets": dict([("<%dms" % b, n) for b, n in zip(self.BOUNDS, self.buckets) if n])}
+        finally:
+            self.lock.release()
+
 class DatabaseBackend(Thread):
     subs = []
     def __init__(self, core):
@@ -118,6 +188,28 @@ class DatabaseBackend(Thread):
         self.jobs = Queue()
         
         self.setuplock = Event()
+
+        #cores of a cluster share one database file, their changes are committed right away
+        self.shared = bool(core and core.config["cluster"]["activated"])
+        self.path = core.config["cluster"]["store"] if self.shared else "files.db"
+
+        #read methods run concurrently on own connections, writes stay in this thread
+        self.readers = max(0, core.config["general"]["db_readers"]) if core else 0
+        self.pool = Queue()
+        self.connections = []
+        self.poolLock = Lock()
+
+        self.writeLatency = LatencyHistogram()
+        self.readLatency = LatencyHistogram()
+
+        #changes of links and packages are kept per row and written in batches
+        self.durability = core.config["general"]["db_durability"] if core else "full"
+        self.interval = max(0, core.config["general"]["db_flush_interval"]) / 1000.0 if core else 0.5
+        self.dirty = {} #(table, id) -> (statement, row)
+        self.dirtyLock = Lock()
+        self.timer = None
+
+        self.converted = None #version the database was converted from on setup
         
         style.setDB(self)
     
@@ -129,13 +221,19 @@ class DatabaseBackend(Thread):
         """main loop, which executes commands"""
         convert = self._checkVersion() #returns None or current version
         
-        self.conn = sqlite3.connect("files.db")
-        chmod("files.db", 0600)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        chmod(self.path, 0600)
+
+        if self.readers:
+            #readers see the last commit without waiting for the writer
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=%s" % self.durability.upper())
 
         self.c = self.conn.cursor() #compatibility
         
         if convert is not None:
             self._convertDB(convert)
+            self.converted = convert
         
         self._createTables()
         self._migrateUser()
@@ -149,12 +247,30 @@ class DatabaseBackend(Thread):
             if j == "quit":
                 self.c.close()
                 self.conn.close()
+                self._closeReaders()
                 break
+
+            self._flush() #buffered changes were made before this job
             j.processJob()
 
+            try:
+                if (self.shared or self.readers) and (j.waiting or self.jobs.empty()):
+                    #other cores wait for the write lock, readers see the last commit
+                    self._commit()
+            finally:
+                j.done.set()
+            self.writeLatency.add(time() - j.created)
+
     @style.queue
     def shutdown(self):
-        self.conn.commit()
+        self.dirtyLock.acquire()
+        timer, self.timer = self.timer, False #no new batches, the rest is written now
+        self.dirtyLock.release()
+        if timer:
+            timer.cancel()
+            timer.join()
+        self._flush()
+        self._commit()
         self.jobs.put("quit")
 
     def _checkVersion(self):
@@ -206,6 +322,35 @@ class DatabaseBackend(Thread):
             self.manager.core.log.info(_("Database was converted from v3 to v4."))
         except:
             print "Database was converted from v3 to v4."
+        self._convertV4()
+
+    def _convertV4(self):
+        self.c.execute('DROP INDEX IF EXISTS "pIdIndex"') #replaced by orderIndex
+        self._createIndexes()
+        try:
+            self.manager.core.log.info(_("Database was converted from v4 to v5."))
+        except:
+            print "Database was converted from v4 to v5."
+        self._convertV5()
+
+    def _convertV5(self):
+        self.c.execute('DROP VIEW IF EXISTS "pstats"')
+        self._createStats()
+        self._rebuildStats()
+        try:
+            self.manager.core.log.info(_("Database was converted from v5 to v6."))
+        except:
+            print "Database was converted from v5 to v6."
+        self._convertV6()
+
+    def _convertV6(self):
+        #order keys get space in between, see ORDER_GAP of FileDatabase
+        self.c.execute('UPDATE packages SET packageorder=packageorder*1024')
+        self.c.execute('UPDATE links SET linkorder=linkorder*1024')
+        try:
+            self.manager.core.log.info(_("Database was converted from v6 to v7."))
+        except:
+            print "Database was converted from v6 to v7."
     
     #--convert scripts end
     
@@ -214,16 +359,11 @@ class DatabaseBackend(Thread):
 
         self.c.execute('CREATE TABLE IF NOT EXISTS "packages" ("id" INTEGER PRIMARY KEY AUTOINCREMENT, "name" TEXT NOT NULL, "folder" TEXT, "password" TEXT DEFAULT "", "site" TEXT DEFAULT "", "queue" INTEGER DEFAULT 0 NOT NULL, "packageorder" INTEGER DEFAULT 0 NOT NULL)')
         self.c.execute('CREATE TABLE IF NOT EXISTS "links" ("id" INTEGER PRIMARY KEY AUTOINCREMENT, "url" TEXT NOT NULL, "name" TEXT, "size" INTEGER DEFAULT 0 NOT NULL, "status" INTEGER DEFAULT 3 NOT NULL, "plugin" TEXT DEFAULT "BasePlugin" NOT NULL, "error" TEXT DEFAULT "", "linkorder" INTEGER DEFAULT 0 NOT NULL, "package" INTEGER DEFAULT 0 NOT NULL, FOREIGN KEY(package) REFERENCES packages(id))')
-        self.c.execute('CREATE INDEX IF NOT EXISTS "pIdIndex" ON links(package)')
         self.c.execute('CREATE TABLE IF NOT EXISTS "storage" ("id" INTEGER PRIMARY KEY AUTOINCREMENT, "identifier" TEXT NOT NULL, "key" TEXT NOT NULL, "value" TEXT DEFAULT "")')
         self.c.execute('CREATE TABLE IF NOT EXISTS "users" ("id" INTEGER PRIMARY KEY AUTOINCREMENT, "name" TEXT NOT NULL, "email" TEXT DEFAULT "" NOT NULL, "password" TEXT NOT NULL, "role" INTEGER DEFAULT 0 NOT NULL, "permission" INTEGER DEFAULT 0 NOT NULL, "template" TEXT DEFAULT "default" NOT NULL)')
+        self._createIndexes()
 
-        self.c.execute('CREATE VIEW IF NOT EXISTS "pstats" AS \
-        SELECT p.id AS id, SUM(l.size) AS sizetotal, COUNT(l.id) AS linkstotal, linksdone, sizedone\
-        FROM packages p JOIN links l ON p.id = l.package LEFT OUTER JOIN\
-        (SELECT p.id AS id, COUNT(*) AS linksdone, SUM(l.size) AS sizedone \
-        FROM packages p JOIN links l ON p.id = l.package AND l.status in (0,4,13) GROUP BY p.id) s ON s.id = p.id \
-        GROUP BY p.id')
+        self._createStats()
 
         #try to lower ids
         self.c.execute('SELECT max(id) FROM LINKS')
@@ -243,8 +383,56 @@ class DatabaseBackend(Thread):
             pid = 0
         self.c.execute('UPDATE SQLITE_SEQUENCE SET seq=? WHERE name=?', (pid, "packages"))
 
-        self.c.execute('VACUUM')
+        if not self.shared: #other cores of the cluster use the file
+            self.c.execute('VACUUM')
+
+
+    def _createIndexes(self):
+        """ indexes of the access paths, tests/test_database.py checks that the queries use them """
+        self.c.execute('CREATE INDEX IF NOT EXISTS "orderIndex" ON links(package, linkorder)')
+        self.c.execute('CREATE INDEX IF NOT EXISTS "urlIndex" ON links(url)')
+        self.c.execute('CREATE INDEX IF NOT EXISTS "nameIndex" ON links(name, status)')
+        self.c.execute('CREATE INDEX IF NOT EXISTS "statusIndex" ON links(status)')
+        self.c.execute('CREATE INDEX IF NOT EXISTS "queueIndex" ON packages(queue, packageorder)')
+        self.c.execute('CREATE INDEX IF NOT EXISTS "storageIndex" ON storage(identifier, key)')
+
+    def _createStats(self):
+        """ per package counters of links and bytes, kept up to date by triggers """
+        self.c.execute('CREATE TABLE IF NOT EXISTS "packagestats" ("id" INTEGER PRIMARY KEY, "linkstotal" INTEGER DEFAULT 0 NOT NULL, "linksdone" INTEGER DEFAULT 0 NOT NULL, "sizetotal" INTEGER DEFAULT 0 NOT NULL, "sizedone" INTEGER DEFAULT 0 NOT NULL)')
+
+        #finished, skipped and processed links are done
+        add = 'UPDATE packagestats SET linkstotal=linkstotal+1, linksdone=linksdone+(new.status IN (0,4,13)), sizetotal=sizetotal+new.size, sizedone=sizedone+(new.status IN (0,4,13))*new.size WHERE id=new.package;'
+        sub = 'UPDATE packagestats SET linkstotal=linkstotal-1, linksdone=linksdone-(old.status IN (0,4,13)), sizetotal=sizetotal-old.size, sizedone=sizedone-(old.status IN (0,4,13))*old.size WHERE id=old.package;'
+
+        self.c.execute('CREATE TRIGGER IF NOT EXISTS "statsPackageInsert" AFTER INSERT ON packages BEGIN INSERT OR REPLACE INTO packagestats (id) VALUES (new.id); END')
+        self.c.execute('CREATE TRIGGER IF NOT EXISTS "statsPackageDelete" AFTER DELETE ON packages BEGIN DELETE FROM packagestats WHERE id=old.id; END')
+        self.c.execute('CREATE TRIGGER IF NOT EXISTS "statsLinkInsert" AFTER INSERT ON links BEGIN %s END' % add)
+        self.c.execute('CREATE TRIGGER IF NOT EXISTS "statsLinkDelete" AFTER DELETE ON links BEGIN %s END' % sub)
+        self.c.execute('CREATE TRIGGER IF NOT EXISTS "statsLinkUpdate" AFTER UPDATE OF size, status, package ON links \
+        WHEN old.size != new.size OR old.status != new.status OR old.package != new.package BEGIN %s %s END' % (sub, add))
+
+    def _statsQuery(self):
+        """ counters of all packages computed from the links """
+        return 'SELECT p.id AS id, COUNT(l.id) AS linkstotal, IFNULL(SUM(l.status IN (0,4,13)), 0) AS linksdone, \
+        IFNULL(SUM(l.size), 0) AS sizetotal, IFNULL(SUM((l.status IN (0,4,13))*l.size), 0) AS sizedone \
+        FROM packages p LEFT OUTER JOIN links l ON p.id = l.package GROUP BY p.id'
+
+    def _rebuildStats(self):
+        self.c.execute('DELETE FROM packagestats')
+        self.c.execute('INSERT INTO packagestats (id, linkstotal, linksdone, sizetotal, sizedone) ' + self._statsQuery())
+
+    @style.read
+    def checkPackageStats(self):
+        """ ids of packages whose counters differ from their links """
+        self.c.execute('SELECT a.id FROM (%s) a LEFT OUTER JOIN packagestats s ON a.id = s.id \
+        WHERE s.id IS NULL OR a.linkstotal != s.linkstotal OR a.linksdone != s.linksdone OR a.sizetotal != s.sizetotal OR a.sizedone != s.sizedone \
+        UNION SELECT id FROM packagestats WHERE id NOT IN (SELECT id FROM packages)' % self._statsQuery())
+        return [r[0] for r in self.c]
 
+    @style.queue
+    def rebuildPackageStats(self):
+        self._rebuildStats()
+        self.conn.commit()
 
     def _migrateUser(self):
         if exists("pyload.db"):
@@ -268,13 +456,55 @@ class DatabaseBackend(Thread):
     def createCursor(self):
         return self.conn.cursor()
     
+    def _commit(self):
+        self.conn.commit()
+
     @style.async
     def commit(self):
-        self.conn.commit()
+        """ commits right away for full durability, otherwise with the next batch """
+        if self.durability == "full":
+            self._commit()
+        else:
+            self._schedule()
 
     @style.queue
     def syncSave(self):
-        self.conn.commit()
+        self._commit()
+
+    def buffer(self, key, statement, row):
+        """ keeps the last update of a row, it is written with the next batch """
+        self.dirtyLock.acquire()
+        self.dirty[key] = (statement, row)
+        self.dirtyLock.release()
+        self._schedule()
+
+    def _schedule(self):
+        self.dirtyLock.acquire()
+        if self.timer is None:
+            self.timer = Timer(self.interval, self._batch)
+            self.timer.setDaemon(True)
+            self.timer.start()
+        self.dirtyLock.release()
+
+    def _batch(self):
+        self.dirtyLock.acquire()
+        if self.timer: self.timer = None
+        self.dirtyLock.release()
+        self.async(DatabaseBackend._commit) #the buffer is flushed before every job
+
+    def _flush(self):
+        """ writes the buffered rows, in the database thread """
+        if not self.dirty: return
+
+        self.dirtyLock.acquire()
+        dirty, self.dirty = self.dirty, {}
+        self.dirtyLock.release()
+
+        statements = {}
+        for statement, row in dirty.itervalues():
+            statements.setdefault(statement, []).append(row)
+        for statement, rows in statements.iteritems():
+            self.c.executemany(statement, rows)
     
     @style.async
     def rollback(self):
@@ -288,9 +518,71 @@ class DatabaseBackend(Thread):
     def queue(self, f, *args, **kwargs):
         args = (self, ) + args
         job = DatabaseJob(f, *args, **kwargs)
+        job.waiting = True
         self.jobs.put(job)
         job.wait()
         return job.result
+
+    def read(self, f, *args, **kwargs):
+        """ runs f on a read connection, in the writer thread when there are none.
+        it sees the last commit, that is not the changes still in the buffer or in queued jobs """
+        if currentThread() is self: #called by a write method
+            return f(self, *args, **kwargs)
+        if not self.readers:
+            return self.queue(f, *args, **kwargs)
+
+        self.setuplock.wait()
+        start = time()
+
+        conn = self._acquireReader()
+        context = ReadContext(self, conn)
+        try:
+            return f(context, *args, **kwargs)
+        except Exception, e:
+            print_exc()
+            try:
+                print "Database Error @", f.__name__, args, kwargs, e
+            except:
+                pass
+        finally:
+            context.c.close() #an unfinished select would keep its snapshot
+            self.pool.put(conn)
+            self.readLatency.add(time() - start)
+
+    def _acquireReader(self):
+        try:
+            return self.pool.get_nowait()
+        except Empty:
+            pass
+
+        self.poolLock.acquire()
+        try:
+            if len(self.connections) < self.readers:
+                conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+                try:
+                    conn.execute("PRAGMA query_only=1")
+                except sqlite3.OperationalError:
+                    pass #older sqlite, read methods do not write anyway
+                self.connections.append(conn)
+                return conn
+        finally:
+            self.poolLock.release()
+
+        return self.pool.get()
+
+    def _closeReaders(self):
+        self.poolLock.acquire()
+        for conn in self.connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self.connections = []
+        self.readers = 0
+        self.poolLock.release()
+
+    def getLatencyStats(self):
+        return {"write": self.writeLatency.getStats(), "read": self.readLatency.getStats()}
     
     @classmethod
     def registerSub(cls, klass):
@@ -26,17 +26,23 @@ from module.PullEvents import InsertEvent, ReloadAllEvent, RemoveEvent, UpdateEv
 from module.PyPackage import PyPackage
 from module.PyFile import PyFile
 from module.database import style, DatabaseBackend
+from module.database.JobQueue import JobQueue, PROCESSING, READY
 
 try:
     from pysqlite2 import dbapi2 as sqlite3
 except:
     import sqlite3
 
+ORDER_GAP = 1024 #space between the order keys of packages and links, a move takes a key in between
+
 
 class FileHandler:
     """Handles all request made to obtain information,
     modify status or other request for links or packages"""
 
+    #@TODO improve this hardcoded list
+    collectorPlugins = ('DLC', 'LinkList', 'SerienjunkiesOrg', 'CCF', 'RSDF') #plugins which are processed in collector
+
     def __init__(self, core):
         """Constructor"""
         self.core = core
@@ -48,7 +54,8 @@ class FileHandler:
         self.packageCache = {}  # same for packages
         #@TODO: purge the cache
 
-        self.jobCache = {}
+        self.jobs = JobQueue(self.loadJobs) #runnable links, updated on every status change
+        self.schedule = None #package id -> (priority, deadline), loaded on first use
 
         self.lock = RLock()  #@TODO should be a Lock w/o R
         #self.lock._Verbose__verbose = True
@@ -64,7 +71,6 @@ class FileHandler:
             args[0].unchanged = False
             args[0].filecount = -1
             args[0].queuecount = -1
-            args[0].jobCache = {}
             return func(*args)
         return new
 
@@ -86,6 +92,11 @@ class FileHandler:
 
         self.db.syncSave()
 
+    def positions(self, items):
+        """replaces the order keys of the dicts by their position"""
+        for i, item in enumerate(sorted(items, key=lambda x: x["order"])):
+            item["order"] = i
+
     @lock
     def getCompleteData(self, queue=1):
         """gets a complete data representation"""
@@ -103,6 +114,10 @@ class FileHandler:
             if value["package"] in packs:
                 packs[value["package"]]["links"][key] = value
 
+        self.positions(packs.values())
+        for pack in packs.itervalues():
+            self.positions(pack["links"].values())
+
         return packs
 
     @lock
@@ -114,6 +129,7 @@ class FileHandler:
             if x.queue != queue or x.id not in packs: continue
             packs[x.id].update(x.toDict()[x.id])
 
+        self.positions(packs.values())
         return packs
 
     @lock
@@ -126,7 +142,9 @@ class FileHandler:
         data = self.core.pluginManager.parseUrls(urls)
 
         self.db.addLinks(data, package)
+        self.addJobs(package=package)
         self.core.threadManager.createInfoThread(data, package)
+        self.core.threadManager.wake("links")
 
         #@TODO change from reloadAll event to package update event
         self.core.pullManager.addEvent(ReloadAllEvent("collector"))
@@ -137,8 +155,7 @@ class FileHandler:
     def addPackage(self, name, folder, queue=0):
         """adds a package, default to link collector"""
         lastID = self.db.addPackage(name, folder, queue)
-        p = self.db.getPackage(lastID)
-        e = InsertEvent("pack", lastID, p.order, "collector" if not queue else "queue")
+        e = InsertEvent("pack", lastID, self.db.getPackagePosition(lastID), "collector" if not queue else "queue")
         self.core.pullManager.addEvent(e)
         return lastID
 
@@ -153,9 +170,6 @@ class FileHandler:
             if id in self.packageCache: del self.packageCache[id]
             return
 
-        oldorder = p.order
-        queue = p.queue
-
         e = RemoveEvent("pack", id, "collector" if not p.queue else "queue")
 
         pyfiles = self.cache.values()
@@ -166,18 +180,15 @@ class FileHandler:
                 pyfile.release()
 
         self.db.deletePackage(p)
+        self.jobs.removePackage(id)
+        if self.getPackageSchedule(id) != (0, 0):
+            self.setPackageSchedule(id, 0, 0)
         self.core.pullManager.addEvent(e)
         self.core.hookManager.dispatchEvent("packageDeleted", id)
 
         if id in self.packageCache:
             del self.packageCache[id]
 
-        packs = self.packageCache.values()
-        for pack in packs:
-            if pack.queue == queue and pack.order > oldorder:
-                pack.order -= 1
-                pack.notifyChange()
-
     #----------------------------------------------------------------------
     @lock
     @change
@@ -190,8 +201,6 @@ class FileHandler:
 
         pid = f.packageid
         e = RemoveEvent("file", id, "collector" if not f.package().queue else "queue")
-        
-        oldorder = f.order
 
         if id in self.core.threadManager.processingIds():
             self.cache[id].abortDownload()
@@ -200,18 +209,13 @@ class FileHandler:
             del self.cache[id]
 
         self.db.deleteLink(f)
+        self.jobs.remove([id])
 
         self.core.pullManager.addEvent(e)
 
         p = self.getPackage(pid)
         if not len(p.getChildren()):
             p.delete()
-                        
-        pyfiles = self.cache.values()
-        for pyfile in pyfiles:
-            if pyfile.packageid == pid and pyfile.order > oldorder:
-                pyfile.order -= 1
-                pyfile.notifyChange()
 
     #----------------------------------------------------------------------
     def releaseLink(self, id):
@@ -229,6 +233,7 @@ class FileHandler:
     def updateLink(self, pyfile):
         """updates link"""
         self.db.updateLink(pyfile)
+        self.jobs.update(pyfile.id, pyfile.pluginname, pyfile.packageid, pyfile.status, pyfile.order, pyfile.size, pyfile.url)
 
         e = UpdateEvent("file", pyfile.id, "collector" if not pyfile.package().queue else "queue")
         self.core.pullManager.addEvent(e)
@@ -237,6 +242,8 @@ class FileHandler:
     def updatePackage(self, pypack):
         """updates a package"""
         self.db.updatePackage(pypack)
+        if self.jobs.moved(pypack.id, pypack.queue, pypack.order): #the queue may have been changed
+            self.reloadJobs(pypack)
 
         e = UpdateEvent("pack", pypack.id, "collector" if not pypack.queue else "queue")
         self.core.pullManager.addEvent(e)
@@ -259,6 +266,7 @@ class FileHandler:
             return None
 
         pack = pack.toDict()[id]
+        pack["order"] = self.db.getPackagePosition(id)
 
         data = self.db.getPackageData(id)
 
@@ -269,6 +277,7 @@ class FileHandler:
             if int(x.toDbDict()[x.id]["package"]) == int(id):
                 tmplist.append((x.id, x.toDbDict()[x.id]))
         data.update(tmplist)
+        self.positions(data.values())
 
         pack["links"] = data
 
@@ -278,9 +287,13 @@ class FileHandler:
     def getFileData(self, id):
         """returns dict with file information"""
         if id in self.cache:
-            return self.cache[id].toDbDict()
+            data = self.cache[id].toDbDict()
+        else:
+            data = self.db.getLinkData(id)
 
-        return self.db.getLinkData(id)
+        if data:
+            data[id]["order"] = self.db.getLinkPosition(id)
+        return data
 
     #----------------------------------------------------------------------
     def getFile(self, id):
@@ -292,63 +305,87 @@ class FileHandler:
 
     #----------------------------------------------------------------------
     @lock
-    def getJob(self, occ):
-        """get suitable job"""
-
-        #@TODO clean mess
-        #@TODO improve selection of valid jobs
-
-        if occ in self.jobCache:
-            if self.jobCache[occ]:
-                id = self.jobCache[occ].pop()
-                if id == "empty":
-                    pyfile = None
-                    self.jobCache[occ].append("empty")
-                else:
-                    pyfile = self.getFile(id)
-            else:
-                jobs = self.db.getJob(occ)
-                jobs.reverse()
-                if not jobs:
-                    self.jobCache[occ].append("empty")
-                    pyfile = None
-                else:
-                    self.jobCache[occ].extend(jobs)
-                    pyfile = self.getFile(self.jobCache[occ].pop())
-
-        else:
-            self.jobCache = {} #better not caching to much
-            jobs = self.db.getJob(occ)
-            jobs.reverse()
-            self.jobCache[occ] = jobs
-
-            if not jobs:
-                self.jobCache[occ].append("empty")
-                pyfile = None
-            else:
-                pyfile = self.getFile(self.jobCache[occ].pop())
-
-            #@TODO: maybe the new job has to be approved...
-
-
-        #pyfile = self.getFile(self.jobCache[occ].pop())
-        return pyfile
+    def getJob(self, occ, running={}, blocked=()):
+        """get suitable job, occ are the plugins that can not start another download,
+        running maps package ids to their number of downloads, links of blocked hosts are skipped"""
+        while True:
+            id = self.jobs.pop(lambda plugin, queue: (queue == 1 and plugin not in occ) or plugin in self.collectorPlugins,
+                               self.core.threadManager.processingIds(), running, blocked)
+            if id is None or self.claim(id):
+                return self.getFile(id) if id is not None else None
+
+    def peekJobs(self, occ, count, running={}, blocked=()):
+        """ids of the next count downloads getJob would return, they stay in the queue"""
+        return self.jobs.peek(lambda plugin, queue: queue == 1 and plugin not in occ, count, running, blocked)
 
     @lock
     def getDecryptJob(self):
         """return job for decrypting"""
-        if "decrypt" in self.jobCache:
-            return None
+        plugins = set(self.core.pluginManager.crypterPlugins.keys() + self.core.pluginManager.containerPlugins.keys())
+        while True:
+            id = self.jobs.pop(lambda plugin, queue: plugin in plugins, self.core.threadManager.processingIds())
+            if id is None or self.claim(id):
+                return self.getFile(id) if id is not None else None
+
+    def claim(self, id):
+        """False if another core of the cluster processes the link or already processed it"""
+        if not self.core.cluster: return True
+        if not self.core.cluster.claim(id): return False
+
+        #the job queue may be older than the last changes of other cores
+        if self.db.getLinkStatus(id) not in READY:
+            self.core.cluster.release(id)
+            return False
+        return True
+
+    def unclaim(self, id):
+        """processing of the link ended, another core may take it"""
+        if self.core.cluster:
+            self.db.syncSave() #other cores have to see the new status first
+            self.core.cluster.release(id)
+
+    def putJob(self, pyfile):
+        """puts a job back that could not be started"""
+        self.unclaim(pyfile.id)
+        self.jobs.update(pyfile.id, pyfile.pluginname, pyfile.packageid, pyfile.status, pyfile.order, pyfile.size, pyfile.url)
+
+    def getPackageSchedule(self, pid):
+        """returns (priority, deadline) of a package for the deadline queue policy"""
+        if self.schedule is None:
+            self.schedule = {}
+            for key, value in self.db.getStorage("QueueSchedule").iteritems():
+                priority, deadline = value.split(";")
+                self.schedule[int(key)] = (int(priority), int(deadline))
+
+        return self.schedule.get(pid, (0, 0))
+
+    def setPackageSchedule(self, pid, priority=None, deadline=None):
+        """sets priority and deadline (unix time, 0 for none) of a package"""
+        old = self.getPackageSchedule(pid)
+        value = (int(old[0] if priority is None else priority), int(old[1] if deadline is None else deadline))
+
+        if value == (0, 0):
+            self.schedule.pop(pid, None)
+            self.db.delStorage("QueueSchedule", str(pid))
+        else:
+            self.schedule[pid] = value
+            self.db.setStorage("QueueSchedule", str(pid), "%d;%d" % value)
 
+        self.jobs.rerank() #the package may have to start earlier
+
+    def loadJobs(self, package=None, ids=None):
+        """all links in the queue and collector links of decrypting plugins, that can be processed,
+        only the ones of package or with the given ids if set"""
         plugins = self.core.pluginManager.crypterPlugins.keys() + self.core.pluginManager.containerPlugins.keys()
-        plugins = str(tuple(plugins))
+        return self.db.getJobs(set(plugins).union(self.collectorPlugins), package, ids)
 
-        jobs = self.db.getPluginJob(plugins)
-        if jobs:
-            return self.getFile(jobs[0])
-        else:
-            self.jobCache["decrypt"] = "empty"
-            return None
+    def addJobs(self, package=None, ids=None):
+        """puts the runnable links of package or with the given ids into the job queue"""
+        self.jobs.add(self.loadJobs(package, ids), self.core.threadManager.processingIds())
+
+    def reloadJobs(self, pack):
+        """loads the links of a package into the job queue again, after its queue or position changed"""
+        self.jobs.setPackage(pack.id, pack.queue, pack.order, self.loadJobs(pack.id), self.core.threadManager.processingIds())
 
     def getFileCount(self):
         """returns number of files"""
@@ -401,12 +438,14 @@ class FileHandler:
                 self.restartFile(pyfile.id)
 
         self.db.restartPackage(id)
+        self.addJobs(package=id)
 
         if id in self.packageCache:
             self.packageCache[id].setFinished = False
 
         e = UpdateEvent("pack", id, "collector" if not self.getPackage(id).queue else "queue")
         self.core.pullManager.addEvent(e)
+        self.core.threadManager.wake("restart")
 
     @lock
     @change
@@ -420,9 +459,11 @@ class FileHandler:
 
 
         self.db.restartFile(id)
+        self.addJobs(ids=[id])
 
         e = UpdateEvent("file", id, "collector" if not self.getFile(id).package().queue else "queue")
         self.core.pullManager.addEvent(e)
+        self.core.threadManager.wake("restart")
 
     @lock
     @change
@@ -430,32 +471,29 @@ class FileHandler:
         """push package to queue"""
 
         p = self.db.getPackage(id)
-        oldorder = p.order
 
         e = RemoveEvent("pack", id, "collector" if not p.queue else "queue")
         self.core.pullManager.addEvent(e)
-        
-        self.db.clearPackageOrder(p)
-
-        p = self.db.getPackage(id)
 
         p.queue = queue
         self.db.updatePackage(p)
-
-        self.db.reorderPackage(p, -1, True)
-        
-        packs = self.packageCache.values()
-        for pack in packs:
-            if pack.queue != queue and pack.order > oldorder:
-                pack.order -= 1
-                pack.notifyChange()
+        changed = self.db.reorderPackage(p, -1) #last in the new queue
+        for pid, order in changed.iteritems():
+            if pid in self.packageCache:
+                self.packageCache[pid].order = order
 
         self.db.commit()
         self.releasePackage(id)
         p = self.getPackage(id)
-        
-        e = InsertEvent("pack", id, p.order, "collector" if not p.queue else "queue")
+
+        if len(changed) > 1: #keys of the other packages were spread again
+            self.jobs.invalidate()
+        else:
+            self.reloadJobs(p)
+
+        e = InsertEvent("pack", id, self.db.getPackagePosition(id), "collector" if not p.queue else "queue")
         self.core.pullManager.addEvent(e)
+        self.core.threadManager.wake("queue")
 
     @lock
     @change
@@ -464,24 +502,21 @@ class FileHandler:
 
         e = RemoveEvent("pack", id, "collector" if not p.queue else "queue")
         self.core.pullManager.addEvent(e)
-        self.db.reorderPackage(p, position)
-
-        packs = self.packageCache.values()
-        for pack in packs:
-            if pack.queue != p.queue or pack.order < 0 or pack == p: continue
-            if p.order > position:
-                if pack.order >= position and pack.order < p.order:
-                    pack.order += 1
-                    pack.notifyChange()
-            elif p.order < position:
-                if pack.order <= position and pack.order > p.order:
-                    pack.order -= 1
-                    pack.notifyChange()
-
-        p.order = position
+
+        #usually only p gets a new key, all packages of the queue when the keys were spread again
+        changed = self.db.reorderPackage(p, position)
+        for pid, order in changed.iteritems():
+            if pid in self.packageCache:
+                self.packageCache[pid].order = order
+        p.order = changed[id]
         self.db.commit()
 
-        e = InsertEvent("pack", id, position, "collector" if not p.queue else "queue")
+        if len(changed) > 1:
+            self.jobs.invalidate()
+        else:
+            self.reloadJobs(p)
+
+        e = InsertEvent("pack", id, self.db.getPackagePosition(id), "collector" if not p.queue else "queue")
         self.core.pullManager.addEvent(e)
 
     @lock
@@ -493,32 +528,23 @@ class FileHandler:
         e = RemoveEvent("file", id, "collector" if not self.getPackage(f["package"]).queue else "queue")
         self.core.pullManager.addEvent(e)
 
-        self.db.reorderLink(f, position)
-
-        pyfiles = self.cache.values()
-        for pyfile in pyfiles:
-            if pyfile.packageid != f["package"] or pyfile.order < 0: continue
-            if f["order"] > position:
-                if pyfile.order >= position and pyfile.order < f["order"]:
-                    pyfile.order += 1
-                    pyfile.notifyChange()
-            elif f["order"] < position:
-                if pyfile.order <= position and pyfile.order > f["order"]:
-                    pyfile.order -= 1
-                    pyfile.notifyChange()
-
-        if id in self.cache:
-            self.cache[id].order = position
+        changed = self.db.reorderLink(f, position)
+        for fid, order in changed.iteritems():
+            if fid in self.cache:
+                self.cache[fid].order = order
 
         self.db.commit()
+        self.addJobs(ids=changed.keys()) #new keys of the moved link, or of all links of the package
 
-        e = InsertEvent("file", id, position, "collector" if not self.getPackage(f["package"]).queue else "queue")
+        e = InsertEvent("file", id, self.db.getLinkPosition(id), "collector" if not self.getPackage(f["package"]).queue else "queue")
         self.core.pullManager.addEvent(e)
 
     @change
     def updateFileInfo(self, data, pid):
         """ updates file info (name, size, status, url)"""
         ids = self.db.updateLinkInfo(data)
+        self.jobs.remove(ids) #some may be offline now
+        self.addJobs(ids=ids)
         e = UpdateEvent("pack", pid, "collector" if not self.getPackage(pid).queue else "queue")
         self.core.pullManager.addEvent(e)
 
@@ -572,9 +598,20 @@ class FileHandler:
     def restartFailed(self):
         """ restart all failed links """
         self.db.restartFailed()
+        self.jobs.invalidate()
+        self.core.threadManager.wake("restart")
+
+    @lock
+    def requeueLinks(self, ids):
+        """ links whose processing node is gone are queued again """
+        for id in ids:
+            if id in self.cache and self.cache[id].status in PROCESSING:
+                self.cache[id].status = 3
+        self.db.requeueLinks(ids)
+        self.addJobs(ids=ids)
 
 class FileMethods():
-    @style.queue
+    @style.read
     def filecount(self, queue):
         """returns number of files in queue"""
         self.c.execute("SELECT COUNT(*) FROM links as l INNER JOIN packages as p ON l.package=p.id WHERE p.queue=?", (queue, ))
@@ -597,7 +634,7 @@ class FileMethods():
         self.c.execute('SELECT MAX(packageorder) FROM packages WHERE queue=?', (queue,))
         max = self.c.fetchone()[0]
         if max is not None:
-            return max + 1
+            return max + ORDER_GAP
         else:
             return 0
     
@@ -606,9 +643,46 @@ class FileMethods():
         self.c.execute('SELECT MAX(linkorder) FROM links WHERE package=?', (package,))
         max = self.c.fetchone()[0]
         if max is not None:
-            return max + 1
+            return max + ORDER_GAP
         else:
             return 0
+
+    @style.inner
+    def _placeOrder(self, table, column, scope, scopeid, id, position):
+        """ gives row id the key between the rows at position-1 and position of the other rows in scope,
+        returns {id: key} of the changed rows, that is all of them when the keys had to be spread again """
+        others = 'FROM %s WHERE %s=? AND id!=?' % (table, scope)
+
+        lo, hi = -1, None
+        if position != 0:
+            self.c.execute('SELECT %s %s ORDER BY %s LIMIT 2 OFFSET ?' % (column, others, column), (scopeid, id, max(0, position - 1)))
+            keys = [r[0] for r in self.c]
+            if position > 0 and keys:
+                lo = keys[0]
+                hi = keys[1] if len(keys) > 1 else None
+            else: #at the end
+                self.c.execute('SELECT MAX(%s) %s' % (column, others), (scopeid, id))
+                last = self.c.fetchone()[0]
+                lo = last if last is not None else -1
+        else:
+            self.c.execute('SELECT MIN(%s) %s' % (column, others), (scopeid, id))
+            hi = self.c.fetchone()[0]
+            if hi is not None: #keys may get negative, so the front never needs a spread
+                lo = hi - 2 * ORDER_GAP
+
+        changed = {}
+        if hi is not None and hi - lo < 2:
+            #no free key left in between, spread the others again
+            self.c.execute('SELECT id %s ORDER BY %s' % (others, column), (scopeid, id))
+            changed = dict([(r[0], (i + 1) * ORDER_GAP) for i, r in enumerate(self.c.fetchall())])
+            self.c.executemany('UPDATE %s SET %s=? WHERE id=?' % (table, column), [(v, k) for k, v in changed.iteritems()])
+            changed.update(self._placeOrder(table, column, scope, scopeid, id, position))
+            return changed
+
+        key = lo + ORDER_GAP if hi is None else (lo + hi) / 2
+        self.c.execute('UPDATE %s SET %s=? WHERE id=?' % (table, column), (key, id))
+        changed[id] = key
+        return changed
     
     @style.queue
     def addLink(self, url, name, plugin, package):
@@ -620,7 +694,7 @@ class FileMethods():
     def addLinks(self, links, package):
         """ links is a list of tupels (url,plugin)"""
         order = self._nextFileOrder(package)
-        orders = [order + x for x in range(len(links))]
+        orders = [order + x * ORDER_GAP for x in range(len(links))]
         links = [(x[0], x[0], x[1], package, o) for x, o in zip(links, orders)]
         self.c.executemany('INSERT INTO links(url, name, plugin, package, linkorder) VALUES(?,?,?,?,?)', links)
 
@@ -635,16 +709,14 @@ class FileMethods():
 
         self.c.execute('DELETE FROM links WHERE package=?', (str(p.id),))
         self.c.execute('DELETE FROM packages WHERE id=?', (str(p.id),))
-        self.c.execute('UPDATE packages SET packageorder=packageorder-1 WHERE packageorder > ? AND queue=?', (p.order, p.queue))
 
     @style.queue
     def deleteLink(self, f):
 
         self.c.execute('DELETE FROM links WHERE id=?', (str(f.id),))
-        self.c.execute('UPDATE links SET linkorder=linkorder-1 WHERE linkorder > ? AND package=?', (f.order, str(f.packageid)))
 
 
-    @style.queue
+    @style.read
     def getAllLinks(self, q):
         """return information about all links in queue q
 
@@ -677,7 +749,7 @@ class FileMethods():
 
         return data
 
-    @style.queue
+    @style.read
     def getAllPackages(self, q):
         """return information about packages in queue q
         (only useful in get all data)
@@ -692,8 +764,8 @@ class FileMethods():
         }
         """
         self.c.execute('SELECT p.id, p.name, p.folder, p.site, p.password, p.queue, p.packageorder, s.sizetotal, s.sizedone, s.linksdone, s.linkstotal \
-            FROM packages p JOIN pstats s ON p.id = s.id \
-            WHERE p.queue=? ORDER BY p.packageorder', str(q))
+            FROM packages p JOIN packagestats s ON p.id = s.id \
+            WHERE p.queue=? AND s.linkstotal > 0 ORDER BY p.packageorder', (q, ))
 
         data = {}
         for r in self.c:
@@ -714,7 +786,7 @@ class FileMethods():
 
         return data
     
-    @style.queue
+    @style.read
     def getLinkData(self, id):
         """get link information as dict"""
         self.c.execute('SELECT id,url,name,size,status,error,plugin,package,linkorder FROM links WHERE id=?', (str(id), ))
@@ -738,7 +810,7 @@ class FileMethods():
 
         return data
 
-    @style.queue
+    @style.read
     def getPackageData(self, id):
         """get data about links for a package"""
         self.c.execute('SELECT id,url,name,size,status,error,plugin,package,linkorder FROM links WHERE package=? ORDER BY linkorder', (str(id), ))
@@ -762,51 +834,51 @@ class FileMethods():
         return data
 
 
-    @style.async
+    @style.inner
     def updateLink(self, f):
-        self.c.execute('UPDATE links SET url=?,name=?,size=?,status=?,error=?,package=? WHERE id=?', (f.url, f.name, f.size, f.status, f.error, str(f.packageid), str(f.id)))
+        self.buffer(("link", f.id), 'UPDATE links SET url=?,name=?,size=?,status=?,error=?,package=? WHERE id=?', (f.url, f.name, f.size, f.status, f.error, str(f.packageid), str(f.id)))
 
-    @style.queue
+    @style.inner
     def updatePackage(self, p):
-        self.c.execute('UPDATE packages SET name=?,folder=?,site=?,password=?,queue=? WHERE id=?', (p.name, p.folder, p.site, p.password, p.queue, str(p.id)))
+        self.buffer(("package", p.id), 'UPDATE packages SET name=?,folder=?,site=?,password=?,queue=? WHERE id=?', (p.name, p.folder, p.site, p.password, p.queue, str(p.id)))
         
     @style.queue    
     def updateLinkInfo(self, data):
         """ data is list of tupels (name, size, status, url) """
         self.c.executemany('UPDATE links SET name=?, size=?, status=? WHERE url=? AND status IN (1,2,3,14)', data)
         ids = []
-        self.c.execute('SELECT id FROM links WHERE url IN (\'%s\')' % "','".join([x[3] for x in data]))
-        for r in self.c:
-            ids.append(int(r[0]))
+        for x in data:
+            self.c.execute('SELECT id FROM links WHERE url=?', (x[3], ))
+            ids.extend([int(r[0]) for r in self.c])
         return ids
         
     @style.queue
-    def reorderPackage(self, p, position, noMove=False):
-        if position == -1:
-            position = self._nextPackageOrder(p.queue)
-        if not noMove:
-            if p.order > position:
-                self.c.execute('UPDATE packages SET packageorder=packageorder+1 WHERE packageorder >= ? AND packageorder < ? AND queue=? AND packageorder >= 0', (position, p.order, p.queue))
-            elif p.order < position:
-                self.c.execute('UPDATE packages SET packageorder=packageorder-1 WHERE packageorder <= ? AND packageorder > ? AND queue=? AND packageorder >= 0', (position, p.order, p.queue))
-
-        self.c.execute('UPDATE packages SET packageorder=? WHERE id=?', (position, str(p.id)))
+    def reorderPackage(self, p, position):
+        """ moves the package to position in its queue, -1 for the end, returns {id: packageorder} of changed packages """
+        return self._placeOrder("packages", "packageorder", "queue", p.queue, p.id, position)
     
     @style.queue
     def reorderLink(self, f, position):
-        """ reorder link with f as dict for pyfile  """
-        if f["order"] > position:
-            self.c.execute('UPDATE links SET linkorder=linkorder+1 WHERE linkorder >= ? AND linkorder < ? AND package=?', (position, f["order"], f["package"]))
-        elif f["order"] < position:
-            self.c.execute('UPDATE links SET linkorder=linkorder-1 WHERE linkorder <= ? AND linkorder > ? AND package=?', (position, f["order"], f["package"]))
+        """ reorder link with f as dict for pyfile, returns {id: linkorder} of changed links """
+        return self._placeOrder("links", "linkorder", "package", f["package"], f["id"], position)
 
-        self.c.execute('UPDATE links SET linkorder=? WHERE id=?', (position, f["id"]))
-        
-        
     @style.queue
-    def clearPackageOrder(self, p):
-        self.c.execute('UPDATE packages SET packageorder=? WHERE id=?', (-1, str(p.id)))
-        self.c.execute('UPDATE packages SET packageorder=packageorder-1 WHERE packageorder > ? AND queue=? AND id != ?', (p.order, p.queue, str(p.id)))
+    def getLinkStatus(self, id):
+        self.c.execute('SELECT status FROM links WHERE id=?', (id, ))
+        r = self.c.fetchone()
+        return r[0] if r else None
+
+    @style.read
+    def getPackagePosition(self, id):
+        """ position of the package in its queue """
+        self.c.execute('SELECT COUNT(*) FROM packages p, packages o WHERE o.id=? AND p.queue=o.queue AND p.packageorder < o.packageorder', (id, ))
+        return self.c.fetchone()[0]
+
+    @style.read
+    def getLinkPosition(self, id):
+        """ position of the link in its package """
+        self.c.execute('SELECT COUNT(*) FROM links l, links o WHERE o.id=? AND l.package=o.package AND l.linkorder < o.linkorder', (id, ))
+        return self.c.fetchone()[0]
     
     @style.async
     def restartFile(self, id):
@@ -835,33 +907,26 @@ class FileMethods():
 
 
     @style.queue
-    def getJob(self, occ):
-        """return pyfile ids, which are suitable for download and dont use a occupied plugin"""
-
-        #@TODO improve this hardcoded method
-        pre = "('DLC', 'LinkList', 'SerienjunkiesOrg', 'CCF', 'RSDF')"  #plugins which are processed in collector
-
-        cmd = "("
-        for i, item in enumerate(occ):
-            if i: cmd += ", "
-            cmd += "'%s'" % item
-        
-        cmd += ")"
-
-        cmd = "SELECT l.id FROM links as l INNER JOIN packages as p ON l.package=p.id WHERE ((p.queue=1 AND l.plugin NOT IN %s) OR l.plugin IN %s) AND l.status IN (2,3,14) ORDER BY p.packageorder ASC, l.linkorder ASC LIMIT 5" % (cmd, pre)
-            
-        self.c.execute(cmd) # very bad!
-
-        return [x[0] for x in self.c]
-
-    @style.queue
-    def getPluginJob(self, plugins):
-        """returns pyfile ids with suited plugins"""
-        cmd = "SELECT l.id FROM links as l INNER JOIN packages as p ON l.package=p.id WHERE l.plugin IN %s AND l.status IN (2,3,14) ORDER BY p.packageorder ASC, l.linkorder ASC LIMIT 5" % plugins
-
-        self.c.execute(cmd) # very bad!
-
-        return [x[0] for x in self.c]
+    def getJobs(self, plugins, package=None, ids=None):
+        """returns (id, plugin, package, queue, packageorder, linkorder, size, url) of links that can be processed,
+        these are all in the queue and the ones of the given plugins in the collector,
+        only the ones of package or with the given ids if set"""
+        plugins = list(plugins)
+        query = "SELECT l.id, l.plugin, p.id, p.queue, p.packageorder, l.linkorder, l.size, l.url FROM links as l INNER JOIN packages as p ON l.package=p.id WHERE l.status IN (2,3,14) AND (p.queue=1 OR l.plugin IN (%s))" % ",".join("?" * len(plugins))
+
+        if ids is not None:
+            ids = list(ids)
+            jobs = []
+            for i in range(0, len(ids), 500): #sqlite allows 999 variables
+                part = ids[i:i + 500]
+                self.c.execute(query + " AND l.id IN (%s)" % ",".join("?" * len(part)), plugins + part)
+                jobs.extend(self.c.fetchall())
+            return jobs
+        elif package is not None:
+            self.c.execute(query + " AND l.package=?", plugins + [package])
+        else:
+            self.c.execute(query, plugins)
+        return self.c.fetchall()
 
     @style.queue
     def getUnfinished(self, pid):
@@ -879,6 +944,10 @@ class FileMethods():
     def restartFailed(self):
         self.c.execute("UPDATE links SET status=3,error='' WHERE status IN (6, 8, 9)")
 
+    @style.queue
+    def requeueLinks(self, ids):
+        self.c.executemany("UPDATE links SET status=3 WHERE id=? AND status IN (%s)" % ", ".join([str(x) for x in PROCESSING]), [(id, ) for id in ids])
+
     @style.queue
     def findDuplicates(self, id, folder, filename):
         """ checks if filename exists with different id and same package """
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+"""
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 3 of the License,
+    or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+    See the GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""
+
+from heapq import heapify, heappop, heappush
+from threading import RLock
+from time import time
+
+from module.QueuePolicy import QueuePolicy
+from module.utils import urlHost
+
+#links with these status can be processed: online, queued, unknown
+READY = (2, 3, 14)
+#links with these status are being processed by a core: waiting, starting, decrypting, downloading, processing
+PROCESSING = (5, 7, 10, 12, 13)
+
+
+class JobQueue():
+    """ runnable links in memory, one heap per plugin, queue, package and host of the links, ordered by the policy.
+
+    every (plugin, queue) has a heap with the heads of its packages and hosts, ranked lazily:
+    a head is ranked again when it reaches the top, so ranks that only get worse need no update """
+
+    def __init__(self, load):
+        self.load = load #returns all runnable links as (id, plugin, package, queue, packageorder, linkorder, size, url)
+        self.lock = RLock()
+        self.policy = QueuePolicy()
+
+        self.heaps = {} #(plugin, queue, package, host) -> heap of (policy key, id)
+        self.entries = {} #id -> (bucket, item), heap items with other keys are outdated
+        self.packages = {} #package id -> (queue, packageorder) of packages with runnable links or a known location
+        self.heads = {} #(plugin, queue) -> heap of (rank, serial, (package, host))
+        self.ranked = {} #bucket -> serial of its valid entry in heads
+        self.serial = 0
+        self.refreshed = 0
+        self.valid = False
+
+    def invalidate(self):
+        """ the queue will be loaded again, needed after bulk changes, e.g. when the orders of a queue were spread """
+        self.lock.acquire()
+        self.valid = False
+        self.lock.release()
+
+    def setPolicy(self, policy):
+        """ links are ordered by policy from now on """
+        self.lock.acquire()
+        self.policy = policy
+        self.valid = False #keys of the old policy are useless
+        self.lock.release()
+
+    def rebuild(self, exclude=()):
+        self.heaps, self.entries, self.packages = {}, {}, {}
+        self.heads, self.ranked = {}, {}
+        for id, plugin, package, queue, porder, lorder, size, url in self.load():
+            self.packages[package] = (queue, porder)
+            if id not in exclude:
+                self._add(id, (plugin, queue, package, urlHost(url)), (self.policy.key(id, package, porder, lorder, size), id))
+        self.refreshed = time()
+        self.valid = True
+
+    def _add(self, id, bucket, item):
+        if self.entries.get(id) == (bucket, item): return
+        self.entries[id] = (bucket, item)
+        if bucket not in self.heaps:
+            self.heaps[bucket] = []
+        heappush(self.heaps[bucket], item)
+        if self._top(bucket) == item: #new head of the package
+            self._rank(bucket, self.policy.rank(item[0], bucket[2], {}))
+
+    def _rank(self, bucket, rank):
+        """ puts the package head of bucket with rank into the heap of its plugin, older entries get outdated """
+        self.serial += 1
+        self.ranked[bucket] = self.serial
+        heappush(self.heads.setdefault(bucket[:2], []), (rank, self.serial, bucket[2:]))
+
+    def rerank(self):
+        """ ranks all package heads again, needed when ranks got better without a link being taken """
+        self.lock.acquire()
+        try:
+            if not self.valid: return
+            for group, heads in self.heads.iteritems():
+                for i, (rank, serial, tail) in enumerate(heads):
+                    bucket = group + tail
+                    if self.ranked.get(bucket) == serial and self.heaps.get(bucket):
+                        heads[i] = (self.policy.rank(self.heaps[bucket][0][0], tail[0], {}), serial, tail)
+                heapify(heads)
+            self.refreshed = time()
+        finally:
+            self.lock.release()
+
+    def update(self, id, plugin, package, status, order, size, url):
+        """ status or order of a link changed """
+        self.lock.acquire()
+        try:
+            if not self.valid: return
+
+            if status not in READY:
+                self.entries.pop(id, None) #heap item gets dropped when it reaches the top
+            elif package in self.packages:
+                queue, porder = self.packages[package]
+                self._add(id, (plugin, queue, package, urlHost(url)), (self.policy.key(id, package, porder, order, size), id))
+            else:
+                self.valid = False #unknown package, load everything again
+        finally:
+            self.lock.release()
+
+    def add(self, rows, exclude=()):
+        """ links that may have become runnable, rows as returned by load, ids in exclude are being processed """
+        self.lock.acquire()
+        try:
+            if not self.valid: return
+            for id, plugin, package, queue, porder, lorder, size, url in rows:
+                self.packages[package] = (queue, porder)
+                if id not in exclude:
+                    self._add(id, (plugin, queue, package, urlHost(url)), (self.policy.key(id, package, porder, lorder, size), id))
+        finally:
+            self.lock.release()
+
+    def remove(self, ids):
+        """ links that were deleted or can not be processed anymore """
+        self.lock.acquire()
+        try:
+            for id in ids:
+                self.entries.pop(id, None)
+        finally:
+            self.lock.release()
+
+    def removePackage(self, package):
+        """ drops all links of a deleted package """
+        self.lock.acquire()
+        try:
+            self.packages.pop(package, None)
+            for bucket in [x for x in self.heaps if x[2] == package]:
+                for key, id in self.heaps.pop(bucket):
+                    if self.entries.get(id, (None, ))[0] == bucket:
+                        del self.entries[id]
+                self.ranked.pop(bucket, None) #its heads are outdated
+        finally:
+            self.lock.release()
+
+    def moved(self, package, queue, porder):
+        """ True if the package has another location than the one the queue knows """
+        self.lock.acquire()
+        try:
+            return self.valid and self.packages.get(package) != (queue, porder)
+        finally:
+            self.lock.release()
+
+    def setPackage(self, package, queue, porder, rows, exclude=()):
+        """ the package got another queue or position, rows are all of its runnable links """
+        self.lock.acquire()
+        try:
+            if not self.valid: return
+            self.removePackage(package)
+            self.packages[package] = (queue, porder)
+            self.add(rows, exclude)
+        finally:
+            self.lock.release()
+
+    def _top(self, bucket):
+        """ first valid item of the package heap, drops the outdated ones above it """
+        heap = self.heaps.get(bucket)
+        while heap and self.entries.get(heap[0][1]) != (bucket, heap[0]):
+            heappop(heap)
+        if heap: return heap[0]
+
+        self.heaps.pop(bucket, None)
+        self.ranked.pop(bucket, None)
+
+    def _best(self, group, running, blocked, count=1):
+        """ [(rank, bucket)] of the count best package heads of a plugin and queue, that may start a link now,
+        links of blocked hosts may not """
+        heads = self.heads[group]
+        parked, best = [], []
+        while heads and len(best) < count:
+            rank, serial, tail = heappop(heads)
+            bucket = group + tail
+            if self.ranked.get(bucket) != serial: continue
+            item = self._top(bucket)
+            if item is None: continue
+
+            now = self.policy.rank(item[0], tail[0], running) if tail[1] not in blocked else None
+            if now is None: #may not start now, but later
+                parked.append((rank, serial, tail))
+            elif heads and now > heads[0][0]: #got worse, other heads are first
+                heappush(heads, (now, serial, tail))
+            else:
+                parked.append((now, serial, tail))
+                best.append((now, bucket))
+
+        for entry in parked:
+            heappush(heads, entry)
+        if not heads:
+            del self.heads[group]
+        return best
+
+    def pop(self, select, exclude=(), running={}, blocked=()):
+        """ removes and returns the id of the best ranked link in a heap where select(plugin, queue) is true,
+        running maps package ids to their running downloads, links of blocked hosts are skipped """
+        self.lock.acquire()
+        try:
+            if not self.valid:
+                self.rebuild(exclude)
+            elif self.policy.refresh and time() - self.refreshed > self.policy.refresh:
+                self.rerank()
+
+            best, bestRank = None, None
+            for group in self.heads.keys():
+                if not select(*group): continue
+                for rank, bucket in self._best(group, running, blocked):
+                    if best is None or rank < bestRank:
+                        bestRank, best = rank, bucket
+
+            if best is None:
+                return None
+
+            key, id = heappop(self.heaps[best])
+            del self.entries[id]
+            self.policy.started(best[2])
+
+            item = self._top(best)
+            if item is not None:
+                self._rank(best, self.policy.rank(item[0], best[2], running))
+            return id
+        finally:
+            self.lock.release()
+
+    def _first(self, heap, count, valid):
+        """ the count smallest items of heap where valid is true, in order and without changing the heap """
+        todo, found = [(heap[0], 0)] if heap else [], 0
+        while todo and found < count:
+            item, i = heappop(todo)
+            if valid(item):
+                found += 1
+                yield item
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    heappush(todo, (heap[child], child))
+
+    def peek(self, select, count, running={}, blocked=()):
+        """ ids of the count best ranked links that pop would return next, without removing them """
+        self.lock.acquire()
+        try:
+            if not self.valid:
+                return [] #will be loaded on the next pop
+
+            ranked, seen = [], set() #a heap can hold an item twice, when a link was added again
+            for group in self.heads.keys():
+                if not select(*group): continue
+                for rank, bucket in self._best(group, running, blocked, count):
+                    valid = lambda x: x[1] not in seen and self.entries.get(x[1]) == (bucket, x)
+                    for key, id in self._first(self.heaps[bucket], count, valid):
+                        rank = self.policy.rank(key, bucket[2], running)
+                        if rank is None: break
+                        ranked.append((rank, id))
+                        seen.add(id)
+
+            ranked.sort()
+            return [id for rank, id in ranked[:count]]
+        finally:
+            self.lock.release()
+
+    def __len__(self):
+        return len(self.entries)
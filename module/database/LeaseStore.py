@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 3 of the License,
+    or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+    See the GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""
+
+from threading import Lock
+from time import time
+
+try:
+    from pysqlite2 import dbapi2 as sqlite3
+except:
+    import sqlite3
+
+
+class LeaseStore():
+    """ time limited claims of links in a database file shared by several cores, a lease that is not renewed expires """
+
+    def __init__(self, path, node, leaseTime=60):
+        self.node = node
+        self.leaseTime = leaseTime
+        self.lock = Lock()
+
+        #autocommit, every method runs in its own immediate transaction
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.c = self.conn.cursor()
+        self.c.execute('CREATE TABLE IF NOT EXISTS "leases" ("link" INTEGER PRIMARY KEY, "node" TEXT NOT NULL, "expires" REAL NOT NULL)')
+
+    def transaction(func):
+        def new(self, *args):
+            self.lock.acquire()
+            try:
+                self.c.execute("BEGIN IMMEDIATE")
+                try:
+                    result = func(self, *args)
+                except:
+                    self.c.execute("ROLLBACK")
+                    raise
+                self.c.execute("COMMIT")
+                return result
+            finally:
+                self.lock.release()
+        return new
+
+    @transaction
+    def claim(self, id):
+        """ True if the link is leased to this node now, False if another node holds it """
+        now = time()
+        self.c.execute("DELETE FROM leases WHERE link=? AND expires < ?", (id, now))
+        self.c.execute("INSERT OR IGNORE INTO leases (link, node, expires) VALUES (?, ?, ?)", (id, self.node, now + self.leaseTime))
+        self.c.execute("SELECT node FROM leases WHERE link=?", (id, ))
+        return self.c.fetchone()[0] == self.node
+
+    @transaction
+    def renew(self, ids):
+        """ extends the leases of running links, returns the ids whose lease was lost meanwhile """
+        expires = time() + self.leaseTime
+        self.c.executemany("UPDATE leases SET expires=? WHERE link=? AND node=?", [(expires, id, self.node) for id in ids])
+        self.c.execute("SELECT link FROM leases WHERE node=?", (self.node, ))
+        held = set([r[0] for r in self.c])
+        return [id for id in ids if id not in held]
+
+    @transaction
+    def release(self, id):
+        self.c.execute("DELETE FROM leases WHERE link=? AND node=?", (id, self.node))
+
+    @transaction
+    def expire(self):
+        """ removes leases that were not renewed in time, returns their link ids """
+        self.c.execute("SELECT link FROM leases WHERE expires < ?", (time(), ))
+        ids = [r[0] for r in self.c]
+        self.c.executemany("DELETE FROM leases WHERE link=?", [(id, ) for id in ids])
+        return ids
+
+    @transaction
+    def releaseAll(self):
+        """ removes all leases of this node, they are left over from a crash when it starts """
+        self.c.execute("SELECT link FROM leases WHERE node=?", (self.node, ))
+        ids = [r[0] for r in self.c]
+        self.c.execute("DELETE FROM leases WHERE node=?", (self.node, ))
+        return ids
+
+    def getLeases(self):
+        """ link id -> node of all valid leases """
+        self.lock.acquire()
+        try:
+            self.c.execute("SELECT link, node FROM leases WHERE expires >= ?", (time(), ))
+            return dict(self.c.fetchall())
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.lock.acquire()
+        self.c.close()
+        self.conn.close()
+        self.lock.release()
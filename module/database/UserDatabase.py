@@ -23,7 +23,7 @@ from DatabaseBackend import DatabaseBackend
 from DatabaseBackend import style
 
 class UserMethods():
-    @style.queue
+    @style.read
     def checkAuth(db, user, password):
         c = db.c
         c.execute('SELECT id, name, password, role, permission, template, email FROM "users" WHERE name=?', (user, ))
@@ -84,7 +84,7 @@ class UserMethods():
         db.c.execute("UPDATE users SET role=? WHERE name=?", (role, user))
 
 
-    @style.queue
+    @style.read
     def listUsers(db):
         db.c.execute('SELECT name FROM users')
         users = []
@@ -92,7 +92,7 @@ class UserMethods():
             users.append(row[0])
         return users
 
-    @style.queue
+    @style.read
     def getAllUserData(db):
         db.c.execute("SELECT name, permission, role, template, email FROM users")
         user = {}
@@ -5,10 +5,11 @@ from logging import getLogger
 
 from HTTPRequest import HTTPRequest
 from HTTPDownload import HTTPDownload
+from DownloadProcess import RemoteDownload
 
 
 class Browser(object):
-    __slots__ = ("log", "options", "bucket", "cj", "_size", "http", "dl")
+    __slots__ = ("log", "options", "bucket", "cj", "_size", "http", "dl", "digests", "lastDownload")
 
     def __init__(self, bucket=None, options={}):
         self.log = getLogger("log")
@@ -21,6 +22,8 @@ class Browser(object):
 
         self.renewHTTPRequest()
         self.dl = None
+        self.digests = {} #checksums of the last download, see option checksums
+        self.lastDownload = None #url of the last download, it may have failed
 
 
     def renewHTTPRequest(self):
@@ -46,6 +49,13 @@ class Browser(object):
             return self.dl.speed
         return 0
 
+    @property
+    def share(self):
+        """ part of the global speed limit in percent """
+        if self.bucket:
+            return int(getattr(self.bucket, "share", 0) * 100)
+        return 0
+
     @property
     def size(self):
         if self._size:
@@ -83,10 +93,22 @@ class Browser(object):
                      progressNotify=None, disposition=False):
         """ this can also download ftp """
         self._size = 0
-        self.dl = HTTPDownload(url, filename, size=size, get=get, post=post, referer=self.lastEffectiveURL if ref else None,
-             cj=self.cj if cookies else None, bucket=self.bucket, options=self.options, progressNotify=progressNotify, disposition=disposition)
+        self.digests = {}
+        self.lastDownload = url
+        referer = self.lastEffectiveURL if ref else None
+        cj = self.cj if cookies else None
+
+        pool = self.options.get("processes")
+        worker = pool.acquire() if pool else None
+        if worker: #transfer runs in a worker process, the rest of the plugin stays here
+            self.dl = RemoteDownload(pool, worker, url, filename, size=size, get=get, post=post, referer=referer, cj=cj,
+                 bucket=self.bucket, options=self.options, progressNotify=progressNotify, disposition=disposition)
+        else:
+            self.dl = HTTPDownload(url, filename, size=size, get=get, post=post, referer=referer, cj=cj,
+                 bucket=self.bucket, options=self.options, progressNotify=progressNotify, disposition=disposition)
         name = self.dl.download(chunks, resume)
         self._size = self.dl.size
+        self.digests = self.dl.digests
 
         self.dl = None
 
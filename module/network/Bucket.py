@@ -19,6 +19,7 @@
 
 from time import time
 from threading import Lock
+from weakref import WeakKeyDictionary
 
 class Bucket:
     def __init__(self):
@@ -35,7 +36,7 @@ class Bucket:
         self.rate = int(rate)
         self.lock.release()
 
-    def consumed(self, amount):
+    def consumed(self, amount, flow=None):
         """ return time the process have to sleep, after consumed specified amount """
         if self.rate < 10240: return 0 #min. 10kb, may become unresponsive otherwise
         self.lock.acquire()
@@ -59,3 +60,111 @@ class Bucket:
             self.tokens = min(self.rate, self.tokens + delta)
             self.timestamp = now
 
+
+
+class FairBucket(Bucket):
+    """ splits the rate between the active flows, weighted by the queue order of their packages.
+
+    flows that use less than their share, because other limits or the server hold them back,
+    get what they use and the rest goes to the others (water filling) """
+
+    def __init__(self):
+        Bucket.__init__(self)
+        self.flows = WeakKeyDictionary() #flow -> time it consumed last
+        self.idle = 2 #seconds until a flow does not count as active anymore
+        self.window = 1 #seconds over which the speed of a flow is measured
+        self.headroom = 1.2 #a flow below its share may speed up by this factor per window
+
+    def consumed(self, amount, flow=None):
+        if flow is None: return Bucket.consumed(self, amount)
+
+        if self.rate < 10240:
+            flow.share = 0
+            return 0
+
+        self.lock.acquire()
+
+        now = time()
+        self.flows[flow] = now
+        self.measure(flow, amount, now)
+        active = [f for f, last in self.flows.items() if now - last < self.idle]
+
+        # first package in queue gets weight 1, the second 1/2 and so on
+        orders = sorted(set([f.order for f in active]))
+        weights = dict([(order, 1.0 / (rank + 1)) for rank, order in enumerate(orders)])
+        flow.share = self.fill(active, weights)[flow] / self.rate
+
+        rate = self.rate * flow.share
+        flow.fairTokens = min(rate, flow.fairTokens + rate * (now - flow.timestamp))
+        flow.timestamp = now
+        flow.fairTokens -= amount
+
+        if flow.fairTokens < 0:
+            wait = -flow.fairTokens / rate
+        else:
+            wait = 0
+
+        self.lock.release()
+        return wait
+
+    def measure(self, flow, amount, now):
+        """ speed of the flow in the last full window, None until one is complete """
+        if now - flow.windowStart >= self.window:
+            flow.speed = flow.windowBytes / (now - flow.windowStart)
+            flow.windowStart, flow.windowBytes = now, 0
+        flow.windowBytes += amount
+
+    def fill(self, active, weights):
+        """ rate of each flow, the ones that want less than their weighted part get what they want """
+        def want(f):
+            return self.rate if f.speed is None else f.speed * self.headroom
+
+        rates, left, total = {}, float(self.rate), sum([weights[f.order] for f in active])
+        for f in sorted(active, key=lambda f: want(f) / weights[f.order]):
+            rates[f] = min(want(f), left * weights[f.order] / total)
+            left -= rates[f]
+            total -= weights[f.order]
+        return rates
+
+
+class BucketChain:
+    """ draws tokens from several buckets, a transfer is limited by the slowest one """
+
+    def __init__(self, buckets, package=None, order=0):
+        self.buckets = buckets
+        self.tokens = 0 #drawn from all buckets, but not consumed yet
+
+        #state as flow of a FairBucket
+        self.package = package
+        self.order = order #queue position of the package, lower is more important
+        self.share = 0 #part of the fair bucket rate, between 0 and 1
+        self.fairTokens = 0
+        self.timestamp = time()
+        self.speed = None #bytes per second in the last measured window
+        self.windowStart = self.timestamp
+        self.windowBytes = 0
+
+    def __nonzero__(self):
+        for bucket in self.buckets:
+            if bucket: return True
+        return False
+
+    def consumed(self, amount, flow=None):
+        """ return time the process have to sleep, only refills take the locks of the buckets """
+        self.tokens -= amount
+        if self.tokens >= 0: return 0
+
+        rates = [bucket.rate for bucket in self.buckets if bucket]
+        if not rates: #all limits were disabled
+            self.tokens = 0
+            return 0
+
+        # draw a batch of tokens ahead, small enough to keep low limits smooth
+        batch = max(-self.tokens, min(64 * 1024, min(rates) / 16))
+
+        wait = 0
+        for bucket in self.buckets:
+            wait = max(wait, bucket.consumed(batch, self))
+
+        self.tokens += batch
+        return wait
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 3 of the License,
+    or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+    See the GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""
+
+from threading import Lock
+
+class ChunkTuner:
+    """ remembers the best number of connections per host, shared by all downloads """
+
+    def __init__(self):
+        self.start = 2 #connections for hosts without any measurement
+        self.gain = 1.1 #speed must rise by this factor to keep an added connection
+        self.probeInterval = 4 #seconds to measure after a connection was added
+        self.counts = {}
+        self.lock = Lock()
+
+    def getCount(self, host, maximum):
+        """ number of connections a new download to host should start with """
+        self.lock.acquire()
+        count = self.counts.get(host, self.start)
+        self.lock.release()
+        return max(1, min(count, maximum))
+
+    def setCount(self, host, count):
+        self.lock.acquire()
+        self.counts[host] = max(1, count)
+        self.lock.release()
+
+    def failed(self, host, count):
+        """ chunks failed while count connections were open """
+        self.setCount(host, count - 1)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 3 of the License,
+    or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+    See the GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""
+
+from sys import maxint
+from threading import Condition
+from time import time
+
+class ConnectionSlots():
+    """ counts the open download connections, limited in total, per host and per account """
+
+    def __init__(self):
+        self.total = 0 #limits, 0 for unlimited
+        self.hostLimits = {} #host -> limit, "*" for all other hosts
+        self.account = 0
+
+        self.used = {} #key -> open connections
+        self.hosts = {} #plugin -> host of its last download
+        self.cond = Condition()
+        self.listeners = [] #called without arguments when a connection closed at a reached limit
+
+    def setLimits(self, total, hosts, account):
+        """ hosts is a string like 'host:count, *:count' """
+        limits = {}
+        for limit in (hosts or "").split(","):
+            host, sep, count = limit.partition(":")
+            if host.strip() and count.strip().isdigit():
+                limits[host.strip().lower()] = int(count)
+
+        self.cond.acquire()
+        self.total, self.hostLimits, self.account = max(0, total), limits, max(0, account)
+        self.cond.notifyAll() #limits may have been raised
+        self.cond.release()
+
+    def getKeys(self, host, plugin=None, account=None):
+        """ keys of the limits a connection to host counts against """
+        host = (host or "").lower()
+        if plugin:
+            self.cond.acquire()
+            self.hosts[plugin] = host
+            self.cond.release()
+
+        keys = [("total",), ("host", host)]
+        if account:
+            keys.append(("account", plugin, account))
+        return tuple(keys)
+
+    def limit(self, key):
+        if key[0] == "total":
+            return self.total
+        elif key[0] == "host":
+            #limits for a domain also apply to its subdomains
+            parts = key[1].split(".")
+            for i in range(len(parts) - 1):
+                name = ".".join(parts[i:])
+                if name in self.hostLimits:
+                    return self.hostLimits[name]
+            return self.hostLimits.get("*", 0)
+        else:
+            return self.account
+
+    def _free(self, keys):
+        free = maxint
+        for key in keys:
+            limit = self.limit(key)
+            if limit:
+                free = min(free, limit - self.used.get(key, 0))
+        return free
+
+    def free(self, keys):
+        """ number of connections that could be opened now """
+        self.cond.acquire()
+        free = self._free(keys)
+        self.cond.release()
+        return free
+
+    def acquire(self, keys, timeout=0):
+        """ takes a slot, waits at most timeout seconds for one, returns False if there was none """
+        self.cond.acquire()
+        try:
+            end = time() + timeout
+            while self._free(keys) <= 0:
+                left = end - time()
+                if left <= 0:
+                    return False
+                self.cond.wait(left)
+
+            for key in keys:
+                self.used[key] = self.used.get(key, 0) + 1
+            return True
+        finally:
+            self.cond.release()
+
+    def release(self, keys):
+        self.cond.acquire()
+        full = self._free(keys) <= 0
+        for key in keys:
+            if self.used.get(key, 0) > 1:
+                self.used[key] -= 1
+            else:
+                self.used.pop(key, None)
+        self.cond.notifyAll()
+        self.cond.release()
+
+        #others may have waited for this slot
+        if full:
+            for listener in self.listeners:
+                listener()
+
+    def isFull(self, key):
+        self.cond.acquire()
+        full = self._free((key,)) <= 0
+        self.cond.release()
+        return full
+
+    def getBlocked(self):
+        """ plugins whose last host or one of whose accounts reached its limit """
+        self.cond.acquire()
+        blocked = set([plugin for plugin, host in self.hosts.iteritems() if self._free((("host", host),)) <= 0])
+        blocked.update([key[1] for key in self.used if key[0] == "account" and self._free((key,)) <= 0])
+        self.cond.release()
+        return blocked
+
+    def getStats(self):
+        """ open connections per limit key """
+        self.cond.acquire()
+        stats = dict([(":".join([str(x) for x in key]), count) for key, count in self.used.iteritems()])
+        self.cond.release()
+        return stats
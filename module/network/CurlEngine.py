@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 3 of the License,
+    or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+    See the GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import select
+from threading import Thread, Lock, Event
+from collections import deque
+from time import time
+from logging import getLogger
+from traceback import print_exc
+
+import pycurl
+
+def engineAvailable():
+    """ the engine needs epoll, other platforms use a loop per download """
+    return hasattr(select, "epoll")
+
+
+class CurlEngine(Thread):
+    """ one thread and one curl multi handle for the transfers of all downloads """
+
+    def __init__(self):
+        Thread.__init__(self)
+        self.setDaemon(True)
+        self.log = getLogger("log")
+
+        self.m = pycurl.CurlMulti()
+        self.m.setopt(pycurl.M_SOCKETFUNCTION, self.handleSocket)
+        self.m.setopt(pycurl.M_TIMERFUNCTION, self.handleTimer)
+
+        self.poll = select.epoll()
+        self.fds = set() #sockets registered at epoll
+        self.deadline = None #time curl wants to be called again
+
+        self.owners = {} #curl handle -> EngineMulti
+        self.jobs = deque()
+        self.lock = Lock()
+
+        #writing to the pipe wakes up the engine for new jobs
+        self.wakeRead, self.wakeWrite = os.pipe()
+        self.poll.register(self.wakeRead, select.EPOLLIN)
+
+    def getMulti(self):
+        """ returns a multi handle for one download, that runs its transfers on this engine """
+        return EngineMulti(self)
+
+    def call(self, func, *args):
+        """ runs func in the engine thread, curl handles must not be used by other threads """
+        self.lock.acquire()
+        self.jobs.append((func, args))
+        self.lock.release()
+        os.write(self.wakeWrite, "x")
+
+    def callWait(self, func, *args):
+        """ like call, but waits until func was executed and returns its result """
+        done = Event()
+        result = []
+
+        def job():
+            try:
+                result.append((True, func(*args)))
+            except Exception, e:
+                result.append((False, e))
+            done.set()
+
+        self.call(job)
+        done.wait()
+
+        ok, value = result[0]
+        if not ok: raise value
+        return value
+
+    def run(self):
+        while True:
+            timeout = 1
+            if self.deadline is not None:
+                timeout = max(0, min(timeout, self.deadline - time()))
+
+            try:
+                events = self.poll.poll(timeout)
+            except IOError: #interrupted system call
+                continue
+
+            #the engine must keep running for the other downloads
+            try:
+                for fd, event in events:
+                    if fd == self.wakeRead:
+                        os.read(self.wakeRead, 4096)
+                        continue
+
+                    flags = 0
+                    if event & select.EPOLLIN: flags |= pycurl.CSELECT_IN
+                    if event & select.EPOLLOUT: flags |= pycurl.CSELECT_OUT
+                    if event & (select.EPOLLERR | select.EPOLLHUP): flags |= pycurl.CSELECT_ERR
+                    self.socketAction(fd, flags)
+
+                if self.deadline is not None and self.deadline <= time():
+                    self.deadline = None
+                    self.socketAction(pycurl.SOCKET_TIMEOUT, 0)
+            except Exception:
+                self.log.error(_("Error in download engine"))
+                print_exc()
+
+            self.runJobs()
+
+            try:
+                self.readInfo()
+            except Exception:
+                self.log.error(_("Error in download engine"))
+                print_exc()
+
+    def socketAction(self, fd, flags):
+        while True:
+            ret, running = self.m.socket_action(fd, flags)
+            if ret != pycurl.E_CALL_MULTI_PERFORM: break
+
+    def runJobs(self):
+        while self.jobs:
+            self.lock.acquire()
+            func, args = self.jobs.popleft()
+            self.lock.release()
+            try:
+                func(*args)
+            except Exception:
+                self.log.error(_("Error in download engine"))
+                print_exc()
+
+    def readInfo(self):
+        """ hands finished transfers to the downloads they belong to """
+        while True:
+            num_q, ok_list, err_list = self.m.info_read()
+            for c in ok_list:
+                if c in self.owners:
+                    self.owners[c].finished(c)
+            for c in err_list:
+                if c[0] in self.owners:
+                    self.owners[c[0]].failed(c)
+            if not num_q: break
+
+    def handleSocket(self, event, fd, multi, data):
+        """ called by curl inside socket_action, errors must not propagate into curl """
+        try:
+            self.watch(event, fd)
+        except Exception:
+            self.log.error(_("Error in download engine"))
+            print_exc()
+
+    def watch(self, event, fd):
+        if event == pycurl.POLL_REMOVE:
+            if fd in self.fds:
+                self.fds.discard(fd)
+                try:
+                    self.poll.unregister(fd)
+                except (IOError, ValueError): #socket was closed already
+                    pass
+            return
+
+        mask = 0
+        if event & pycurl.POLL_IN: mask |= select.EPOLLIN
+        if event & pycurl.POLL_OUT: mask |= select.EPOLLOUT
+
+        if fd in self.fds:
+            self.poll.modify(fd, mask)
+        else:
+            self.poll.register(fd, mask)
+            self.fds.add(fd)
+
+    def handleTimer(self, msecs):
+        self.deadline = None if msecs < 0 else time() + msecs / 1000.0
+
+    def add(self, c, owner):
+        self.owners[c] = owner
+        self.m.add_handle(c)
+
+    def remove(self, c):
+        if c in self.owners:
+            del self.owners[c]
+            self.m.remove_handle(c)
+
+
+class EngineMulti():
+    """ offers the part of the CurlMulti interface HTTPDownload uses, transfers run in the engine thread """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.handles = set()
+
+        self.ok = []
+        self.err = []
+        self.lock = Lock()
+        self.event = Event() #set when a transfer finished
+
+    def add_handle(self, c):
+        self.handles.add(c)
+        self.engine.call(self.engine.add, c, self)
+
+    def remove_handle(self, c):
+        """ returns after curl has released the handle, so it can be closed afterwards """
+        if c not in self.handles:
+            raise pycurl.error(pycurl.E_MULTI_BAD_EASY_HANDLE, "handle is not part of this multi")
+        self.handles.discard(c)
+        self.engine.callWait(self.engine.remove, c)
+
+    def perform(self):
+        """ transfers are performed by the engine """
+        return pycurl.E_MULTI_OK, len(self.handles)
+
+    def info_read(self):
+        self.lock.acquire()
+        ok, err = self.ok, self.err
+        self.ok, self.err = [], []
+        self.event.clear()
+        self.lock.release()
+        return 0, ok, err
+
+    def select(self, timeout):
+        """ waits until a transfer finished or timeout passed """
+        self.event.wait(timeout)
+
+    def finished(self, c):
+        self.lock.acquire()
+        self.ok.append(c)
+        self.event.set()
+        self.lock.release()
+
+    def failed(self, info):
+        self.lock.acquire()
+        self.err.append(info)
+        self.event.set()
+        self.lock.release()
+
+    def close(self):
+        for c in list(self.handles):
+            self.remove_handle(c)
@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 3 of the License,
+    or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+    See the GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""
+
+from logging import getLogger
+from multiprocessing import Pipe, Process
+from multiprocessing.reduction import recv_handle, send_handle
+from _multiprocessing import Connection
+from threading import Lock
+from traceback import format_exc
+import os
+
+import pycurl
+
+from CookieJar import CookieJar
+from HTTPDownload import HTTPDownload
+from HTTPRequest import BadHeader
+
+from module.plugins.Plugin import Abort
+
+#options that only exist in the core process, the worker gets proxies or does without them
+LOCAL_OPTIONS = ("engine", "slots", "tuner", "share", "processes")
+
+
+class ForkServer():
+    """ single threaded process that forks the download workers,
+    the core must not fork itself once its threads run """
+
+    def __init__(self):
+        self.conn, child = Pipe()
+        self.process = Process(target=forkServerMain, args=(child,), name="DownloadForkServer")
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+        self.lock = Lock()
+
+    def fork(self):
+        """ pid and pipe of a new worker """
+        self.lock.acquire()
+        try:
+            self.conn.send("fork")
+            pid = self.conn.recv()
+            return pid, Connection(recv_handle(self.conn))
+        finally:
+            self.lock.release()
+
+    def stop(self):
+        self.lock.acquire()
+        try:
+            self.conn.send(None)
+        except (IOError, EOFError):
+            pass
+        self.conn.close()
+        self.lock.release()
+
+
+class ProcessPool():
+    """ worker processes that run the transfers of downloads, so curl callbacks do not compete for the GIL """
+
+    def __init__(self, size, server=None):
+        self.size = 0
+        self.server = server or ForkServer()
+        self.idle = [] #workers without a download
+        self.workers = set()
+        self.lock = Lock()
+        self.log = getLogger("log")
+        self.setSize(size)
+
+    def setSize(self, size):
+        """ starts missing workers, surplus ones stop when they are idle """
+        self.lock.acquire()
+        try:
+            self.size = max(0, size)
+            while len(self.workers) < self.size:
+                worker = Worker(self.server)
+                self.workers.add(worker)
+                self.idle.append(worker)
+            while self.idle and len(self.workers) > self.size:
+                self.stop(self.idle.pop())
+        finally:
+            self.lock.release()
+
+    def acquire(self):
+        """ a worker for one download, None if all are busy """
+        self.lock.acquire()
+        try:
+            while self.idle:
+                worker = self.idle.pop()
+                if worker.alive(): return worker
+                self.workers.discard(worker) #crashed, replaced below
+                self.log.warning(_("Download worker %d died") % worker.pid)
+
+            if len(self.workers) < self.size:
+                worker = Worker(self.server)
+                self.workers.add(worker)
+                return worker
+        finally:
+            self.lock.release()
+
+    def release(self, worker):
+        self.lock.acquire()
+        if not worker.alive():
+            self.workers.discard(worker)
+        elif len(self.workers) > self.size:
+            self.stop(worker)
+        else:
+            self.idle.append(worker)
+        self.lock.release()
+
+    def stop(self, worker):
+        self.workers.discard(worker)
+        worker.stop()
+
+    def shutdown(self):
+        self.setSize(0)
+        self.server.stop()
+
+    def getStats(self):
+        self.lock.acquire()
+        stats = {"workers": len(self.workers), "busy": len(self.workers) - len(self.idle)}
+        self.lock.release()
+        return stats
+
+
+class Worker():
+    """ core side of a worker process """
+
+    def __init__(self, server):
+        self.pid, self.conn = server.fork()
+
+    def alive(self):
+        """ an idle worker sends nothing, so a readable pipe means it exited """
+        try:
+            return not self.conn.poll()
+        except (IOError, EOFError):
+            return False
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (IOError, EOFError):
+            pass
+        self.conn.close()
+
+
+class RemoteDownload():
+    """ runs a HTTPDownload in a worker process, has the same interface for Browser """
+
+    def __init__(self, pool, worker, url, filename, size=0, get={}, post={}, referer=None, cj=None, bucket=None,
+                 options={}, progressNotify=None, disposition=False):
+        self.pool = pool
+        self.worker = worker
+        self.job = {"url": url, "filename": filename, "size": size, "get": get, "post": post, "referer": referer,
+                    "cookies": cj.getCookies() if cj else None, "disposition": disposition,
+                    "options": dict([(k, v) for k, v in options.iteritems() if k not in LOCAL_OPTIONS]),
+                    "limited": bool(bucket), "slots": bool(options.get("slots")),
+                    "tuner": (options["tuner"].probeInterval, options["tuner"].gain) if options.get("tuner") else None}
+
+        self.cj = cj
+        self.bucket = bucket
+        self.objects = {"bucket": bucket, "slots": options.get("slots"), "tuner": options.get("tuner")}
+        self.held = [] #keys of the connection slots the worker holds, given back when it exits
+        self.progressNotify = progressNotify
+
+        self.abort = False
+        self.size = size
+        self.arrived = 0
+        self.speed = 0
+        self.digests = {}
+        self.nameDisposition = None
+
+    @property
+    def percent(self):
+        if not self.size: return 0
+        return (self.arrived * 100) / self.size
+
+    def download(self, chunks=1, resume=False):
+        """ returns new filename or None, raises the exceptions of the worker """
+        conn = self.worker.conn
+        try:
+            conn.send(("download", self.job, chunks, resume))
+            aborted = False
+
+            while True:
+                if self.abort and not aborted:
+                    conn.send(("abort",))
+                    aborted = True
+
+                if not conn.poll(0.5): continue
+                msg = conn.recv()
+
+                if msg[0] == "progress":
+                    self.arrived, self.speed, self.size = msg[1:]
+                    conn.send(("limit", bool(self.bucket))) #speed limit may have been switched
+                    if self.progressNotify:
+                        self.progressNotify(self.percent)
+
+                elif msg[0] == "call":
+                    target, name, args = msg[1:]
+                    try:
+                        if target == "bucket" and not self.bucket:
+                            conn.send(("result", None))
+                        elif target == "slots" and name in ("acquire", "release"):
+                            conn.send(("result", self.slot(name, *args)))
+                        else:
+                            conn.send(("result", getattr(self.objects[target], name)(*args)))
+                    except Exception, e:
+                        conn.send(("result", None))
+                        getLogger("log").debug("Worker call %s.%s failed: %s" % (target, name, e))
+
+                elif msg[0] == "done":
+                    name, self.size, self.digests, cookies = msg[1:]
+                    self.arrived = self.size
+                    if self.cj and cookies:
+                        self.cj.addCookies(cookies)
+                    return name
+
+                elif msg[0] == "error":
+                    raise rebuildError(*msg[1:])
+
+        except (IOError, EOFError):
+            raise Exception(_("Download worker %d died") % self.worker.pid)
+        finally:
+            for keys in self.held: #connections the worker did not close
+                self.objects["slots"].release(keys)
+            self.held = []
+            self.pool.release(self.worker)
+            self.worker = None
+
+    def slot(self, name, keys, *args):
+        """ takes or gives back a connection slot for the worker """
+        slots = self.objects["slots"]
+        if name == "release":
+            if keys in self.held:
+                self.held.remove(keys)
+                slots.release(keys)
+            return None
+
+        if slots.acquire(keys, *args):
+            self.held.append(keys)
+            return True
+        return False
+
+    def close(self):
+        pass
+
+
+def rebuildError(kind, args, trace):
+    """ exception of the worker as it would have been raised in the core """
+    if kind == "abort":
+        return Abort()
+    elif kind == "pycurl":
+        return pycurl.error(*args)
+    elif kind == "header":
+        return BadHeader(*args)
+
+    getLogger("log").debug("Download worker error: %s" % trace)
+    return Exception(*args)
+
+
+class WorkerLink():
+    """ worker side of the pipe, calls to core objects wait for their result """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.dl = None
+        self.bucket = None
+
+    def call(self, target, name, *args):
+        self.conn.send(("call", target, name, args))
+        while True:
+            msg = self.conn.recv()
+            if msg[0] == "result":
+                return msg[1]
+            self.handle(msg)
+
+    def poll(self):
+        while self.conn.poll():
+            self.handle(self.conn.recv())
+
+    def handle(self, msg):
+        if msg[0] == "abort" and self.dl:
+            self.dl.abort = True
+        elif msg[0] == "limit" and self.bucket:
+            self.bucket.limited = msg[1]
+
+    def progress(self):
+        self.conn.send(("progress", self.dl.arrived, self.dl.speed, self.dl.size))
+        self.poll()
+
+
+class RemoteObject():
+    """ forwards method calls to an object of the core """
+
+    def __init__(self, link, target, **attrs):
+        self.link = link
+        self.target = target
+        self.__dict__.update(attrs)
+
+    def __getattr__(self, name):
+        if name.startswith("__"): raise AttributeError(name)
+        return lambda *args: self.link.call(self.target, name, *args)
+
+
+class RemoteBucket():
+    """ draws tokens from the speed limit of the core in batches """
+
+    def __init__(self, link, limited):
+        self.link = link
+        self.limited = limited #speed limit was active when the download started
+        self.tokens = 0
+
+    def __nonzero__(self):
+        return self.limited
+
+    def consumed(self, amount, flow=None):
+        self.tokens -= amount
+        if self.tokens >= 0: return 0
+
+        batch = max(-self.tokens, 256 * 1024)
+        wait = self.link.call("bucket", "consumed", batch)
+        if wait is None: #limit was removed
+            self.limited = False
+            wait = 0
+        self.tokens += batch
+        return wait
+
+
+def forkServerMain(conn):
+    """ forks a worker for every request of the core, until it closes the pipe """
+    while True:
+        try:
+            if not conn.poll(5):
+                reap()
+                continue
+            msg = conn.recv()
+        except (IOError, EOFError):
+            return
+        if msg is None: return
+
+        parent, child = Pipe()
+        pid = os.fork()
+        if not pid:
+            conn.close()
+            parent.close()
+            try:
+                workerMain(child)
+            finally:
+                os._exit(0)
+
+        child.close()
+        conn.send(pid)
+        send_handle(conn, parent.fileno(), None)
+        parent.close()
+        reap()
+
+
+def reap():
+    """ collects the exit status of finished workers """
+    try:
+        while os.waitpid(-1, os.WNOHANG)[0]: pass
+    except OSError: #no children
+        pass
+
+
+def workerMain(conn):
+    """ runs downloads sent by the core until it closes the pipe """
+    link = WorkerLink(conn)
+    while True:
+        try:
+            msg = conn.recv()
+        except (IOError, EOFError):
+            return
+        if msg is None: return
+        if msg[0] != "download": continue #answer to the last download
+
+        cmd, job, chunks, resume = msg
+        options = job["options"]
+        if job["slots"]:
+            options["slots"] = RemoteObject(link, "slots")
+        if job["tuner"]:
+            options["tuner"] = RemoteObject(link, "tuner", probeInterval=job["tuner"][0], gain=job["tuner"][1])
+
+        cj = None
+        if job["cookies"] is not None:
+            cj = CookieJar(None)
+            cj.addCookies(job["cookies"])
+
+        link.bucket = RemoteBucket(link, job["limited"])
+        try:
+            link.dl = HTTPDownload(job["url"], job["filename"], size=job["size"], get=job["get"], post=job["post"],
+                                   referer=job["referer"], cj=cj, bucket=link.bucket, options=options,
+                                   progressNotify=lambda percent: link.progress(), disposition=job["disposition"])
+            name = link.dl.download(chunks, resume)
+            conn.send(("done", name, link.dl.size, link.dl.digests, cj.getCookies() if cj else None))
+
+        except Abort:
+            conn.send(("error", "abort", (), ""))
+        except pycurl.error, e:
+            conn.send(("error", "pycurl", tuple(e.args), ""))
+        except BadHeader, e:
+            conn.send(("error", "header", (e.code, e.header, e.content), ""))
+        except Exception, e:
+            conn.send(("error", "other", (str(e),), format_exc()))
+        finally:
+            link.dl, link.bucket = None, None
@@ -16,15 +16,18 @@
     
     @author: RaNaN
 """
-from os import remove, stat, fsync
+from os import remove, rename, stat, fsync
 from os.path import exists
-from time import sleep
+from time import sleep, time
 from re import search
+from struct import pack, unpack
+from zlib import crc32
 from module.utils import fs_encode
 import codecs
 import pycurl
 
 from HTTPRequest import HTTPRequest
+from StreamHash import StreamHash
 
 class WrongFormat(Exception):
     pass
@@ -35,7 +38,9 @@ class ChunkInfo():
         self.name = unicode(name)
         self.size = 0
         self.resume = False
+        self.inplace = False #all chunks are written into one preallocated file
         self.chunks = []
+        self.progress = [] #synced bytes per chunk from the journal, None if unknown
 
     def __repr__(self):
         ret = "ChunkInfo: %s, %s\n" % (self.name, self.size)
@@ -47,11 +52,19 @@ class ChunkInfo():
     def setSize(self, size):
         self.size = int(size)
 
-    def addChunk(self, name, range):
+    def addChunk(self, name, range, arrived=None):
         self.chunks.append((name, range))
+        self.progress.append(arrived)
 
     def clear(self):
         self.chunks = []
+        self.progress = []
+
+    def chunkName(self, index):
+        """ file name for chunk with given index, inplace chunks share one file """
+        if self.inplace:
+            index = 0
+        return "%s.chunk%s" % (self.name, index)
 
     def createChunks(self, chunks):
         self.clear()
@@ -60,20 +73,66 @@ class ChunkInfo():
         current = 0
         for i in range(chunks):
             end = self.size - 1 if (i == chunks - 1) else current + chunk_size
-            self.addChunk("%s.chunk%s" % (self.name, i), (current, end))
+            self.addChunk(self.chunkName(i), (current, end))
             current += chunk_size + 1
 
 
     def save(self):
         fs_name = fs_encode("%s.chunks" % self.name)
-        fh = codecs.open(fs_name, "w", "utf_8")
+        fh = codecs.open(fs_name + ".tmp", "w", "utf_8")
         fh.write("name:%s\n" % self.name)
         fh.write("size:%s\n" % self.size)
+        if self.inplace:
+            fh.write("inplace:1\n")
         for i, c in enumerate(self.chunks):
             fh.write("#%d:\n" % i)
             fh.write("\tname:%s\n" % c[0])
             fh.write("\trange:%i-%i\n" % c[1])
         fh.close()
+        self.replace(fs_name + ".tmp", fs_name)
+
+    def saveJournal(self):
+        """ records the progress of all chunks, the chunk files must be synced before """
+        data = pack("<4sI", "PLJ1", len(self.chunks))
+        for i, c in enumerate(self.chunks):
+            data += pack("<QQQ", c[1][0], c[1][1], self.progress[i] or 0)
+        data += pack("<I", crc32(data) & 0xffffffff)
+
+        fs_name = fs_encode("%s.journal" % self.name)
+        fh = open(fs_name + ".tmp", "wb")
+        fh.write(data)
+        fh.flush()
+        fsync(fh.fileno())
+        fh.close()
+        self.replace(fs_name + ".tmp", fs_name)
+
+    def loadJournal(self):
+        """ reads the progress of the chunks, a damaged journal or entries of other chunks are ignored """
+        fs_name = fs_encode("%s.journal" % self.name)
+        if not exists(fs_name): return
+
+        fh = open(fs_name, "rb")
+        data = fh.read()
+        fh.close()
+
+        if len(data) < 12 or data[:4] != "PLJ1": return
+        count = unpack("<I", data[4:8])[0]
+        if len(data) != 12 + count * 24 or unpack("<I", data[-4:])[0] != crc32(data[:-4]) & 0xffffffff:
+            return
+
+        for i in range(min(count, len(self.chunks))):
+            start, end, arrived = unpack("<QQQ", data[8 + i * 24:32 + i * 24])
+            if start == self.chunks[i][1][0]: #ranges are only shortened by splitting
+                self.progress[i] = arrived
+
+    @staticmethod
+    def replace(src, dst):
+        """ renames src to dst, atomic where the os allows to overwrite on rename """
+        try:
+            rename(src, dst)
+        except OSError: #windows
+            if exists(dst): remove(dst)
+            rename(src, dst)
 
     @staticmethod
     def load(name):
@@ -92,9 +151,11 @@ class ChunkInfo():
         ci = ChunkInfo(name)
         ci.loaded = True
         ci.setSize(size)
-        while True:
-            if not fh.readline(): #skip line
-                break
+        line = fh.readline()
+        if line.startswith("inplace:"):
+            ci.inplace = bool(int(line[8:-1]))
+            line = fh.readline()
+        while line: #skip line
             name = fh.readline()[1:-1]
             range = fh.readline()[1:-1]
             if name.startswith("name:") and range.startswith("range:"):
@@ -104,12 +165,15 @@ class ChunkInfo():
                 raise WrongFormat()
 
             ci.addChunk(name, (long(range[0]), long(range[1])))
+            line = fh.readline()
         fh.close()
+        ci.loadJournal()
         return ci
 
     def remove(self):
-        fs_name = fs_encode("%s.chunks" % self.name)
-        if exists(fs_name): remove(fs_name)
+        for ext in ("chunks", "journal"):
+            fs_name = fs_encode("%s.%s" % (self.name, ext))
+            if exists(fs_name): remove(fs_name)
 
     def getCount(self):
         return len(self.chunks)
@@ -120,6 +184,15 @@ class ChunkInfo():
     def getChunkRange(self, index):
         return self.chunks[index][1]
 
+    def setChunkRange(self, index, range):
+        self.chunks[index] = (self.chunks[index][0], range)
+
+    def getChunkArrived(self, index):
+        return self.progress[index]
+
+    def setChunkArrived(self, index, arrived):
+        self.progress[index] = arrived
+
 
 class HTTPChunk(HTTPRequest):
     def __init__(self, id, parent, range=None, resume=False):
@@ -140,6 +213,10 @@ class HTTPChunk(HTTPRequest):
 
         self.fp = None #file handle
 
+        self.verify = 0 #bytes that were loaded before and get compared to the data on disk
+        self.mismatch = False #resumed data differs from the data on disk
+        self.hash = None #checksums of the data of this chunk, computed while it arrives
+
         self.initHandle()
         self.setInterface(self.p.options)
 
@@ -150,6 +227,9 @@ class HTTPChunk(HTTPRequest):
         self.sleep = 0.000
         self.lastSize = 0
 
+        self.paused = False #receiving was paused by the speed limit
+        self.unpauseAt = 0 #time when the chunk may receive again
+
     def __repr__(self):
         return "<HTTPChunk id=%d, size=%d, arrived=%d>" % (self.id, self.size, self.arrived)
 
@@ -168,16 +248,26 @@ class HTTPChunk(HTTPRequest):
 
         fs_name = fs_encode(self.p.info.getChunkName(self.id))
         if self.resume:
-            self.fp = open(fs_name, "ab")
-            self.arrived = self.fp.tell()
-            if not self.arrived:
-                self.arrived = stat(fs_name).st_size
+            synced = self.p.info.getChunkArrived(self.id) #None for downloads without journal
+            if self.p.info.inplace:
+                self.fp = open(fs_name, "rb+")
+                self.arrived = synced or 0
+            else:
+                size = stat(fs_name).st_size if exists(fs_name) else 0
+                #data behind the journal offset may be incomplete after a crash
+                self.arrived = size if synced is None else min(synced, size)
+                self.fp = open(fs_name, "rb+" if size else "wb")
+                self.fp.truncate(self.arrived)
 
-            if self.range:
-                #do nothing if chunk already finished
-                if self.arrived + self.range[0] >= self.range[1]: return None
+            #do nothing if chunk already finished
+            if self.range and self.arrived + self.range[0] >= self.range[1]: return None
 
-                if self.id == len(self.p.info.chunks) - 1: #as last chunk dont set end range, so we get everything
+            #load the end of the existing data again, to make sure it matches
+            self.verify = min(self.p.verifyOverlap, self.arrived)
+            self.arrived -= self.verify
+
+            if self.range:
+                if self.range[1] >= self.p.size - 1: #as last chunk dont set end range, so we get everything
                     range = "%i-" % (self.arrived + self.range[0])
                 else:
                     range = "%i-%i" % (self.arrived + self.range[0], min(self.range[1] + 1, self.p.size - 1))
@@ -190,7 +280,7 @@ class HTTPChunk(HTTPRequest):
 
         else:
             if self.range:
-                if self.id == len(self.p.info.chunks) - 1: # see above
+                if self.range[1] >= self.p.size - 1: # see above
                     range = "%i-" % self.range[0]
                 else:
                     range = "%i-%i" % (self.range[0], min(self.range[1] + 1, self.p.size - 1))
@@ -198,7 +288,19 @@ class HTTPChunk(HTTPRequest):
                 self.log.debug("Chunked with range %s" % range)
                 self.c.setopt(pycurl.RANGE, range)
 
-            self.fp = open(fs_name, "wb")
+            if self.p.info.inplace and self.id:
+                self.fp = open(fs_name, "rb+") #shared file was already created by the initial chunk
+            else:
+                self.fp = open(fs_name, "wb")
+
+        #resumed chunks miss the data that was loaded before
+        if self.p.checksums and not self.arrived and not self.verify:
+            self.hash = StreamHash(self.p.checksums, not self.range or self.range[1] >= self.p.size - 1)
+
+        if self.p.info.inplace:
+            self.fp.seek(self.arrived + (self.range[0] if self.range else 0))
+        elif self.resume:
+            self.fp.seek(self.arrived)
 
         return self.c
 
@@ -217,19 +319,45 @@ class HTTPChunk(HTTPRequest):
         self.headerParsed = True
 
     def writeBody(self, buf):
+        #let curl keep the data until the download loop continues this chunk
+        if self.unpauseAt and self.p.pauseFlow:
+            if self.unpauseAt > time():
+                self.paused = True
+                return pycurl.WRITEFUNC_PAUSE
+            self.unpauseAt = 0
+
         #ignore BOM, it confuses unrar
         if not self.BOMChecked:
             if [ord(b) for b in buf[:3]] == [239, 187, 191]:
                 buf = buf[3:]
             self.BOMChecked = True
 
+        if self.verify:
+            size = min(len(buf), self.verify)
+            pos = self.fp.tell()
+            self.fp.seek(pos) #needed when switching from writing to reading
+            if self.fp.read(size) != buf[:size]:
+                self.log.warning(_("Resumed data of chunk %d does not match the existing data") % (self.id + 1))
+                self.mismatch = True
+                return 0
+            self.fp.seek(pos)
+            self.verify -= size
+
         size = len(buf)
 
+        if self.hash:
+            #data behind the range belongs to the next chunk
+            self.hash.update(buf if not self.range else buf[:max(0, self.size + 1 - self.arrived)])
+
         self.arrived += size
 
         self.fp.write(buf)
 
-        if self.p.bucket:
+        if self.p.pauseFlow:
+            if self.p.bucket:
+                delay = self.p.bucket.consumed(size)
+                if delay: self.unpauseAt = time() + delay
+        elif self.p.bucket:
             sleep(self.p.bucket.consumed(size))
         else:
             # Avoid small buffers, increasing sleep time slowly if buffer size gets smaller
@@ -267,18 +395,42 @@ class HTTPChunk(HTTPRequest):
 
         self.headerParsed = True
 
+    def verifyHeader(self):
+        if self.p.engine: #only the engine thread may use the handle
+            return self.p.engine.callWait(HTTPRequest.verifyHeader, self)
+        return HTTPRequest.verifyHeader(self)
+
+    def unpause(self):
+        """ continues receiving after the chunk was paused """
+        self.paused = False
+        self.unpauseAt = 0
+        if self.p.engine: #only the engine thread may use the handle
+            self.p.engine.call(self.continueReceive)
+        else:
+            self.continueReceive()
+
+    def continueReceive(self):
+        try:
+            self.c.pause(pycurl.PAUSE_CONT)
+        except pycurl.error:
+            pass #chunk was stopped by the held back data, the multi handle reports it as finished
+
     def stop(self):
         """The download will not proceed after next call of writeBody"""
         self.range = [0,0]
         self.size = 0
+        self.hash = None
 
     def resetRange(self):
         """ Reset the range, so the download will load all data available  """
         self.range = None
+        self.hash = None #chunk continues with data that was not in its range
 
     def setRange(self, range):
         self.range = range
         self.size = range[1] - range[0]
+        if self.hash and range[1] < self.p.size - 1:
+            self.hash.unordered()
 
     def flushFile(self):
         """  flush and close file """
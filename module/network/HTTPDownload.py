@@ -18,15 +18,18 @@
 """
 
 from os import remove, fsync
-from os.path import dirname
-from time import sleep, time
+from os.path import dirname, exists, getsize
+from time import sleep, time, clock
 from shutil import move
+from select import select
 from logging import getLogger
+from urlparse import urlparse
 
 import pycurl
 
 from HTTPChunk import ChunkInfo, HTTPChunk
 from HTTPRequest import BadHeader
+from StreamHash import StreamHash
 
 from module.plugins.Plugin import Abort
 from module.utils import save_join, fs_encode
@@ -62,9 +65,13 @@ class HTTPDownload():
             self.infoSaved = True
         except IOError:
             self.info = ChunkInfo(filename)
+            self.info.inplace = options.get("preallocate", False)
 
         self.chunkSupport = None
-        self.m = pycurl.CurlMulti()
+
+        #transfers run on the shared engine thread, if there is one
+        self.engine = options.get("engine", None)
+        self.m = self.engine.getMulti() if self.engine else pycurl.CurlMulti()
 
         #needed for speed calculation
         self.lastArrived = []
@@ -73,6 +80,34 @@ class HTTPDownload():
 
         self.progressNotify = progressNotify
 
+        #speed limit pauses chunks instead of sleeping in the write callback
+        self.pauseFlow = options.get("flowControl", "pause") == "pause" or self.engine is not None
+
+        #seconds between progress checkpoints
+        self.checkpointInterval = options.get("checkpointInterval", 5)
+        #bytes to load again when resuming, they are compared to the data on disk
+        self.verifyOverlap = options.get("verifyOverlap", 0)
+        #checksums to compute while downloading, the results are in digests
+        self.checksums = options.get("checksums", ())
+        self.digests = {}
+        #running chunks with less remaining bytes will not be splitted for idle connections
+        self.minSplitSize = 1024 * 1024
+
+        #adapts the number of connections to the measured speed, None to use a fixed number
+        self.tuner = options.get("tuner", None)
+        self.host = urlparse(url).hostname
+        self.chunkLimit = 1 #number of connections that may run at the same time
+        self.maxChunks = 1
+        self.tuneSpeed = 0 #speed measured before the last connection was added
+        self.tuneNext = 0
+        self.tuned = False
+
+        #every running chunk holds a connection slot, chunks without one wait in pending
+        self.slots = options.get("slots", None)
+        self.slotKeys = self.slots.getKeys(self.host, *options.get("slotOwner", (None, None))) if self.slots else ()
+        self.holding = set()
+        self.pending = []
+
     @property
     def speed(self):
         last = [sum(x) for x in self.lastSpeeds if x]
@@ -90,13 +125,13 @@ class HTTPDownload():
     def _copyChunks(self):
         init = fs_encode(self.info.getChunkName(0)) #initial chunk name
 
-        if self.info.getCount() > 1:
+        if self.info.getCount() > 1 and not self.info.inplace:
             fo = open(init, "rb+") #first chunkfile
-            for i in range(1, self.info.getCount()):
+            #splitted chunks were appended, so copy them in order of their position
+            for i in sorted(range(1, self.info.getCount()), key=lambda x: self.info.getChunkRange(x)[0]):
                 #input file
-                fo.seek(
-                    self.info.getChunkRange(i - 1)[1] + 1) #seek to beginning of chunk, to get rid of overlapping chunks
-                fname = fs_encode("%s.chunk%d" % (self.filename, i))
+                fo.seek(self.info.getChunkRange(i)[0]) #seek to beginning of chunk, to get rid of overlapping chunks
+                fname = fs_encode(self.info.getChunkName(i))
                 fi = open(fname, "rb")
                 buf = 32 * 1024
                 while True: #copy in chunks, consumes less memory
@@ -113,6 +148,12 @@ class HTTPDownload():
                 remove(fname) #remove chunk
             fo.close()
 
+        elif self.info.inplace:
+            for chunk in self.chunks:
+                if chunk.range and chunk.arrived < chunk.size:
+                    self.info.remove() #there are probably invalid chunks
+                    raise Exception("Downloaded content was smaller than expected. Try to reduce download connections.")
+
         if self.nameDisposition and self.disposition:
             self.filename = save_join(dirname(self.filename), self.nameDisposition)
 
@@ -125,6 +166,14 @@ class HTTPDownload():
         chunks = max(1, chunks)
         resume = self.info.resume and resume
 
+        self.maxChunks = chunks
+        if self.tuner:
+            chunks = self.tuner.getCount(self.host, chunks)
+
+        if resume and self.info.inplace and not exists(fs_encode(self.info.getChunkName(0))):
+            self.log.debug("Preallocated file is missing -> Restart without resume")
+            resume = False
+
         try:
             self._download(chunks, resume)
         except pycurl.error, e:
@@ -150,17 +199,22 @@ class HTTPDownload():
     def _download(self, chunks, resume):
         if not resume:
             self.info.clear()
-            self.info.addChunk("%s.chunk0" % self.filename, (0, 0)) #create an initial entry
+            self.info.addChunk(self.info.chunkName(0), (0, 0)) #create an initial entry
 
         self.chunks = []
+        self.pending = []
 
         init = HTTPChunk(0, self, None, resume) #initial chunk that will load complete file (if needed)
 
+        self.waitSlot()
+        self.holding.add(init)
         self.chunks.append(init)
         self.m.add_handle(init.getHandle())
 
         lastFinishCheck = 0
         lastTimeCheck = 0
+        lastCheckpoint = t = time()
+        self.chunkLimit = chunks
         chunksDone = set()  # list of curl handles that are finished
         chunksCreated = False
         done = False
@@ -172,25 +226,28 @@ class HTTPDownload():
             if not chunksCreated and self.chunkSupport and self.size: #will be setted later by first chunk
 
                 if not resume:
+                    #no more chunks than connections we may open now, more are added when slots get free
+                    if self.slots:
+                        chunks = max(1, min(chunks, self.slots.free(self.slotKeys) + 1))
                     self.info.setSize(self.size)
                     self.info.createChunks(chunks)
                     self.info.save()
 
+                    if self.info.inplace:
+                        self._preallocate()
+
                 chunks = self.info.getCount()
+                self.chunkLimit = max(chunks, self.chunkLimit)
+                self.tuneNext = t + self.tuner.probeInterval if self.tuner else 0
 
                 init.setRange(self.info.getChunkRange(0))
 
                 for i in range(1, chunks):
                     c = HTTPChunk(i, self, self.info.getChunkRange(i), resume)
-
-                    handle = c.getHandle()
-                    if handle:
-                        self.chunks.append(c)
-                        self.m.add_handle(handle)
+                    if self.acquireSlot():
+                        self.startChunk(c)
                     else:
-                        #close immediatly
-                        self.log.debug("Invalid curl handle -> closed")
-                        c.close()
+                        self.pending.append(c) #resumed chunk, started when a slot is free
 
                 chunksCreated = True
 
@@ -201,8 +258,8 @@ class HTTPDownload():
 
             t = time()
 
-            # reduce these calls
-            while lastFinishCheck + 0.5 < t:
+            # reduce these calls, the engine collects finished transfers already
+            while lastFinishCheck + 0.5 < t or self.engine:
                 # list of failed curl handles
                 failed = []
                 ex = None # save only last exception, we can only raise one anyway
@@ -218,12 +275,16 @@ class HTTPDownload():
                         ex = e
                     else:
                         chunksDone.add(c)
+                        self.releaseSlot(chunk)
 
                 for c in err_list:
                     curl, errno, msg = c
                     chunk = self.findChunk(curl)
-                    #test if chunk was finished
-                    if errno != 23 or "0 !=" not in msg:
+                    if chunk.mismatch: # file on server probably changed, start again
+                        raise pycurl.error(33, "Resumed data does not match")
+
+                    #test if chunk was finished, newer libcurl versions changed the message
+                    if errno != 23 or ("0 !=" not in msg and "returned 0" not in msg):
                         failed.append(chunk)
                         ex = pycurl.error(errno, msg)
                         self.log.debug("Chunk %d failed: %s" % (chunk.id + 1, str(ex)))
@@ -237,6 +298,7 @@ class HTTPDownload():
                         ex = e
                     else:
                         chunksDone.add(curl)
+                        self.releaseSlot(chunk)
                 if not num_q: # no more infos to get
 
                     # check if init is not finished so we reset download connections
@@ -244,24 +306,36 @@ class HTTPDownload():
                     if failed and init not in failed and init.c not in chunksDone:
                         self.log.error(_("Download chunks failed, fallback to single connection | %s" % (str(ex))))
 
+                        if self.tuner: #host does not allow that many connections
+                            self.tuner.failed(self.host, len(self.chunks))
+                            self.tuned = True
+
                         #list of chunks to clean and remove
                         to_clean = filter(lambda x: x is not init, self.chunks)
                         for chunk in to_clean:
                             self.closeChunk(chunk)
                             self.chunks.remove(chunk)
-                            remove(fs_encode(self.info.getChunkName(chunk.id)))
+                            if not self.info.inplace: #inplace chunks share the file with init
+                                remove(fs_encode(self.info.getChunkName(chunk.id)))
+
+                        for chunk in self.pending:
+                            name = fs_encode(self.info.getChunkName(chunk.id))
+                            if not self.info.inplace and exists(name):
+                                remove(name)
+                        self.pending = []
 
                         #let first chunk load the rest and update the info file
+                        self.chunkSupport = False
                         init.resetRange()
                         self.info.clear()
-                        self.info.addChunk("%s.chunk0" % self.filename, (0, self.size))
+                        self.info.addChunk(self.info.chunkName(0), (0, self.size), init.arrived)
                         self.info.save()
                     elif failed:
                         raise ex
 
                     lastFinishCheck = t
 
-                    if len(chunksDone) >= len(self.chunks):
+                    if len(chunksDone) >= len(self.chunks) and not self.pending:
                         if len(chunksDone) > len(self.chunks):
                             self.log.warning("Finished download chunks size incorrect, please report bug.")
                         done = True  #all chunks loaded
@@ -271,6 +345,14 @@ class HTTPDownload():
             if done:
                 break #all chunks loaded
 
+            # waiting chunks get the slots of finished ones
+            while self.pending and self.acquireSlot():
+                self.startChunk(self.pending.pop(0))
+
+            # a connection became idle, let it take over a part of the slowest chunk
+            if chunksCreated and self.chunkSupport and not self.pending and len(self.chunks) - len(chunksDone) < self.chunkLimit:
+                self.splitChunk([c for c in self.chunks if c.c not in chunksDone])
+
             # calc speed once per second, averaging over 3 seconds
             if lastTimeCheck + 1 < t:
                 diff = [c.arrived - (self.lastArrived[i] if len(self.lastArrived) > i else 0) for i, c in
@@ -283,17 +365,188 @@ class HTTPDownload():
                 lastTimeCheck = t
                 self.updateProgress()
 
+                if self.tuner and chunksCreated and self.chunkSupport:
+                    self.tuneChunks(t, [c for c in self.chunks if c.c not in chunksDone])
+
+            if chunksCreated and lastCheckpoint + self.checkpointInterval < t:
+                self.checkpoint()
+                lastCheckpoint = t
+
             if self.abort:
+                self.checkpoint()
                 raise Abort()
 
             #sleep(0.003) #supress busy waiting - limits dl speed to  (1 / x) * buffersize
-            self.m.select(1)
+            if self.pauseFlow:
+                self.selectUnpaused(time())
+            else:
+                self.m.select(1)
 
         for chunk in self.chunks:
             chunk.flushFile() #make sure downloads are written to disk
 
+        self.digests = self.collectDigests()
         self._copyChunks()
 
+    def _preallocate(self):
+        """ reserves the complete file size, so every chunk can write at its own offset """
+        fo = open(fs_encode(self.info.getChunkName(0)), "rb+")
+        try:
+            fo.truncate(self.size) #sparse on most filesystems
+        finally:
+            fo.close()
+
+    def splitChunk(self, running):
+        """ splits the largest remaining range of the running chunks and starts a new chunk for the second half """
+        if not running: return
+
+        chunk = max(running, key=lambda c: c.size - c.arrived)
+        if chunk.size - chunk.arrived < self.minSplitSize: return
+        if not self.acquireSlot(): return #connection limit reached, try again later
+
+        start, end = chunk.range
+        middle = start + chunk.arrived + (chunk.size - chunk.arrived) / 2
+
+        # chunk will stop writing after middle, the new range is persisted before any data arrives
+        chunk.setRange((start, middle))
+        self.info.setChunkRange(chunk.id, (start, middle))
+        self.info.addChunk(self.info.chunkName(self.info.getCount()), (middle + 1, end))
+        self.info.save()
+
+        self.log.debug("Chunk %d splitted at %d" % (chunk.id + 1, middle))
+
+        c = HTTPChunk(self.info.getCount() - 1, self, (middle + 1, end), False)
+        self.startChunk(c)
+
+    def startChunk(self, chunk):
+        """ starts the transfer of a chunk that holds a slot """
+        handle = chunk.getHandle()
+        if handle:
+            self.holding.add(chunk)
+            self.chunks.append(chunk)
+            self.m.add_handle(handle)
+        else:
+            #close immediatly
+            self.log.debug("Invalid curl handle -> closed")
+            chunk.close()
+            if self.slots:
+                self.slots.release(self.slotKeys)
+
+    def acquireSlot(self):
+        """ takes a connection slot if one is free """
+        return not self.slots or self.slots.acquire(self.slotKeys)
+
+    def waitSlot(self):
+        """ waits for the slot of the first connection """
+        while self.slots and not self.slots.acquire(self.slotKeys, 1):
+            if self.abort:
+                raise Abort()
+
+    def releaseSlot(self, chunk):
+        if chunk in self.holding:
+            self.holding.discard(chunk)
+            if self.slots:
+                self.slots.release(self.slotKeys)
+
+    def tuneChunks(self, t, running):
+        """ adds connections while the total speed keeps rising """
+        if self.tuned or t < self.tuneNext: return
+
+        speed = sum(self.speeds)
+        if self.chunkLimit > len(running):
+            pass #remaining parts are too small for more connections, just wait
+        elif self.slots and self.slots.free(self.slotKeys) <= 0:
+            pass #no connection slot to probe with, try again later
+        elif self.tuneSpeed and speed < self.tuneSpeed * self.tuner.gain:
+            #last connection did not help, it will not be replaced once it finished
+            self.chunkLimit -= 1
+            self.tuned = True
+        elif self.chunkLimit >= self.maxChunks:
+            self.tuned = True
+        else:
+            self.tuneSpeed = speed
+            self.chunkLimit += 1
+            self.splitChunk(running)
+            self.log.debug("Trying %d connections for %s" % (self.chunkLimit, self.host))
+
+        if self.tuned:
+            self.log.debug("Using %d connections for %s" % (self.chunkLimit, self.host))
+            self.tuner.setCount(self.host, self.chunkLimit)
+
+        self.tuneNext = t + self.tuner.probeInterval
+
+    def selectUnpaused(self, t):
+        """ continues paused chunks that waited long enough and waits for data of the others """
+        timeout = 1
+        paused = False
+        for chunk in self.chunks:
+            if not chunk.paused: continue
+            if chunk.unpauseAt <= t:
+                chunk.unpause()
+            else:
+                timeout = min(timeout, chunk.unpauseAt - t)
+                paused = True
+
+        if self.engine:
+            self.m.select(timeout)
+            return
+
+        read, write, error = self.m.fdset()
+        wait = self.m.timeout()
+        if wait >= 0:
+            timeout = min(timeout, wait / 1000.0)
+        elif not paused:
+            timeout = 0.1 #transfers are finished, check for their results soon
+
+        if read or write or error:
+            select(read, write, error, timeout)
+        else:
+            sleep(timeout) #curl leaves out paused sockets, select would not wait at all
+
+    def checkpoint(self):
+        """ syncs all chunk files and records their progress in the journal """
+        #with the engine the chunk files are written in its thread, the buffers must be flushed there
+        flushed = self.engine.callWait(self.flushChunks) if self.engine else self.flushChunks()
+
+        for chunk, fd, arrived in flushed:
+            if fd is not None:
+                fsync(fd)
+            if chunk.id < self.info.getCount():
+                self.info.setChunkArrived(chunk.id, arrived)
+
+        self.info.saveJournal()
+
+    def flushChunks(self):
+        """ writes the buffers of the chunk files, returns (chunk, file descriptor, bytes on disk) for each """
+        flushed = []
+        for chunk in self.chunks:
+            fd = None
+            if chunk.fp and not chunk.fp.closed:
+                chunk.fp.flush()
+                fd = chunk.fp.fileno()
+            # bytes that are compared again were not verified yet
+            flushed.append((chunk, fd, chunk.arrived + chunk.verify))
+        return flushed
+
+    def collectDigests(self):
+        """ checksums of the complete file, if the chunks could compute them for all of its data """
+        if not self.checksums or len(self.chunks) != self.info.getCount():
+            return {} #chunks that were finished before did not compute anything
+
+        parts = sorted(self.chunks, key=lambda c: c.range[0] if c.range else 0)
+        if None in [c.hash for c in parts]: return {}
+
+        pos = 0
+        for c in parts:
+            if (c.range[0] if c.range else 0) != pos: return {}
+            pos += c.hash.length
+
+        if self.size and pos != self.size: return {}
+
+        if len(parts) == 1:
+            return parts[0].hash.digests()
+        return StreamHash.combine([c.hash for c in parts])
+
     def updateProgress(self):
         if self.progressNotify:
             self.progressNotify(self.percent)
@@ -310,6 +563,7 @@ class HTTPDownload():
             self.log.debug("Error removing chunk: %s" % str(e))
         finally:
             chunk.close()
+            self.releaseSlot(chunk)
 
     def close(self):
         """ cleanup """
@@ -326,15 +580,27 @@ class HTTPDownload():
             del self.info
 
 if __name__ == "__main__":
-    url = "http://speedtest.netcologne.de/test_100mb.bin"
-
+    import sys
     from Bucket import Bucket
 
-    bucket = Bucket()
-    bucket.setRate(200 * 1024)
-    bucket = None
+    url = sys.argv[1] if len(sys.argv) > 1 else "http://speedtest.netcologne.de/test_100mb.bin"
+    rate = int(sys.argv[2]) if len(sys.argv) > 2 else 1024 * 1024
+    options = {"interface": None, "proxies": {}, "ipv6": False}
+
+    print "benchmark with %d kb/s speed limit" % (rate / 1024)
+
+    # compares cpu time and achieved speed of both flow control modes
+    for mode in ("sleep", "pause"):
+        bucket = Bucket()
+        bucket.setRate(rate)
+        options["flowControl"] = mode
+
+        dwnld = HTTPDownload(url, "benchmark.bin", bucket=bucket, options=options)
+        start, cpu = time(), clock()
+        dwnld.download(chunks=3)
+        wall, cpu = time() - start, clock() - cpu
 
-    print "starting"
+        mb = getsize("benchmark.bin") / 1024.0 / 1024
+        remove("benchmark.bin")
 
-    dwnld = HTTPDownload(url, "test_100mb.bin", bucket=bucket)
-    dwnld.download(chunks=3, resume=True)
+        print "%s: %.2f MB in %.2fs, %.3fs cpu per MB, %.1f kb/s" % (mode, mb, wall, cpu / mb, mb * 1024 / wall)
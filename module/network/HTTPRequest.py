@@ -78,6 +78,10 @@ class HTTPRequest():
 
         self.headers = [] #temporary request header
 
+        self.pool = None #RequestPool the request returns to when it gets closed
+        self.loads = 0
+        self.connects = 0 #connections that were opened, the others were reused
+
         self.initHandle()
         self.setInterface(options)
 
@@ -86,6 +90,28 @@ class HTTPRequest():
 
         self.log = getLogger("log")
 
+    def reset(self, cookies, options):
+        """ makes the request usable like a new one, open connections and caches are kept """
+        #cookies and the share are not reset by curl
+        self.c.setopt(pycurl.COOKIELIST, "ALL")
+        self.c.unsetopt(pycurl.SHARE)
+        self.c.reset()
+
+        self.rep = None
+        self.cj = cookies
+        self.lastURL = None
+        self.lastEffectiveURL = None
+        self.abort = False
+        self.code = 0
+        self.header = ""
+        self.headers = []
+
+        self.initHandle()
+        self.setInterface(options)
+
+        self.c.setopt(pycurl.WRITEFUNCTION, self.write)
+        self.c.setopt(pycurl.HEADERFUNCTION, self.writeHeader)
+
 
     def initHandle(self):
         """ sets common options to curl handle """
@@ -145,6 +171,9 @@ class HTTPRequest():
         if "timeout" in options:
             self.c.setopt(pycurl.LOW_SPEED_TIME, options["timeout"])
 
+        if options.get("share"): #dns and ssl session cache shared by all requests
+            self.c.setopt(pycurl.SHARE, options["share"])
+
 
     def addCookies(self):
         """ put cookies from curl handle to cj """
@@ -226,6 +255,9 @@ class HTTPRequest():
         self.c.setopt(pycurl.POSTFIELDS, "")
         self.lastEffectiveURL = self.c.getinfo(pycurl.EFFECTIVE_URL)
 
+        self.loads += 1
+        self.connects += self.c.getinfo(pycurl.NUM_CONNECTS)
+
         self.addCookies()
 
         try:
@@ -319,6 +351,10 @@ class HTTPRequest():
 
     def close(self):
         """ cleanup, unusable after this """
+        if self.pool:
+            self.pool.release(self)
+            return
+
         if self.rep:
             self.rep.close()
             del self.rep
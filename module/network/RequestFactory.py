@@ -17,11 +17,18 @@
     @author: mkaay, RaNaN
 """
 
+import sys
+import pycurl
 from threading import Lock
+from weakref import WeakValueDictionary
 
 from Browser import Browser
-from Bucket import Bucket
-from HTTPRequest import HTTPRequest
+from Bucket import Bucket, FairBucket, BucketChain
+from ChunkTuner import ChunkTuner
+from ConnectionSlots import ConnectionSlots
+from CurlEngine import CurlEngine, engineAvailable
+from DownloadProcess import ProcessPool
+from RequestPool import RequestPool
 from CookieJar import CookieJar
 
 from XDCCRequest import XDCCRequest
@@ -31,24 +38,43 @@ class RequestFactory():
     def __init__(self, core):
         self.lock = Lock()
         self.core = core
-        self.bucket = Bucket()
+        self.bucket = FairBucket()
+        self.buckets = WeakValueDictionary() #limits of plugins, accounts and packages, while they are in use
         self.updateBucket()
+        self.tuner = ChunkTuner()
+        self.slots = ConnectionSlots() #limits the connections of all downloads
+        self.updateSlots()
+        self.checksums = () #digests every download computes while it runs, set by the checksum hook
+        self.engine = None #started on first use
+        self.engineLock = Lock()
         self.cookiejars = {}
 
+        #dns and ssl sessions are cached for all curl handles
+        self.share = pycurl.CurlShare()
+        self.share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_DNS)
+        self.share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_SSL_SESSION)
+        self.pool = RequestPool() #requests of getURL and getHTTPRequest with their open connections
+
+        #transfers of downloads can run in worker processes
+        self.processes = ProcessPool(self.core.config["download"]["process_workers"], self.core.forkServer)
+
     def iface(self):
         return self.core.config["download"]["interface"]
 
-    def getRequest(self, pluginName, account=None, type="HTTP", **kwargs):
+    def getRequest(self, pluginName, account=None, type="HTTP", package=None, **kwargs):
         self.lock.acquire()
 
         options = self.getOptions()
         options.update(kwargs)  # submit kwargs as additional options
+        options["slotOwner"] = (pluginName, account)
+
+        bucket = self.getBucketChain(pluginName, account, package)
 
         if type == "XDCC":
-            req = XDCCRequest(self.bucket, options)
+            req = XDCCRequest(bucket, options)
 
         else:
-            req = Browser(self.bucket, options)
+            req = Browser(bucket, options)
 
             if account:
                 cj = self.getCookieJar(pluginName, account)
@@ -63,11 +89,11 @@ class RequestFactory():
         """ returns a http request, dont forget to close it ! """
         options = self.getOptions()
         options.update(kwargs)  # submit kwargs as additional options
-        return HTTPRequest(CookieJar(None), options)
+        return self.pool.acquire(CookieJar(None), options)
 
     def getURL(self, *args, **kwargs):
         """ see HTTPRequest for argument list """
-        h = HTTPRequest(None, self.getOptions())
+        h = self.pool.acquire(None, self.getOptions())
         try:
             rep = h.load(*args, **kwargs)
         finally:
@@ -114,9 +140,79 @@ class RequestFactory():
 
     def getOptions(self):
         """returns options needed for pycurl"""
-        return {"interface": self.iface(),
-                "proxies"  : self.getProxies(),
-                "ipv6"     : self.core.config["download"]["ipv6"]}
+        return {"interface"         : self.iface(),
+                "proxies"           : self.getProxies(),
+                "ipv6"              : self.core.config["download"]["ipv6"],
+                "preallocate"       : self.core.config["download"]["preallocate"],
+                "checkpointInterval": self.core.config["download"]["checkpoint_interval"],
+                "verifyOverlap"     : self.core.config["download"]["resume_verify"] * 1024,
+                "flowControl"       : self.core.config["download"]["flow_control"],
+                "tuner"             : self.tuner if self.core.config["download"]["adaptive_chunks"] else None,
+                "engine"            : self.getEngine(),
+                "slots"             : self.slots,
+                "share"             : self.share,
+                "checksums"         : self.checksums,
+                "processes"         : self.processes if self.processes.size else None}
+
+    def getEngine(self):
+        """ returns the curl engine shared by all downloads, None if every download runs its own loop """
+        if not self.core.config["download"]["shared_engine"] or not engineAvailable():
+            return None
+
+        self.engineLock.acquire()
+        if not self.engine:
+            self.engine = CurlEngine()
+            self.engine.start()
+        self.engineLock.release()
+
+        return self.engine
+
+    def getStats(self):
+        """ reuse of pooled requests and their connections """
+        return self.pool.getStats()
+
+    def getBucketChain(self, pluginName, account=None, package=None):
+        """ returns the buckets a request draws from: global, plugin, account and package """
+        buckets = [self.bucket]
+        for key in (("plugin", pluginName), ("account", pluginName, account), ("package", package)):
+            if key[-1] is None: continue
+
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = Bucket()
+                bucket.setRate(self.getRate(key))
+                self.buckets[key] = bucket
+
+            buckets.append(bucket)
+
+        return BucketChain(buckets, package, self.getOrder(package))
+
+    def getOrder(self, package):
+        """ queue position of a package, requests without package come last """
+        pack = self.core.files.getPackage(package) if package is not None else None
+        return pack.order if pack else sys.maxint
+
+    def getRate(self, key):
+        """ speed limit in bytes per second for a bucket key, -1 for unlimited """
+        rate = 0
+        if key[0] == "plugin":
+            for limit in (self.core.config["download"]["plugin_speed"] or "").split(","):
+                name, sep, speed = limit.partition(":")
+                if name.strip() == key[1] and speed.strip().isdigit():
+                    rate = int(speed)
+
+        elif key[0] == "account":
+            plugin = self.core.accountManager.getAccountPlugin(key[1])
+            #not using getAccountData, requests are created while the account lock is held
+            if plugin and key[2] in plugin.accounts:
+                limit = plugin.accounts[key[2]]["options"].get("limitSpeed", ["0"])
+                if limit and str(limit[0]).isdigit():
+                    rate = int(limit[0])
+
+        elif key[0] == "package":
+            rate = self.core.config["download"]["package_speed"]
+
+        return rate * 1024 if rate > 0 else -1
 
     def updateBucket(self):
         """ set values in the bucket according to settings"""
@@ -125,6 +221,18 @@ class RequestFactory():
         else:
             self.bucket.setRate(self.core.config["download"]["max_speed"] * 1024)
 
+        for key, bucket in self.buckets.items():
+            bucket.setRate(self.getRate(key))
+
+        for flow in self.bucket.flows.keys(): #queue may have been reordered
+            flow.order = self.getOrder(flow.package)
+
+    def updateSlots(self):
+        """ set connection limits according to settings """
+        self.slots.setLimits(self.core.config["download"]["max_connections"],
+                             self.core.config["download"]["host_connections"],
+                             self.core.config["download"]["account_connections"])
+
 
 # needs pyreq in global namespace
 def getURL(*args, **kwargs):
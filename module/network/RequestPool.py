@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 3 of the License,
+    or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+    See the GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""
+
+from threading import Lock
+
+from HTTPRequest import HTTPRequest
+
+class RequestPool():
+    """ keeps closed requests with their keep-alive connections, so the next request can reuse them """
+
+    def __init__(self, size=4):
+        self.size = size #idle requests to keep at most
+        self.idle = []
+        self.lock = Lock()
+
+        self.created = 0 #requests that had to be created
+        self.reused = 0 #requests taken from the pool
+        self.loads = 0 #pages loaded by returned requests
+        self.connects = 0 #new connections they needed for it
+
+    def acquire(self, cookies, options):
+        """ returns a request, closing it gives it back to the pool """
+        self.lock.acquire()
+        req = self.idle.pop() if self.idle else None
+        if req:
+            self.reused += 1
+        else:
+            self.created += 1
+        self.lock.release()
+
+        if req:
+            req.reset(cookies, options)
+        else:
+            req = HTTPRequest(cookies, options)
+
+        req.pool = self
+        return req
+
+    def release(self, req):
+        req.pool = None
+
+        self.lock.acquire()
+        self.loads += req.loads
+        self.connects += req.connects
+        req.loads = req.connects = 0
+
+        keep = not req.abort and hasattr(req, "c") and len(self.idle) < self.size
+        if keep:
+            self.idle.append(req)
+        self.lock.release()
+
+        if not keep:
+            req.close()
+
+    def getStats(self):
+        """ numbers about handle and connection reuse """
+        self.lock.acquire()
+        stats = {"created": self.created,
+                 "reused": self.reused,
+                 "idle": len(self.idle),
+                 "loads": self.loads,
+                 "connects": self.connects,
+                 "connectionsReused": max(0, self.loads - self.connects)}
+        self.lock.release()
+        return stats
+
+    def close(self):
+        self.lock.acquire()
+        idle, self.idle = self.idle, []
+        self.lock.release()
+
+        for req in idle:
+            req.close()
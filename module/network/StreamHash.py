@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 3 of the License,
+    or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+    See the GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import zlib
+
+#checksums of single chunks can be combined to the checksum of the whole file
+COMBINABLE = ("crc32", "adler32")
+
+def crc32Combine(crc1, crc2, len2):
+    """ crc32 of two concatenated blocks, like crc32_combine of zlib """
+    if len2 <= 0: return crc1
+
+    def times(mat, vec):
+        sum, i = 0, 0
+        while vec:
+            if vec & 1: sum ^= mat[i]
+            vec >>= 1
+            i += 1
+        return sum
+
+    def square(mat):
+        return [times(mat, mat[n]) for n in range(32)]
+
+    #operator for one zero bit, squared for two and four zero bits
+    odd = [0xedb88320] + [1 << n for n in range(31)]
+    even = square(odd)
+    odd = square(even)
+
+    #apply len2 zero bytes to crc1
+    while True:
+        even = square(odd)
+        if len2 & 1: crc1 = times(even, crc1)
+        len2 >>= 1
+        if not len2: break
+
+        odd = square(even)
+        if len2 & 1: crc1 = times(odd, crc1)
+        len2 >>= 1
+        if not len2: break
+
+    return crc1 ^ crc2
+
+def adler32Combine(adler1, adler2, len2):
+    """ adler32 of two concatenated blocks, like adler32_combine of zlib """
+    base = 65521
+    rem = len2 % base
+    sum1 = adler1 & 0xffff
+    sum2 = (rem * sum1) % base
+    sum1 += (adler2 & 0xffff) + base - 1
+    sum2 += ((adler1 >> 16) & 0xffff) + ((adler2 >> 16) & 0xffff) + base - rem
+    return (sum1 % base) | ((sum2 % base) << 16)
+
+
+class StreamHash():
+    """ computes checksums of data while it is downloaded """
+
+    def __init__(self, algorithms, ordered=True):
+        self.length = 0 #bytes hashed so far
+        self.hashes = {}
+        self.sums = {}
+
+        for name in algorithms:
+            if name in COMBINABLE:
+                self.sums[name] = getattr(zlib, name)("")
+            elif ordered and name in getattr(hashlib, "algorithms", ("md5", "sha1", "sha224", "sha256", "sha384", "sha512")):
+                self.hashes[name] = getattr(hashlib, name)()
+
+    def unordered(self):
+        """ data will not cover the whole file, only combinable checksums are useful """
+        self.hashes = {}
+
+    def update(self, data):
+        for h in self.hashes.itervalues():
+            h.update(data)
+        for name, value in self.sums.items():
+            self.sums[name] = getattr(zlib, name)(data, value)
+
+        self.length += len(data)
+
+    def getSum(self, name):
+        """ unsigned value of a combinable checksum """
+        return self.sums[name] & 0xFFFFFFFF
+
+    def digests(self):
+        """ hex digests of all checksums, in the format the Checksum hook uses """
+        result = dict([(name, h.hexdigest()) for name, h in self.hashes.iteritems()])
+        for name in self.sums:
+            result[name] = "%x" % self.getSum(name)
+        return result
+
+    @staticmethod
+    def combine(parts):
+        """ hex digests of the combinable checksums of consecutive parts """
+        result = {}
+        for name in COMBINABLE:
+            if not all([name in p.sums for p in parts]): continue
+
+            merge = crc32Combine if name == "crc32" else adler32Combine
+            value = parts[0].getSum(name)
+            for p in parts[1:]:
+                value = merge(value, p.getSum(name), p.length)
+            result[name] = "%x" % value
+
+        return result
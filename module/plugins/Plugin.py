@@ -186,7 +186,7 @@ class Plugin(Base):
             #: premium status
             self.premium = self.account.isPremium(self.user)
         else:
-            self.req = pyfile.m.core.requestFactory.getRequest(self.__name__)
+            self.req = pyfile.m.core.requestFactory.getRequest(self.__name__, package=pyfile.package().id)
 
         #: associated pyfile instance, see `PyFile`
         self.pyfile = pyfile
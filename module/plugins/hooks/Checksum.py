@@ -9,6 +9,8 @@ import re
 import time
 import zlib
 
+from module.network.Browser import Browser
+
 from ..internal.Addon import Addon
 from ..internal.misc import encode, format_time, fsjoin, threaded
 
@@ -63,7 +65,7 @@ def compute_checksum(local_file, algorithm, progress_notify=None, abort=None):
 class Checksum(Addon):
     __name__ = "Checksum"
     __type__ = "hook"
-    __version__ = "0.34"
+    __version__ = "0.36"
     __status__ = "testing"
 
     __config__ = [("activated", "bool", "Activated", False),
@@ -71,7 +73,8 @@ class Checksum(Addon):
                   ("check_action", "fail;retry;nothing", "What to do if check fails?", "retry"),
                   ("max_tries", "int", "Number of retries", 2),
                   ("retry_action", "fail;nothing", "What to do if all retries fail?", "fail"),
-                  ("wait_time", "int", "Time to wait before each retry (seconds)", 1)]
+                  ("wait_time", "int", "Time to wait before each retry (seconds)", 1),
+                  ("inline_checksum", "str", "Checksums to compute while downloading (comma separated)", "md5,sha1,crc32")]
 
     __description__ = """Verify downloaded file size and checksum"""
     __license__ = "GPLv3"
@@ -93,6 +96,22 @@ class Checksum(Addon):
         if not self.config.get('check_checksum'):
             self.log_info(_("Checksum validation is disabled in plugin configuration"))
 
+        self.set_inline(self.config.get('check_checksum'), self.config.get('inline_checksum'))
+
+    def deactivate(self):
+        self.set_inline(False, "")
+
+    def config_changed(self, category, option, value, section):
+        #: Dispatched before the new value is stored
+        if category != self.classname or section != "plugin":
+            return
+
+        if option == "check_checksum":
+            self.set_inline(value in (True, "True", "true", "1"), self.config.get('inline_checksum'))
+
+        elif option == "inline_checksum":
+            self.set_inline(self.config.get('check_checksum'), value)
+
     def init(self):
         self.algorithms = sorted(
             getattr(hashlib, "algorithms", ("md5", "sha1", "sha224", "sha256", "sha384", "sha512")), reverse=True)
@@ -103,6 +122,28 @@ class Checksum(Addon):
 
         self.retries = {}
 
+    def set_inline(self, enabled, algorithms):
+        """
+        Algorithms the requests of new downloads compute while downloading,
+        plugins replace their request in `_setup` so it can't be set per download
+        """
+        algorithms = [a.strip().replace("-", "").lower() for a in algorithms.split(",")] if enabled else []
+        self.pyload.requestFactory.checksums = tuple(a for a in algorithms if a in self.algorithms)
+
+    def inline_checksum(self, pyfile, local_file, algorithm):
+        """
+        Checksum computed while the file was downloaded, None if it is not available
+        """
+        req = pyfile.plugin.req
+        if not isinstance(req, Browser) or algorithm not in req.digests:
+            return None
+
+        #: The digest belongs to the last download of the plugin
+        if os.path.getsize(local_file) != req.size:
+            return None
+
+        return req.digests[algorithm]
+
     def download_finished(self, pyfile):
         """
         Compute checksum for the downloaded file and compare it with the hash provided by the hoster.
@@ -161,14 +202,19 @@ class Checksum(Addon):
             if len(data['hash']) > 0:
                 for key in self.algorithms:
                     if key in data['hash']:
-                        pyfile.setCustomStatus(_("checksum verifying"))
-                        try:
-                            checksum = compute_checksum(local_file,
-                                                        key.replace("-", "").lower(),
-                                                        progress_notify=pyfile.setProgress,
-                                                        abort=lambda: pyfile.abort)
-                        finally:
-                            pyfile.setStatus("processing")
+                        checksum = self.inline_checksum(pyfile, local_file, key.replace("-", "").lower())
+                        if checksum is not None:
+                            self.log_debug("Using %s checksum computed while downloading" % key.upper())
+
+                        else:
+                            pyfile.setCustomStatus(_("checksum verifying"))
+                            try:
+                                checksum = compute_checksum(local_file,
+                                                            key.replace("-", "").lower(),
+                                                            progress_notify=pyfile.setProgress,
+                                                            abort=lambda: pyfile.abort)
+                            finally:
+                                pyfile.setStatus("processing")
 
                         if checksum is False:
                             continue
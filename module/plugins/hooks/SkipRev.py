@@ -2,15 +2,13 @@
 
 import re
 
-from module.PyFile import PyFile
-
 from ..internal.Addon import Addon
 
 
 class SkipRev(Addon):
     __name__ = "SkipRev"
     __type__ = "hook"
-    __version__ = "0.38"
+    __version__ = "0.39"
     __status__ = "testing"
 
     __config__ = [("activated", "bool", "Activated", False),
@@ -24,19 +22,6 @@ class SkipRev(Addon):
     def _name(self, pyfile):
         return pyfile.pluginclass.get_info(pyfile.url)['name']
 
-    def _create_pyFile(self, data):
-        pylink = self.pyload.api._convertPyFile(data)
-        return PyFile(self.pyload.files,
-                      pylink.fid,
-                      pylink.url,
-                      pylink.name,
-                      pylink.size,
-                      pylink.status,
-                      pylink.error,
-                      pylink.plugin,
-                      pylink.packageID,
-                      pylink.order)
-
     def download_preparing(self, pyfile):
         name = self._name(pyfile)
 
@@ -89,7 +74,8 @@ class SkipRev(Addon):
 
         for fid, fdata in pyfile.package().getChildren().items():
             if fdata['status'] == 4 and pyname.match(fdata['name']):
-                pyfile_new = self._create_pyFile(fdata)
+                #: Cached or loaded instance, it has the order key of the database
+                pyfile_new = self.pyload.files.getFile(fid)
 
                 if revtokeep > -1 or pyfile.name.endswith(".rev"):
                     pyfile_new.setStatus("queued")
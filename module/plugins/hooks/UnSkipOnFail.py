@@ -1,14 +1,12 @@
 # -*- coding: utf-8 -*-
 
-from module.PyFile import PyFile
-
 from ..internal.Addon import Addon
 
 
 class UnSkipOnFail(Addon):
     __name__ = "UnSkipOnFail"
     __type__ = "hook"
-    __version__ = "0.14"
+    __version__ = "0.15"
     __status__ = "testing"
 
     __config__ = [("activated", "bool", "Activated", True)]
@@ -31,10 +29,10 @@ class UnSkipOnFail(Addon):
             #: "link" has to be a valid FileData object,
             #: "new_status" has to be a valid status name
             #: (i.e. "queued" for this Plugin)
-            #: It creates a temporary PyFile object using
-            #: "link" data, changes its status, and tells
-            #: The pyload.files-manager to save its data.
-            pyfile_new = self._create_pyFile(link)
+            #: It gets the PyFile object of "link" from
+            #: the pyload.files-manager, changes its status,
+            #: and tells the manager to save its data.
+            pyfile_new = self.pyload.files.getFile(link.fid)
 
             pyfile_new.setCustomStatus(_("unskipped"), "queued")
 
@@ -70,15 +68,3 @@ class UnSkipOnFail(Addon):
                 #: and at last check if it is not pyfile itself
                 if link.name == pyfile.name and link.fid != pyfile.id:
                     return link
-
-    def _create_pyFile(self, pylink):
-        return PyFile(self.pyload.files,
-                      pylink.fid,
-                      pylink.url,
-                      pylink.name,
-                      pylink.size,
-                      pylink.status,
-                      pylink.error,
-                      pylink.plugin,
-                      pylink.packageID,
-                      pylink.order)
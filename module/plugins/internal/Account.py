@@ -210,6 +210,7 @@ class Account(Plugin):
             self.info = self._grab_info()
 
             self.syncback()
+            self.pyload.threadManager.wake("account") #: Account may allow new downloads now
 
             self.log_debug(
                 "Account info for user `%s`: %s" %
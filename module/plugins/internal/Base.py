@@ -26,7 +26,7 @@ def parse_fileInfo(klass, url="", html=""):
 class Base(Plugin):
     __name__ = "Base"
     __type__ = "base"
-    __version__ = "0.34"
+    __version__ = "0.35"
     __status__ = "stable"
 
     __pattern__ = r'^unmatchable$'
@@ -151,13 +151,15 @@ class Base(Plugin):
         except Exception:
             pass
 
+        package = self.pyfile.package().id
+
         if self.account:
             self.req = self.pyload.requestFactory.getRequest(
-                self.classname, self.account.user)
+                self.classname, self.account.user, package=package)
             # @NOTE: Avoid one unnecessary get_info call by `self.account.premium` here
             self.premium = self.account.info['data']['premium']
         else:
-            self.req = self.pyload.requestFactory.getRequest(self.classname)
+            self.req = self.pyload.requestFactory.getRequest(self.classname, package=package)
             self.premium = False
 
         self.req.setOption("timeout", 60)  # @TODO: Remove in 0.4.10
@@ -331,6 +333,9 @@ class Base(Plugin):
         """
         Waits the time previously set
         """
+        if self.thread is None:
+            self.fail(_("Waiting is not possible while resolving the link ahead"))
+
         if seconds is not None:
             self.set_wait(seconds)
 
@@ -358,9 +363,17 @@ class Base(Plugin):
                 self.log_warning(_("Reconnection ignored due logged account"))
 
         if not self.wantReconnect or self.account:
-            while self.pyfile.waitUntil > time.time():
-                self.check_status()
-                time.sleep(2)
+            #: Another download can use the slot while waiting
+            self.thread.m.parkThread(self.thread)
+            try:
+                while self.pyfile.waitUntil > time.time():
+                    self.check_status()
+                    time.sleep(min(2, max(0, self.pyfile.waitUntil - time.time())))
+
+                self.thread.m.resumeThread(self.thread, self.check_status)
+
+            finally:
+                self.thread.m.releaseThread(self.thread)
 
         else:
             while self.pyfile.waitUntil > time.time():
@@ -14,7 +14,7 @@ from .misc import encode, parse_name, parse_size, parse_time, replace_patterns
 class SimpleHoster(Hoster):
     __name__ = "SimpleHoster"
     __type__ = "hoster"
-    __version__ = "2.28"
+    __version__ = "2.29"
     __status__ = "stable"
 
     __pattern__ = r'^unmatchable$'
@@ -105,6 +105,8 @@ class SimpleHoster(Hoster):
     #: Set to encoding name if encoding value in http header is not correct
     TEXT_ENCODING = True
     # TRANSLATE_ERROR      = True
+    #: Seconds a link resolved ahead of the download stays valid
+    LINK_LIFETIME = 300
 
     LINK_PATTERN = None
     LINK_FREE_PATTERN = None
@@ -256,11 +258,52 @@ class SimpleHoster(Hoster):
                               ref=False,
                               decode=self.TEXT_ENCODING)
 
+    def prefetch(self, pyfile):
+        """
+        Resolve the premium download link while other downloads run, returns the link or None
+        """
+        if self.__class__.process.im_func is not SimpleHoster.process.im_func:
+            return None  #: Own process would not use the link
+
+        if not self.config.get('use_premium', True):
+            return None
+
+        self.load_account()
+        if not self.account or not self.account.info['data']['premium']:
+            return None
+
+        self.req.close()
+        self.req = self.pyload.requestFactory.getRequest(
+            self.classname, self.account.user, package=pyfile.packageid)
+        self.premium = True
+
+        self.setup_base()
+        self.setup()
+        self._prepare()
+
+        if self.leech_dl:
+            self.handle_multi(pyfile)
+
+        else:
+            if self.direct_dl:
+                self.handle_direct(pyfile)
+
+            if not self.link:
+                self._preload()
+                self.handle_premium(pyfile)
+
+        return self.link
+
     def process(self, pyfile):
         self._prepare()
 
+        if self.premium and self.thread:
+            self.link = self.thread.m.prefetcher.take(pyfile) or ""
+            if self.link:
+                self.log_info(_("Using download link resolved ahead"))
+
         #@TODO: Remove `handle_multi`, use MultiHoster instead
-        if self.leech_dl:
+        if not self.link and self.leech_dl:
             self.log_info(_("Processing as debrid download..."))
             self.handle_multi(pyfile)
 
@@ -89,9 +89,9 @@ class ConfigSection(BaseObject):
 		self.outline = outline
 
 class DownloadInfo(BaseObject):
-	__slots__ = ['fid', 'name', 'speed', 'eta', 'format_eta', 'bleft', 'size', 'format_size', 'percent', 'status', 'statusmsg', 'format_wait', 'wait_until', 'packageID', 'packageName', 'plugin']
+	__slots__ = ['fid', 'name', 'speed', 'eta', 'format_eta', 'bleft', 'size', 'format_size', 'percent', 'status', 'statusmsg', 'format_wait', 'wait_until', 'packageID', 'packageName', 'plugin', 'share']
 
-	def __init__(self, fid=None, name=None, speed=None, eta=None, format_eta=None, bleft=None, size=None, format_size=None, percent=None, status=None, statusmsg=None, format_wait=None, wait_until=None, packageID=None, packageName=None, plugin=None):
+	def __init__(self, fid=None, name=None, speed=None, eta=None, format_eta=None, bleft=None, size=None, format_size=None, percent=None, status=None, statusmsg=None, format_wait=None, wait_until=None, packageID=None, packageName=None, plugin=None, share=None):
 		self.fid = fid
 		self.name = name
 		self.speed = speed
@@ -108,6 +108,7 @@ class DownloadInfo(BaseObject):
 		self.packageID = packageID
 		self.packageName = packageName
 		self.plugin = plugin
+		self.share = share
 
 class EventInfo(BaseObject):
 	__slots__ = ['eventname', 'id', 'type', 'destination']
@@ -196,9 +197,9 @@ class PackageDoesNotExists(Exception):
 		self.pid = pid
 
 class ServerStatus(BaseObject):
-	__slots__ = ['pause', 'active', 'queue', 'total', 'speed', 'download', 'reconnect']
+	__slots__ = ['pause', 'active', 'queue', 'total', 'speed', 'download', 'reconnect', 'pools']
 
-	def __init__(self, pause=None, active=None, queue=None, total=None, speed=None, download=None, reconnect=None):
+	def __init__(self, pause=None, active=None, queue=None, total=None, speed=None, download=None, reconnect=None, pools=None):
 		self.pause = pause
 		self.active = active
 		self.queue = queue
@@ -206,6 +207,7 @@ class ServerStatus(BaseObject):
 		self.speed = speed
 		self.download = download
 		self.reconnect = reconnect
+		self.pools = pools
 
 class ServiceCall(BaseObject):
 	__slots__ = ['plugin', 'func', 'arguments', 'parseArguments']
@@ -239,6 +241,18 @@ class UserData(BaseObject):
 		self.permission = permission
 		self.templateName = templateName
 
+class WorkerPoolStatus(BaseObject):
+	__slots__ = ['name', 'size', 'queued', 'running', 'done', 'avgWait', 'avgRun']
+
+	def __init__(self, name=None, size=None, queued=None, running=None, done=None, avgWait=None, avgRun=None):
+		self.name = name
+		self.size = size
+		self.queued = queued
+		self.running = running
+		self.done = done
+		self.avgWait = avgWait
+		self.avgRun = avgRun
+
 class Iface:
 	def addFiles(self, pid, links):
 		pass
@@ -81,6 +81,17 @@ struct DownloadInfo {
   14: PackageID packageID,
   15: string packageName,
   16: PluginName plugin,
+  17: Progress share,
+}
+
+struct WorkerPoolStatus {
+  1: string name,
+  2: i16 size,
+  3: i32 queued,
+  4: i16 running,
+  5: i64 done,
+  6: double avgWait,
+  7: double avgRun
 }
 
 struct ServerStatus {
@@ -90,7 +101,8 @@ struct ServerStatus {
   4: i16 total,
   5: i64 speed,
   6: bool download,
-  7: bool reconnect
+  7: bool reconnect,
+  8: list<WorkerPoolStatus> pools
 }
 
 struct ConfigItem {
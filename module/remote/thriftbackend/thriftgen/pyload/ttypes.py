@@ -167,6 +167,7 @@ class DownloadInfo(TBase):
    - packageID
    - packageName
    - plugin
+   - share
   """
 
   __slots__ = [ 
@@ -186,6 +187,7 @@ class DownloadInfo(TBase):
     'packageID',
     'packageName',
     'plugin',
+    'share',
    ]
 
   thrift_spec = (
@@ -206,9 +208,10 @@ class DownloadInfo(TBase):
     (14, TType.I32, 'packageID', None, None, ), # 14
     (15, TType.STRING, 'packageName', None, None, ), # 15
     (16, TType.STRING, 'plugin', None, None, ), # 16
+    (17, TType.BYTE, 'share', None, None, ), # 17
   )
 
-  def __init__(self, fid=None, name=None, speed=None, eta=None, format_eta=None, bleft=None, size=None, format_size=None, percent=None, status=None, statusmsg=None, format_wait=None, wait_until=None, packageID=None, packageName=None, plugin=None,):
+  def __init__(self, fid=None, name=None, speed=None, eta=None, format_eta=None, bleft=None, size=None, format_size=None, percent=None, status=None, statusmsg=None, format_wait=None, wait_until=None, packageID=None, packageName=None, plugin=None, share=None,):
     self.fid = fid
     self.name = name
     self.speed = speed
@@ -225,6 +228,50 @@ class DownloadInfo(TBase):
     self.packageID = packageID
     self.packageName = packageName
     self.plugin = plugin
+    self.share = share
+
+
+class WorkerPoolStatus(TBase):
+  """
+  Attributes:
+   - name
+   - size
+   - queued
+   - running
+   - done
+   - avgWait
+   - avgRun
+  """
+
+  __slots__ = [ 
+    'name',
+    'size',
+    'queued',
+    'running',
+    'done',
+    'avgWait',
+    'avgRun',
+   ]
+
+  thrift_spec = (
+    None, # 0
+    (1, TType.STRING, 'name', None, None, ), # 1
+    (2, TType.I16, 'size', None, None, ), # 2
+    (3, TType.I32, 'queued', None, None, ), # 3
+    (4, TType.I16, 'running', None, None, ), # 4
+    (5, TType.I64, 'done', None, None, ), # 5
+    (6, TType.DOUBLE, 'avgWait', None, None, ), # 6
+    (7, TType.DOUBLE, 'avgRun', None, None, ), # 7
+  )
+
+  def __init__(self, name=None, size=None, queued=None, running=None, done=None, avgWait=None, avgRun=None,):
+    self.name = name
+    self.size = size
+    self.queued = queued
+    self.running = running
+    self.done = done
+    self.avgWait = avgWait
+    self.avgRun = avgRun
 
 
 class ServerStatus(TBase):
@@ -237,6 +284,7 @@ class ServerStatus(TBase):
    - speed
    - download
    - reconnect
+   - pools
   """
 
   __slots__ = [ 
@@ -247,6 +295,7 @@ class ServerStatus(TBase):
     'speed',
     'download',
     'reconnect',
+    'pools',
    ]
 
   thrift_spec = (
@@ -258,9 +307,10 @@ class ServerStatus(TBase):
     (5, TType.I64, 'speed', None, None, ), # 5
     (6, TType.BOOL, 'download', None, None, ), # 6
     (7, TType.BOOL, 'reconnect', None, None, ), # 7
+    (8, TType.LIST, 'pools', (TType.STRUCT,(WorkerPoolStatus, WorkerPoolStatus.thrift_spec)), None, ), # 8
   )
 
-  def __init__(self, pause=None, active=None, queue=None, total=None, speed=None, download=None, reconnect=None,):
+  def __init__(self, pause=None, active=None, queue=None, total=None, speed=None, download=None, reconnect=None, pools=None,):
     self.pause = pause
     self.active = active
     self.queue = queue
@@ -268,6 +318,7 @@ class ServerStatus(TBase):
     self.speed = speed
     self.download = download
     self.reconnect = reconnect
+    self.pools = pools
 
 
 class ConfigItem(TBase):
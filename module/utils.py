@@ -9,6 +9,7 @@ import re
 from os.path import join
 from string import maketrans
 from htmlentitydefs import name2codepoint
+from urlparse import urlparse
 
 def chmod(*args):
     try:
@@ -117,6 +118,14 @@ def freeSpace(folder):
         return s.f_bsize * s.f_bavail
 
 
+def urlHost(url):
+    """ lowercase host of an url, empty if it has none """
+    try:
+        return (urlparse(url).hostname or "").lower()
+    except ValueError:
+        return ""
+
+
 def uniqify(seq, idfun=None):
 # order preserving
     if idfun is None:
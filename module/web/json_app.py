@@ -32,6 +32,7 @@ def get_sort_key(item):
 def status():
     try:
         status = toDict(PYLOAD.statusServer())
+        status['pools'] = [toDict(x) for x in status['pools'] or []]
         status['captcha'] = PYLOAD.isCaptchaWaiting()
         return status
     except:
@@ -46,8 +46,10 @@ from module.ConfigParser import ConfigParser
 from module.plugins.PluginManager import PluginManager
 from module.PullEvents import PullManager
 from module.network.RequestFactory import RequestFactory
+from module.network.DownloadProcess import ForkServer
 from module.web.ServerThread import WebServer
 from module.Scheduler import Scheduler
+from module.Cluster import Cluster
 from module.common.JsEngine import JsEngine
 from module import remote
 from module.remote.RemoteManager import RemoteManager
@@ -86,13 +88,14 @@ class Core(object):
         self.arg_links = []
         self.pidfile = "pyload.pid"
         self.deleteLinks = False # will delete links on startup
+        self.rebuildStats = False # will recount the package statistics on startup
 
         if len(argv) > 1:
             try:
                 options, args = getopt(argv[1:], 'vchdusqp:',
                     ["version", "clear", "clean", "help", "debug", "user",
                      "setup", "configdir=", "changedir", "daemon",
-                     "quit", "status", "no-remote","pidfile="])
+                     "quit", "status", "no-remote","pidfile=", "rebuild-stats"])
 
                 for option, argument in options:
                     if option in ("-v", "--version"):
@@ -104,6 +107,8 @@ class Core(object):
                         self.daemon = True
                     elif option in ("-c", "--clear"):
                         self.deleteLinks = True
+                    elif option == "--rebuild-stats":
+                        self.rebuildStats = True
                     elif option in ("-h", "--help"):
                         self.print_help()
                         exit()
@@ -175,6 +180,7 @@ class Core(object):
         print "  --no-remote", " " * 12, "Disable remote access (saves RAM)"
         print "  --status", " " * 15, "Display pid if running or False"
         print "  --clean", " " * 16, "Remove .pyc/.pyo files"
+        print "  --rebuild-stats", " " * 8, "Recount the link statistics of all packages"
         print "  -q, --quit", " " * 13, "Quit running pyLoad instance"
         print "  -h, --help", " " * 13, "Display this help screen"
         print ""
@@ -372,7 +378,11 @@ class Core(object):
         if self.config['ssl']['activated']:
             self.check_install("OpenSSL", _("OpenSSL for secure connection"))
 
+        #workers for downloads are forked by this process, it starts while the core has no other threads
+        self.forkServer = ForkServer()
+
         self.setupDB()
+        self.cluster = Cluster(self) if self.config['cluster']['activated'] else None
         if self.config.oldRemoteData:
             self.log.info(_("Moving old user config to DB"))
             self.db.addUser(self.config.oldRemoteData["username"], self.config.oldRemoteData["password"])
@@ -383,6 +393,18 @@ class Core(object):
             self.log.info(_("All links removed"))
             self.db.purgeLinks()
 
+        if self.rebuildStats:
+            self.log.info(_("Recounting package statistics"))
+            self.db.rebuildPackageStats()
+        elif self.db.converted is not None: #counters are only checked when the schema changed
+            wrong = self.db.checkPackageStats()
+            if wrong and self.config['cluster']['activated']:
+                #other cores use the same file, only one of them should recount
+                self.log.warning(_("Statistics of %d packages are wrong, start one core with --rebuild-stats") % len(wrong))
+            elif wrong:
+                self.log.warning(_("Statistics of %d packages were wrong and are recounted") % len(wrong))
+                self.db.rebuildPackageStats()
+
         self.requestFactory = RequestFactory(self)
         __builtin__.pyreq = self.requestFactory
 
@@ -444,6 +466,9 @@ class Core(object):
         self.log.info(_("Activating Accounts..."))
         self.accountManager.getAccountInfos()
 
+        if self.cluster:
+            self.cluster.start()
+
         self.threadManager.pause = False
         self.running = True
 
@@ -468,10 +493,12 @@ class Core(object):
 
         while True:
             try:
-                sleep(2)
+                #jobs are assigned on events, the timeout is a fallback for housekeeping
+                reasons = self.threadManager.waitForEvent(self.scheduler.timeout(2))
             except IOError, e:
                 if e.errno != 4:  # errno.EINTR
                     raise
+                reasons = ()
 
             if self.do_restart:
                 self.log.info(_("restarting pyLoad"))
@@ -483,7 +510,7 @@ class Core(object):
                 self.removeLogger()
                 _exit(0) #@TODO thrift blocks shutdown
 
-            self.threadManager.work()
+            self.threadManager.work(reasons)
             self.scheduler.work()
 
     def setupDB(self):
@@ -606,8 +633,17 @@ class Core(object):
 
             for pyfile in pyfiles:
                 pyfile.abortDownload()
+            self.threadManager.requeueRetries()
 
             self.hookManager.coreExiting()
+            self.log.debug("Connection reuse: %s" % self.requestFactory.getStats())
+            self.log.debug("Job dispatch: %s" % self.threadManager.getDispatchStats())
+            self.log.debug("Worker pools: %s" % self.threadManager.getPoolStats())
+            self.log.debug("Link prefetch: %s" % self.threadManager.prefetcher.getStats())
+            self.log.debug("Database latency: %s" % self.db.getLatencyStats())
+            self.requestFactory.processes.shutdown()
+            if self.cluster:
+                self.cluster.shutdown()
 
         except:
             if self.debug:
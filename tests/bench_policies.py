@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Simulates downloading a synthetic queue with every queue policy and
+    reports the mean time until a package is complete.
+
+    usage: python tests/bench_policies.py [downloads] [seed]
+"""
+
+import sys
+from os.path import abspath, dirname, join
+from random import Random
+
+sys.path.insert(0, abspath(join(dirname(__file__), "..")))
+
+from module.QueuePolicy import policies, getPolicy, DeadlinePolicy
+from module.database.JobQueue import JobQueue
+
+SPEED = 1024 * 1024 #bytes per second of one download
+
+
+def syntheticQueue(rnd, packages=20):
+    """ (id, plugin, package, queue, packageorder, linkorder, size, url) of packages with mixed sizes """
+    links = []
+    for pid in range(packages):
+        count = rnd.choice((1, 2, 5, 10, 30))
+        size = rnd.choice((5, 50, 300, 1000)) * 1024 * 1024
+        for order in range(count):
+            links.append((len(links) + 1, "Hoster%d" % (pid % 4), pid, 1, pid, order, int(size * rnd.uniform(0.8, 1.2)),
+                          "http://hoster%d/%d" % (pid % 4, len(links))))
+    return links
+
+
+def simulate(policy, links, downloads):
+    """ seconds until each package is complete, downloads run in parallel with SPEED each """
+    queue = JobQueue(lambda: links)
+    queue.setPolicy(policy)
+    sizes = dict([(l[0], (l[2], l[6])) for l in links])
+    left = {} #package -> links not finished
+    for l in links:
+        left[l[2]] = left.get(l[2], 0) + 1
+
+    now, running, done = 0.0, {}, {} #running: id -> time it ends
+    while True:
+        count = {}
+        for id in running:
+            count[sizes[id][0]] = count.get(sizes[id][0], 0) + 1
+
+        while len(running) < downloads:
+            id = queue.pop(lambda plugin, queue: True, running.keys(), count)
+            if id is None: break
+            running[id] = now + float(sizes[id][1]) / SPEED
+            count[sizes[id][0]] = count.get(sizes[id][0], 0) + 1
+
+        if not running: break
+
+        id = min(running, key=running.get)
+        now = running.pop(id)
+        package = sizes[id][0]
+        left[package] -= 1
+        if not left[package]:
+            done[package] = now
+
+    return done
+
+
+def main():
+    downloads = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    rnd = Random(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+    links = syntheticQueue(rnd)
+
+    packages = sorted(set([l[2] for l in links]))
+    schedule = dict([(p, (rnd.randint(0, 3), 0)) for p in packages])
+
+    print "%d links in %d packages, %d parallel downloads" % (len(links), len(packages), downloads)
+    print "%-12s %12s %12s" % ("policy", "mean (s)", "last (s)")
+    for name in sorted(policies):
+        if name == DeadlinePolicy.name:
+            policy = DeadlinePolicy(None, lambda p: schedule[p])
+        else:
+            policy = getPolicy(name)
+        done = simulate(policy, links, downloads)
+        print "%-12s %12.1f %12.1f" % (name, sum(done.values()) / len(done), max(done.values()))
+
+
+if __name__ == "__main__":
+    main()
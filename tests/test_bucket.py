@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+from module.network import Bucket as bucket
+from module.network.Bucket import Bucket, BucketChain, FairBucket
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestFairBucket:
+
+    def setUp(self):
+        self.time = bucket.time
+        self.clock = bucket.time = Clock()
+
+    def tearDown(self):
+        bucket.time = self.time
+
+    def transfer(self, flows, seconds, size=16 * 1024):
+        """ bytes each flow moved, every flow sends as fast as its buckets let it """
+        done = dict([(flow, 0) for flow in flows])
+        ready = dict([(flow, self.clock.now) for flow in flows])
+        end = self.clock.now + seconds
+        while True:
+            flow = min(flows, key=ready.get)
+            if ready[flow] >= end: break
+            self.clock.now = ready[flow]
+            ready[flow] = self.clock.now + flow.consumed(size)
+            done[flow] += size
+        return done
+
+    def test_capped_flow(self):
+        fair = FairBucket()
+        fair.setRate(200 * 1024)
+        cap = Bucket()
+        cap.setRate(40 * 1024)
+
+        capped = BucketChain([fair, cap], 1, 0) #first in queue, but its plugin is limited
+        other = BucketChain([fair], 2, 1)
+
+        self.transfer([capped, other], 5) #speeds are measured
+        done = self.transfer([capped, other], 20)
+
+        assert abs(done[capped] / 20.0 - 40 * 1024) < 4 * 1024
+        assert done[capped] + done[other] > 20 * 200 * 1024 * 0.9 #the share of the capped flow is not lost
+        assert done[capped] + done[other] < 20 * 200 * 1024 * 1.05
+
+    def test_weights(self):
+        fair = FairBucket()
+        fair.setRate(300 * 1024)
+        first, second = BucketChain([fair], 1, 0), BucketChain([fair], 2, 1)
+
+        self.transfer([first, second], 5)
+        done = self.transfer([first, second], 20)
+
+        assert abs(float(done[first]) / done[second] - 2) < 0.2 #weights 1 and 1/2
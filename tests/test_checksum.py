@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+import __builtin__
+import hashlib
+import sys
+import zlib
+from BaseHTTPServer import HTTPServer
+from logging import getLogger
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Thread
+
+__builtin__._ = lambda x: x
+
+from module.network.DownloadProcess import ForkServer
+from module.network.RequestFactory import RequestFactory
+from module.plugins.hooks.Checksum import Checksum
+from module.plugins.internal.Hoster import Hoster
+
+from test_download_process import DATA, Handler
+
+DOWNLOAD = {"process_workers": 0, "interface": None, "ipv6": False, "preallocate": False,
+            "checkpoint_interval": 0, "resume_verify": 0, "flow_control": False, "adaptive_chunks": False,
+            "shared_engine": False, "max_connections": 0, "host_connections": "", "account_connections": 0,
+            "limit_speed": False, "max_speed": -1, "plugin_speed": "", "package_speed": 0}
+
+
+class Config(dict):
+    def __init__(self):
+        dict.__init__(self, download=DOWNLOAD, proxy={"proxy": False})
+        self.plugins = {"Checksum": {"activated": True, "check_checksum": True, "inline_checksum": "md5,crc32"},
+                        "TestHoster": {"use_premium": False}}
+
+    def getPlugin(self, plugin, option):
+        return self.plugins[plugin][option]
+
+
+class Core():
+    def __init__(self, forkServer):
+        self.config = Config()
+        self.forkServer = forkServer
+        self.log = getLogger("log")
+        self.debug = False
+        self.files = self
+        self.js = None
+        self.requestFactory = RequestFactory(self)
+
+    def getPackage(self, id):
+        return None
+
+
+class Manager():
+    def addEvent(self, event, func):
+        pass
+
+
+class Package():
+    id = 1
+
+
+class PyFile():
+    def __init__(self, core, url):
+        self.m = self
+        self.core = core
+        self.id = 1
+        self.url = url
+        self.name = "file"
+        self.size = 0
+        self.status = 3
+        self.error = ""
+        self.abort = False
+
+    def package(self):
+        return Package()
+
+    def sync(self):
+        pass
+
+    def getStatusName(self):
+        return "queued"
+
+
+class TestHoster(Hoster):
+    __name__ = "TestHoster"
+    __type__ = "hoster"
+    __pattern__ = r'http://127\.0\.0\.1'
+
+
+class TestChecksum:
+
+    @classmethod
+    def setup_class(cls):
+        cls.server = ForkServer()
+        cls.http = HTTPServer(("127.0.0.1", 0), Handler)
+        thread = Thread(target=cls.http.serve_forever)
+        thread.daemon = True
+        thread.start()
+        cls.url = "http://127.0.0.1:%d/file" % cls.http.server_port
+
+    @classmethod
+    def teardown_class(cls):
+        cls.http.shutdown()
+        cls.server.stop()
+
+    def setUp(self):
+        if not getattr(sys.stdout, "encoding", None):
+            sys.stdout.encoding = "utf-8" #plugins decode with it, nose captures stdout in a StringIO
+        self.dir = mkdtemp()
+        self.core = Core(self.server)
+        self.hook = Checksum(self.core, Manager())
+        self.hook.activate()
+
+    def tearDown(self):
+        rmtree(self.dir)
+
+    def test_inline_digests(self):
+        plugin = TestHoster(PyFile(self.core, self.url))
+        plugin._setup() #replaces the request of the plugin
+
+        plugin.req.httpDownload(self.url, join(self.dir, "file"))
+        assert plugin.req.digests == {"md5": hashlib.md5(DATA).hexdigest(),
+                                      "crc32": "%x" % (zlib.crc32(DATA) & 0xFFFFFFFF)}
+        plugin.req.close()
+
+    def test_disabled(self):
+        self.hook.config_changed("Checksum", "check_checksum", "False", "plugin")
+
+        plugin = TestHoster(PyFile(self.core, self.url))
+        plugin._setup()
+
+        plugin.req.httpDownload(self.url, join(self.dir, "file"))
+        assert plugin.req.digests == {}
+        plugin.req.close()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+from module import CircuitBreaker as breaker
+from module.CircuitBreaker import CircuitBreaker
+
+
+class TestCircuitBreaker:
+
+    def setUp(self):
+        self.time = breaker.time
+        self.now = 1000.0
+        breaker.time = lambda: self.now
+        self.breaker = CircuitBreaker(60, 1800)
+
+    def tearDown(self):
+        breaker.time = self.time
+
+    def test_backoff(self):
+        assert self.breaker.failed("cdn", "hoster") == 60
+        assert self.breaker.getBlocked() == set(["hoster"]) #links of other hosts of the plugin still start
+
+        self.now += 61
+        assert self.breaker.failed("cdn", "hoster") == 120
+        self.now += 121
+        assert self.breaker.getBlocked() == set()
+
+        self.breaker.succeeded("cdn", 1)
+        assert self.breaker.failed("cdn", "hoster") == 60 #errors in a row start again
+
+    def test_probe(self):
+        self.breaker.failed("cdn", "hoster")
+        self.now += 61
+        self.breaker.started(1, "hoster") #the test download
+        assert self.breaker.getBlocked() == set(["hoster"])
+
+        self.breaker.started(2, "other")
+        self.breaker.finished(2) #another download of the plugin ended
+        assert self.breaker.getBlocked() == set(["hoster"])
+
+        self.breaker.finished(1)
+        assert self.breaker.getBlocked() == set()
+
+    def test_probe_other_host(self):
+        self.breaker.failed("cdn", "hoster")
+        self.now += 61
+        self.breaker.started(1, "hoster")
+        self.breaker.succeeded("mirror", 1) #the link does not lead to the failed host anymore
+        assert self.breaker.getBlocked() == set()
+        assert self.breaker.failed("cdn", "hoster") == 60 #no link led to it anymore, so it was forgotten
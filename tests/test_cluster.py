@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import __builtin__
+from logging import getLogger
+from multiprocessing import Event, Process, Queue
+from os import chdir, getcwd, remove
+from os.path import exists
+from shutil import rmtree
+from tempfile import mkdtemp, mktemp
+from time import sleep
+
+from module.database.LeaseStore import LeaseStore
+
+__builtin__._ = lambda x: x
+
+
+def claimAll(path, node, ids, result):
+    store = LeaseStore(path, node)
+    result.put((node, [id for id in ids if store.claim(id)]))
+    store.close()
+
+
+def claimAndDie(path, node, id):
+    store = LeaseStore(path, node, leaseTime=1)
+    store.claim(id) #never renewed
+
+
+class Stub():
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+def startNode(node):
+    """ database, file handler and cluster of one core """
+    from module.Cluster import Cluster
+    from module.database import DatabaseBackend, FileHandler
+
+    core = Stub(config={"cluster": {"activated": True, "store": "shared.db", "node": node, "lease_time": 60},
+                        "general": {"db_readers": 1, "db_flush_interval": 200, "db_durability": "normal"}},
+                log=getLogger("log"), cluster=None,
+                threadManager=Stub(processingIds=lambda: []),
+                pluginManager=Stub(crypterPlugins={}, containerPlugins={}),
+                pullManager=Stub(addEvent=lambda e: None))
+    core.db = DatabaseBackend(core)
+    core.db.setup()
+    core.files = FileHandler(core)
+    core.db.manager = core.files
+    core.cluster = Cluster(core)
+    return core
+
+
+def staleNode(ready, done, result):
+    core = startNode("stale")
+    core.files.jobs.rebuild(()) #loads the queue before the other node runs the link
+    ready.set()
+    done.wait(60)
+    pyfile = core.files.getJob(())
+    result.put(pyfile.id if pyfile else None)
+    core.cluster.shutdown()
+    core.db.shutdown()
+
+
+class TestCluster:
+
+    def setUp(self):
+        self.path = mktemp(".db")
+
+    def tearDown(self):
+        if exists(self.path):
+            remove(self.path)
+
+    def test_claim_once(self):
+        ids = range(1, 201)
+        result = Queue()
+        nodes = [Process(target=claimAll, args=(self.path, "node%d" % i, ids, result)) for i in range(4)]
+        for p in nodes: p.start()
+
+        claimed = [result.get(timeout=60)[1] for p in nodes]
+        for p in nodes: p.join()
+
+        flat = sum(claimed, [])
+        assert sorted(flat) == ids #every link leased exactly once
+
+    def test_expired_lease(self):
+        p = Process(target=claimAndDie, args=(self.path, "crashed", 1))
+        p.start()
+        p.join()
+
+        store = LeaseStore(self.path, "other", leaseTime=1)
+        assert not store.claim(1)
+        assert store.getLeases() == {1: "crashed"}
+
+        sleep(1.2)
+        assert store.expire() == [1]
+        assert store.claim(1)
+        store.close()
+
+    def test_renew_and_release(self):
+        a = LeaseStore(self.path, "a", leaseTime=1)
+        b = LeaseStore(self.path, "b", leaseTime=1)
+        assert a.claim(1)
+        sleep(0.6)
+        assert a.renew([1]) == []
+        sleep(0.6)
+        assert not b.claim(1) #renewed lease is still valid
+
+        a.release(1)
+        assert b.claim(1)
+        assert a.renew([1]) == [1] #lost to b
+        a.close()
+        b.close()
+
+    def test_stale_queue(self):
+        cwd = getcwd()
+        dir = mkdtemp()
+        chdir(dir)
+        try:
+            ready, done, result = Event(), Event(), Queue()
+            stale = Process(target=staleNode, args=(ready, done, result))
+
+            core = startNode("active")
+            pid = core.db.addPackage("package", "", 1)
+            core.db.addLinks([("http://host/file", "BasePlugin")], pid)
+            core.db.syncSave()
+
+            stale.start() #forked before its database thread starts
+            assert ready.wait(60)
+
+            pyfile = core.files.getJob(())
+            assert pyfile is not None
+            pyfile.setStatus("finished")
+            core.files.unclaim(pyfile.id)
+            done.set()
+
+            assert result.get(timeout=60) is None #lease was free, but the link is finished
+            stale.join()
+            assert core.cluster.getLeases() == {}
+
+            core.cluster.shutdown()
+            core.db.shutdown()
+        finally:
+            chdir(cwd)
+            rmtree(dir)
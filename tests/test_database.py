@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+
+from os import chdir, getcwd
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Thread
+from time import sleep, time
+
+try:
+    from pysqlite2 import dbapi2 as sqlite3
+except:
+    import sqlite3
+
+from module.database import DatabaseBackend, style
+
+
+class Core():
+    def __init__(self, readers):
+        self.config = {"cluster": {"activated": False},
+                       "general": {"db_readers": readers, "db_flush_interval": 200, "db_durability": "normal"}}
+
+
+class SlowMethods():
+    @style.read
+    def slowRead(db, seconds):
+        db.c.execute("SELECT COUNT(*) FROM storage")
+        sleep(seconds)
+        return db.c.fetchone()[0]
+
+    @style.read
+    def readStorage(db, key):
+        db.c.execute("SELECT value FROM storage WHERE key=?", (key, ))
+        r = db.c.fetchone()
+        return r[0] if r else None
+
+    @style.async
+    def slowWrite(db, seconds):
+        sleep(seconds)
+
+    @style.read
+    def journalMode(db):
+        db.c.execute("PRAGMA journal_mode")
+        return db.c.fetchone()[0]
+
+
+class TestDatabase:
+
+    def setUp(self):
+        self.cwd = getcwd()
+        self.dir = mkdtemp()
+        chdir(self.dir)
+
+        DatabaseBackend.registerSub(SlowMethods)
+        self.db = DatabaseBackend(Core(2))
+        self.db.setup()
+
+    def tearDown(self):
+        self.db.shutdown()
+        self.db.join()
+        DatabaseBackend.unregisterSub(SlowMethods)
+        chdir(self.cwd)
+        rmtree(self.dir)
+
+    def test_wal(self):
+        assert self.db.journalMode() == "wal"
+
+    def test_read_committed(self):
+        for i in range(50):
+            self.db.setStorage("test", "key%d" % i, str(i)) #the idle writer commits before it returns
+            assert self.db.readStorage("key%d" % i) == str(i)
+
+    def test_read_after_queued_write(self):
+        self.db.slowWrite(0.3)
+        Thread(target=lambda: (sleep(0.1), self.db.slowWrite(0.3))).start() #pending when the write returns
+        self.db.setStorage("test", "key", "value")
+        assert self.db.readStorage("key") == "value"
+
+    def test_read_during_write(self):
+        self.db.slowWrite(1)
+        start = time()
+        self.db.readStorage("key")
+        assert time() - start < 0.5 #not queued behind the writer
+
+    def test_concurrent_reads(self):
+        threads = [Thread(target=self.db.slowRead, args=(0.5,)) for i in range(2)]
+        start = time()
+        for t in threads: t.start()
+        for t in threads: t.join()
+        assert time() - start < 0.9 #both read at the same time
+
+        stats = self.db.getLatencyStats()
+        assert stats["read"]["count"] == 2
+
+    def test_write_behind(self):
+        self.db.setStorage("test", "key", "start")
+        for i in range(100):
+            self.db.buffer(("storage", "key"), "UPDATE storage SET value=? WHERE identifier=? AND key=?", (str(i), "test", "key"))
+        assert len(self.db.dirty) == 1 #coalesced per row
+
+        sleep(0.5) #written and committed with the batch
+        conn = sqlite3.connect("files.db")
+        assert conn.execute("SELECT value FROM storage WHERE key='key'").fetchone()[0] == "99"
+        conn.close()
+
+    def test_read_buffered(self):
+        self.db.setStorage("test", "key", "start")
+        self.db.buffer(("storage", "key"), "UPDATE storage SET value=? WHERE identifier=? AND key=?", ("changed", "test", "key"))
+        assert self.db.readStorage("key") == "start" #reads see the last commit
+        assert self.db.getStorage("test", "key") == "changed" #the writer flushes the buffer first
+
+
+class TestQueryPlans:
+    """ the access paths use their indexes with a large queue """
+
+    @classmethod
+    def setup_class(cls):
+        cls.cwd = getcwd()
+        cls.dir = mkdtemp()
+        chdir(cls.dir)
+
+        cls.db = DatabaseBackend(Core(0))
+        cls.db.setup()
+
+        cls.conn = sqlite3.connect("files.db")
+        cls.conn.executemany("INSERT INTO packages(name, folder, queue, packageorder) VALUES(?,?,?,?)",
+                             ((str(i), str(i), i % 2, i) for i in range(5000)))
+        cls.conn.executemany("INSERT INTO links(url, name, plugin, package, linkorder, status) VALUES(?,?,?,?,?,?)",
+                             (("http://host/%d" % i, str(i), "BasePlugin", i % 5000 + 1, i / 5000, 3 if i % 100 else 0)
+                              for i in range(500000)))
+        cls.conn.executemany("INSERT INTO storage(identifier, key, value) VALUES(?,?,?)",
+                             (("plugin%d" % (i % 50), str(i), "") for i in range(10000)))
+        cls.conn.commit()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.conn.close()
+        cls.db.shutdown()
+        cls.db.join()
+        chdir(cls.cwd)
+        rmtree(cls.dir)
+
+    def plan(self, statement):
+        args = (1, ) * statement.count("?")
+        return " | ".join([r[-1] for r in self.conn.execute("EXPLAIN QUERY PLAN " + statement, args)])
+
+    def test_update_link_info(self):
+        plan = self.plan("UPDATE links SET name=?, size=?, status=? WHERE url=? AND status IN (1,2,3,14)")
+        assert "USING INDEX urlIndex" in plan, plan
+        assert "USING COVERING INDEX urlIndex" in self.plan("SELECT id FROM links WHERE url=?")
+
+    def test_jobs(self):
+        jobs = "SELECT l.id, l.plugin, p.id, p.queue, p.packageorder, l.linkorder, l.size, l.url FROM links as l INNER JOIN packages as p ON l.package=p.id WHERE l.status IN (2,3,14) AND (p.queue=1 OR l.plugin IN (?,?))"
+        plan = self.plan(jobs)
+        assert "SEARCH l USING INDEX statusIndex" in plan, plan
+        plan = self.plan(jobs + " AND l.package=?")
+        assert "SEARCH l USING INDEX orderIndex" in plan, plan
+        plan = self.plan(jobs + " AND l.id IN (?,?)")
+        assert "SEARCH l USING INTEGER PRIMARY KEY" in plan, plan
+
+    def test_package_links(self):
+        plan = self.plan("SELECT id,url,name,size,status,error,plugin,package,linkorder FROM links WHERE package=? ORDER BY linkorder")
+        assert "USING INDEX orderIndex" in plan, plan
+        assert "TEMP B-TREE" not in plan, plan
+
+    def test_duplicates(self):
+        plan = self.plan("SELECT l.plugin FROM links as l INNER JOIN packages as p ON l.package=p.id AND p.folder=? WHERE l.id!=? AND l.status=0 AND l.name=?")
+        assert "USING INDEX nameIndex" in plan, plan
+
+    def test_storage(self):
+        plan = self.plan("SELECT value FROM storage WHERE identifier=? AND key=?")
+        assert "USING INDEX storageIndex (identifier=? AND key=?)" in plan, plan
+        plan = self.plan("SELECT key, value FROM storage WHERE identifier=?")
+        assert "USING INDEX storageIndex" in plan, plan
+
+    def test_package_list(self):
+        plan = self.plan("SELECT p.id, p.name, p.folder, p.site, p.password, p.queue, p.packageorder, s.sizetotal, s.sizedone, s.linksdone, s.linkstotal \
+            FROM packages p JOIN packagestats s ON p.id = s.id WHERE p.queue=? AND s.linkstotal > 0 ORDER BY p.packageorder")
+        assert "SEARCH p USING INDEX queueIndex" in plan, plan
+        assert "links" not in plan and "l " not in plan, plan
+
+    def test_package_stats(self):
+        assert self.db.checkPackageStats() == []
+
+
+class Link():
+    def __init__(self, id, package, size, status):
+        self.id, self.packageid, self.size, self.status = id, package, size, status
+        self.url = self.name = "http://host/%d" % id
+        self.error = ""
+
+
+class TestPackageStats:
+
+    def setUp(self):
+        self.cwd = getcwd()
+        self.dir = mkdtemp()
+        chdir(self.dir)
+
+        self.db = DatabaseBackend(Core(2))
+        self.db.setup()
+
+    def tearDown(self):
+        self.db.shutdown()
+        self.db.join()
+        chdir(self.cwd)
+        rmtree(self.dir)
+
+    def stats(self, pid):
+        p = self.db.getAllPackages(1)[pid]
+        return p["linkstotal"], p["linksdone"], p["sizetotal"], p["sizedone"]
+
+    def test_counters(self):
+        pid = self.db.addPackage("package", "folder", 1)
+        empty = self.db.addPackage("empty", "folder", 1)
+        self.db.addLinks([("http://host/%d" % i, "BasePlugin") for i in range(10)], pid)
+        assert self.stats(pid) == (10, 0, 0, 0)
+        assert empty not in self.db.getAllPackages(1)
+
+        ids = range(1, 11) #new database
+        for i, id in enumerate(ids[:4]):
+            self.db.updateLink(Link(id, pid, 100, 0 if i < 3 else 8))
+        self.db.syncSave() #updates are buffered until the next batch
+        assert self.stats(pid) == (10, 3, 400, 300)
+
+        self.db.deleteFinished()
+        self.db.syncSave()
+        assert self.stats(pid) == (7, 0, 100, 0)
+        assert self.db.checkPackageStats() == []
+
+    def test_rebuild(self):
+        pid = self.db.addPackage("package", "folder", 1)
+        self.db.addLinks([("http://host/%d" % i, "BasePlugin") for i in range(5)], pid)
+        self.db.syncSave()
+
+        conn = sqlite3.connect("files.db")
+        conn.execute("UPDATE packagestats SET linkstotal=1")
+        conn.commit()
+        conn.close()
+
+        assert self.db.checkPackageStats() == [pid]
+        self.db.rebuildPackageStats()
+        assert self.db.checkPackageStats() == []
+        assert self.stats(pid) == (5, 0, 0, 0)
+
+
+class Package():
+    def __init__(self, id, queue):
+        self.id, self.queue = id, queue
+
+
+class TestOrder:
+
+    def setUp(self):
+        self.cwd = getcwd()
+        self.dir = mkdtemp()
+        chdir(self.dir)
+
+        self.db = DatabaseBackend(Core(2))
+        self.db.setup()
+        self.ids = [self.db.addPackage("p%d" % i, "", 1) for i in range(20)]
+        for pid in self.ids:
+            self.db.addLinks([("http://host/%d" % pid, "BasePlugin")], pid) #packages without links are not listed
+
+    def tearDown(self):
+        self.db.shutdown()
+        self.db.join()
+        chdir(self.cwd)
+        rmtree(self.dir)
+
+    def order(self):
+        packs = self.db.getAllPackages(1)
+        return sorted(packs, key=lambda id: packs[id]["order"])
+
+    def move(self, id, position):
+        changed = self.db.reorderPackage(Package(id, 1), position)
+        self.ids.remove(id)
+        self.ids.insert(position if position >= 0 else len(self.ids), id)
+        assert self.order() == self.ids
+        assert self.db.getPackagePosition(id) == self.ids.index(id)
+        return changed
+
+    def test_move_one_row(self):
+        assert self.move(self.ids[15], 3).keys() == [self.ids[3]]
+        assert self.move(self.ids[0], -1).keys() == [self.ids[-1]]
+        assert self.move(self.ids[5], 0).keys() == [self.ids[0]]
+
+    def test_spread_keys(self):
+        spread = False
+        for i in range(30): #always into the same gap
+            changed = self.move(self.ids[-1], 1)
+            spread = spread or len(changed) == len(self.ids)
+        assert spread
+
+
+class Stub():
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class TestJobs:
+    """ the job queue follows the changes of the file handler without loading everything again """
+
+    def setUp(self):
+        import __builtin__
+        __builtin__._ = lambda x: x
+        from module.database import FileHandler
+
+        self.cwd = getcwd()
+        self.dir = mkdtemp()
+        chdir(self.dir)
+
+        core = Stub(config=Core(2).config, cluster=None,
+                    hookManager=Stub(dispatchEvent=lambda *args: None),
+                    pluginManager=Stub(crypterPlugins={}, containerPlugins={},
+                                       parseUrls=lambda urls: [(url, "BasePlugin") for url in urls]),
+                    threadManager=Stub(processingIds=lambda: [], createInfoThread=lambda *args: None,
+                                       wake=lambda reason: None),
+                    pullManager=Stub(addEvent=lambda e: None))
+        core.db = self.db = DatabaseBackend(core)
+        self.db.setup()
+        core.files = self.files = FileHandler(core)
+        self.db.manager = self.files
+        self.files.jobs.rebuild(())
+
+    def tearDown(self):
+        self.db.shutdown()
+        self.db.join()
+        chdir(self.cwd)
+        rmtree(self.dir)
+
+    def jobs(self):
+        assert self.files.jobs.valid
+        return self.files.peekJobs((), 100)
+
+    def test_changes(self):
+        first = self.files.addPackage("first", "", 1)
+        second = self.files.addPackage("second", "", 1)
+        self.files.addLinks(["http://host/%d" % i for i in range(3)], first)
+        self.files.addLinks(["http://host/%d" % i for i in range(3, 6)], second)
+        assert self.jobs() == [1, 2, 3, 4, 5, 6]
+
+        self.files.reorderPackage(second, 0)
+        assert self.jobs() == [4, 5, 6, 1, 2, 3]
+        self.files.reorderFile(2, 0)
+        assert self.jobs() == [4, 5, 6, 2, 1, 3]
+
+        self.files.deleteLink(5)
+        self.files.deletePackage(first)
+        assert self.jobs() == [4, 6]
+
+        self.files.updateFileInfo([("offline", 0, 1, "http://host/3")], second)
+        assert self.jobs() == [6]
+        self.files.restartFile(4)
+        assert self.jobs() == [4, 6]
+
+        self.files.setPackageLocation(second, 0)
+        assert self.jobs() == []
+        self.files.setPackageLocation(second, 1)
+        assert self.jobs() == [4, 6]
+
+        self.files.jobs.invalidate()
+        self.files.jobs.rebuild(())
+        assert self.jobs() == [4, 6]
+
+    def test_blocked_hosts(self):
+        pid = self.files.addPackage("package", "", 1)
+        self.files.addLinks(["http://dead/1", "http://alive/2", "http://dead/3", "http://alive/4"], pid)
+        assert self.files.peekJobs((), 100, blocked=("dead", )) == [2, 4]
+
+        assert self.files.getJob((), {}, ("dead", )).id == 2 #the plugin is not blocked
+        assert self.jobs() == [1, 3, 4]
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import __builtin__
+import os
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from os.path import getsize, join
+from shutil import rmtree
+from signal import SIGKILL
+from tempfile import mkdtemp
+from threading import Thread
+from time import sleep
+
+__builtin__._ = lambda x: x
+
+from module.network.ConnectionSlots import ConnectionSlots
+from module.network.DownloadProcess import ForkServer, ProcessPool, RemoteDownload
+
+DATA = "pyload" * 100000
+
+OPTIONS = {"interface": None, "proxies": {}, "ipv6": False}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(DATA)))
+        self.end_headers()
+        if self.path == "/slow":
+            self.wfile.write(DATA[:1000])
+            self.wfile.flush()
+            sleep(5)
+        self.wfile.write(DATA)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TestDownloadProcess:
+
+    @classmethod
+    def setup_class(cls):
+        cls.server = ForkServer() #before the http thread starts, like in the core
+        cls.http = Server(("127.0.0.1", 0), Handler)
+        thread = Thread(target=cls.http.serve_forever)
+        thread.daemon = True
+        thread.start()
+        cls.url = "http://127.0.0.1:%d" % cls.http.server_port
+
+    @classmethod
+    def teardown_class(cls):
+        cls.http.shutdown()
+        cls.server.stop()
+
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.pool = ProcessPool(1, self.server)
+        self.slots = ConnectionSlots()
+        self.slots.setLimits(1, "", 0)
+
+    def tearDown(self):
+        self.pool.setSize(0)
+        rmtree(self.dir)
+
+    def download(self, path):
+        worker = self.pool.acquire()
+        assert worker is not None
+        options = dict(OPTIONS, slots=self.slots)
+        #the worker keeps the working directory of the fork server
+        return worker, RemoteDownload(self.pool, worker, self.url + path, join(self.dir, "file"), options=options)
+
+    def test_round_trip(self):
+        worker, dl = self.download("/file")
+        assert dl.download() is None #name is only changed by content disposition
+        assert getsize(join(self.dir, "file")) == len(DATA) == dl.size
+        assert self.slots.free(self.slots.getKeys("127.0.0.1")) == 1
+
+        assert self.pool.acquire() is worker #back in the pool
+        self.pool.release(worker)
+        assert self.pool.getStats() == {"workers": 1, "busy": 0}
+
+    def test_dead_worker(self):
+        worker, dl = self.download("/slow")
+        Thread(target=lambda: (sleep(1), os.kill(worker.pid, SIGKILL))).start()
+
+        try:
+            dl.download()
+        except Exception, e:
+            assert "died" in str(e)
+        else:
+            assert False, "download of a killed worker returned"
+
+        assert self.slots.free(self.slots.getKeys("127.0.0.1")) == 1 #the slot of the worker is free again
+        assert self.pool.getStats() == {"workers": 0, "busy": 0}
+
+        replaced = self.pool.acquire() #forked by the server
+        assert replaced is not None and replaced.pid != worker.pid
+        self.pool.release(replaced)